@@ -19,6 +19,12 @@ from . import preferences
 from . import properties
 from . import operators
 from . import ui
+from . import jobs
+from . import api
+from . import lookup
+from . import autoload
+from . import sceneindex
+from . import log
 
 
 # Register all classes
@@ -27,7 +33,13 @@ classes = [
     preferences.GenPBRPreferences,
     operators.PBRAutoLoadTextureOperator,
     operators.PBRSelectFileOperator,
+    operators.PBRCancelGenerationOperator,
+    operators.PBRClearCacheOperator,
+    operators.PBRExportTraceOperator,
     operators.PBRGenerateOperator,
+    operators.PBRBatchGenerateOperator,
+    operators.PBRResumeBatchOperator,
+    operators.PBRDiscardBatchOperator,
     ui.PBRGeneratorPanel
 ]
 
@@ -39,8 +51,28 @@ def register():
     # Register scene properties
     bpy.types.Scene.genpbr_props = bpy.props.PointerProperty(type=properties.GenPBRProperties)
 
+    lookup.register()
+    autoload.register()
+    sceneindex.register()
+    operators.register()
+
+    # Apply the saved log level (property update callbacks do not run on load)
+    addon = bpy.context.preferences.addons.get(preferences.GenPBRPreferences.bl_idname)
+    if addon is not None:
+        log.set_verbosity(addon.preferences.log_level)
+
 
 def unregister():
+    operators.unregister()
+    sceneindex.unregister()
+    autoload.unregister()
+    lookup.unregister()
+
+    # Stop any background generation so its result is never applied
+    jobs.cancel_active_job()
+    jobs.set_active_job(None)
+    api.close_client()
+
     # Unregister scene properties
     del bpy.types.Scene.genpbr_props
 
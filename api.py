@@ -0,0 +1,400 @@
+import datetime
+import email.utils
+import json
+import logging
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from . import upload
+    from . import ratelimit
+    from . import timing
+    from .log import logger
+except ImportError:
+    import upload
+    import ratelimit
+    import timing
+    from log import logger
+
+
+API_BASE_URL = "https://genpbr.com/api/v1"
+GENERATE_TEXTURE_PATH = "/generate-texture"
+
+# Seconds to establish a connection / to wait for the generated maps
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 120
+
+# Matches the maximum number of batch workers so concurrent requests never
+# have to open throwaway connections
+POOL_MAXSIZE = 16
+
+# Read size when downloading the generated maps
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+
+# Rate limiting and transient gateway errors that are worth retrying
+RETRY_STATUSES = (429, 502, 503, 504)
+
+
+class GenerationError(Exception):
+    """
+    Error raised by the generation worker.
+
+    error_type/error_code/detailed_msg are stored in the scene properties for the
+    UI error box. An empty error_type means the error is only reported, not stored.
+    """
+
+    def __init__(self, message, error_type="", error_code=0, detailed_msg=""):
+        super().__init__(message)
+        self.error_type = error_type
+        self.error_code = error_code
+        self.detailed_msg = detailed_msg
+
+
+def _http_error_to_generation_error(response, e):
+    """Translate an HTTP error response into a GenerationError with user-friendly messages."""
+    status_code = response.status_code
+    error_msg = f"API request failed: {e}"
+    error_type = ""
+    detailed_msg = ""
+
+    logger.debug("HTTP Error: %s", e)
+    logger.debug("Response status code: %s", status_code)
+
+    try:
+        error_data = response.json()
+        logger.debug("Full error response: %s", error_data)
+
+        # Extract error message from response
+        if "message" in error_data:
+            detailed_msg = error_data['message']
+            error_msg = f"API error: {detailed_msg}"
+        if "error" in error_data:
+            detailed_msg = error_data.get('message', '')
+            error_msg = f"{error_data.get('error', 'Unknown error')}: {detailed_msg}"
+        if "debug" in error_data:
+            logger.debug("Server debug info: %s", error_data['debug'])
+
+    except Exception as json_error:
+        logger.debug("Failed to parse error JSON: %s", json_error)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Raw response text: %s", response.text[:500])
+        detailed_msg = response.text[:200] if hasattr(response, 'text') else str(e)
+
+    # Handle specific error codes with user-friendly messages
+    if status_code == 401:
+        error_type = "401"
+        error_msg = "Unauthorized: Invalid or missing API key"
+        detailed_msg = "Please check your API key in Add-on Preferences (Edit > Preferences > Add-ons > GenPBR Map Generator)"
+    elif status_code == 400:
+        error_type = "400"
+        error_msg = "Bad Request: Invalid request body or missing required fields"
+        if detailed_msg:
+            error_msg = f"Bad Request: {detailed_msg}"
+    elif status_code == 429:
+        error_type = "429"
+        error_msg = "Rate Limit Exceeded: Too many requests"
+        detailed_msg = "Please wait a moment before retrying. Check your rate limit in Usage Statistics."
+    elif status_code == 402:
+        error_type = "402"
+        error_msg = "Quota Exceeded: Monthly request limit reached"
+        detailed_msg = "Your monthly quota has been exhausted. Please wait for the next billing cycle or visit genpbr.com for account options."
+    else:
+        error_type = str(status_code)
+        if not detailed_msg:
+            detailed_msg = error_msg
+
+    return GenerationError(error_msg, error_type, status_code, detailed_msg)
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with jitter for transient API failures.
+
+    The n-th retry waits a random time between half and all of
+    min(max_delay, base_delay * 2 ** (n - 1)) seconds. A Retry-After header
+    from the server takes precedence. Retrying stops after max_retries retries
+    or when the next wait would exceed max_total_time seconds since the first attempt.
+    """
+
+    def __init__(self, max_retries=3, base_delay=1.0, max_delay=30.0, max_total_time=300.0,
+                 retry_statuses=RETRY_STATUSES):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_total_time = max_total_time
+        self.retry_statuses = frozenset(retry_statuses)
+
+    def delay(self, retry_number, retry_after=None):
+        """Seconds to wait before the given retry (1-based), or None to give up."""
+        if retry_number > self.max_retries:
+            return None
+        if retry_after is not None:
+            # Small jitter so concurrent workers do not retry in lockstep
+            return retry_after + random.uniform(0, 0.1 * self.base_delay)
+        backoff = min(self.max_delay, self.base_delay * 2 ** (retry_number - 1))
+        return random.uniform(backoff / 2, backoff)
+
+
+NO_RETRY = RetryPolicy(max_retries=0)
+
+
+def parse_retry_after(value):
+    """Parse a Retry-After header (delta seconds or HTTP date) into seconds, or None."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at is None:
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, (retry_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
+
+class _RetryableError(Exception):
+    """Internal: a failed attempt that the retry policy may retry."""
+
+    def __init__(self, error, reason, retry_after=None):
+        super().__init__(str(error))
+        self.error = error
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class GenPBRClient:
+    """
+    Client for the GenPBR API.
+
+    Holds a pooled requests.Session so consecutive and concurrent requests reuse
+    keep-alive connections instead of doing a TCP + TLS handshake each time.
+    The session is created lazily on first use and is safe to share between
+    worker threads. Every attempt first takes a slot from rate_limiter, a
+    token bucket kept in sync with the usage the API reports.
+    """
+
+    def __init__(self, base_url=API_BASE_URL, pool_maxsize=POOL_MAXSIZE,
+                 connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.pool_maxsize = pool_maxsize
+        self.timeout = (connect_timeout, read_timeout)
+        self._session = None
+        self._lock = threading.Lock()
+        self.rate_limiter = ratelimit.TokenBucket()
+
+    @property
+    def session(self):
+        with self._lock:
+            if self._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=2, pool_maxsize=self.pool_maxsize)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.headers.update({"Content-Type": "application/json"})
+                self._session = session
+            return self._session
+
+    def close(self):
+        """Close pooled connections. The session is recreated on next use."""
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    def generate_texture(self, api_key, image_source, mime_type, texture_types, options,
+                         retry_policy=None, on_retry=None, sleep=time.sleep, trace=None, on_progress=None):
+        """
+        Call /generate-texture for one base image, retrying transient failures.
+
+        Args:
+            api_key: GenPBR API key
+            image_source: File path or bytes of the image to upload
+            mime_type: MIME type of the image
+            texture_types: List of texture types to generate
+            options: API options dict
+            retry_policy: RetryPolicy to apply (default: no retries)
+            on_retry: Optional callable(retry_number, delay, reason) called before each
+                retry; it may raise to abort (e.g. on cancellation)
+            sleep: Callable used to wait between attempts
+            trace: Optional timing.RunTrace receiving rate-limit, upload, server-wait,
+                download and parse spans plus byte and retry counters
+            on_progress: Optional callable(phase, done_bytes, total_bytes) with phase
+                'upload' or 'download'; total_bytes is 0 when unknown
+
+        Returns:
+            dict: Parsed JSON response of a successful request
+
+        Raises:
+            GenerationError: On HTTP, network or API errors once retries are exhausted
+        """
+        policy = retry_policy or NO_RETRY
+        trace = trace or timing.NULL_TRACE
+        start = time.monotonic()
+        retries = 0
+
+        while True:
+            try:
+                with trace.stage("rate limit wait"):
+                    self.rate_limiter.acquire(sleep)
+            except ratelimit.QuotaExhausted:
+                raise GenerationError(
+                    "Quota Exceeded: Monthly request limit reached", "402", 0,
+                    "Your monthly quota has been exhausted. Please wait for the next billing cycle or visit genpbr.com for account options."
+                )
+
+            try:
+                data = self._post_generate(api_key, image_source, mime_type, texture_types, options, policy,
+                                           trace, on_progress, attempt=retries + 1)
+                self.rate_limiter.update_from_usage(data.get("usage"))
+                return data
+            except _RetryableError as failure:
+                # Only successful responses count against the quota
+                self.rate_limiter.refund()
+                retries += 1
+                trace.count("retries")
+                delay = policy.delay(retries, failure.retry_after)
+                elapsed = time.monotonic() - start
+                if delay is None or elapsed + delay > policy.max_total_time:
+                    if retries > 1:
+                        logger.warning("Giving up after %d retries (%.1fs)", retries - 1, elapsed)
+                    raise failure.error
+
+                if failure.reason == "HTTP 429":
+                    # Hold back every other worker too, not only this request
+                    self.rate_limiter.penalize(delay)
+
+                logger.info("%s: retry %d/%d in %.1fs", failure.reason, retries, policy.max_retries, delay)
+                if on_retry is not None:
+                    on_retry(retries, delay, failure.reason)
+                with trace.stage("retry backoff", reason=failure.reason):
+                    sleep(delay)
+            except Exception:
+                self.rate_limiter.refund()
+                raise
+
+    def _post_generate(self, api_key, image_source, mime_type, texture_types, options, policy,
+                       trace, on_progress, attempt):
+        """Single /generate-texture attempt. Raises _RetryableError for failures the policy retries."""
+        url = self.base_url + GENERATE_TEXTURE_PATH
+
+        # Try lowercase header name first (some servers are case-sensitive)
+        headers = {"x-api-key": api_key.strip()}
+
+        # The key itself is never logged
+        logger.debug("URL: %s", url)
+        logger.debug("Texture types: %s", texture_types)
+
+        # The image is base64-encoded incrementally while the body is being sent.
+        # A body can only be sent once, so every attempt builds a new one.
+        def upload_progress(sent, total):
+            on_progress("upload", sent, total)
+
+        body = upload.StreamingJSONBody(image_source, mime_type, {
+            "textureTypes": texture_types,
+            "options": options
+        }, trace=trace, on_progress=upload_progress if on_progress is not None else None)
+        logger.debug("Request body length: %d bytes", len(body))
+
+        try:
+            logger.debug("Sending API request...")
+            # stream=True returns once the headers are in, which separates the
+            # server's processing time from the download of the maps
+            t_send = time.perf_counter()
+            response = self.session.post(url, data=body, headers=headers, timeout=self.timeout, stream=True)
+            t_headers = time.perf_counter()
+            t_uploaded = body.completed_at or t_headers
+            trace.add_span("upload", t_send, t_uploaded, bytes=body.sent, attempt=attempt)
+            trace.add_span("server wait", t_uploaded, t_headers, status=response.status_code, attempt=attempt)
+            trace.count("bytes_uploaded", body.sent)
+
+            logger.debug("Response status: %s", response.status_code)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Response headers: %s", dict(response.headers))
+
+            response.raise_for_status()
+
+        except requests.exceptions.HTTPError as e:
+            error = _http_error_to_generation_error(response, e)
+            if response.status_code in policy.retry_statuses:
+                raise _RetryableError(error, f"HTTP {response.status_code}",
+                                      parse_retry_after(response.headers.get("Retry-After")))
+            raise error
+        except requests.exceptions.RequestException as e:
+            logger.warning("Request exception: %s", e)
+            error = GenerationError(f"API request failed: {e}", "Network", 0, f"Network error: {str(e)}")
+            # Connection resets and connect timeouts never reached the server;
+            # read timeouts are not retried because the server may still be generating
+            if isinstance(e, requests.exceptions.ConnectionError):
+                raise _RetryableError(error, "Connection error")
+            raise error
+
+        # Download the body in chunks so progress can be reported
+        try:
+            total = int(response.headers.get("Content-Length") or 0)
+            chunks = []
+            received = 0
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                chunks.append(chunk)
+                received += len(chunk)
+                if on_progress is not None:
+                    on_progress("download", received, total)
+            content = b"".join(chunks)
+            del chunks
+        except requests.exceptions.RequestException as e:
+            logger.warning("Download failed: %s", e)
+            raise GenerationError(f"API request failed: {e}", "Network", 0, f"Network error: {str(e)}")
+        finally:
+            response.close()
+        trace.add_span("download", t_headers, time.perf_counter(), bytes=len(content), attempt=attempt)
+        trace.count("bytes_downloaded", len(content))
+
+        # Parse response
+        try:
+            with trace.stage("parse response"):
+                data = json.loads(content)
+            logger.debug("Response keys: %s", list(data))
+        except Exception as e:
+            logger.error("Failed to parse response: %s", e)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Response text: %s", content[:500])
+            raise GenerationError(f"Failed to parse API response: {e}")
+
+        if not data.get("success", False):
+            error_msg = data.get("message", "Unknown error")
+            logger.error("API returned error: %s", error_msg)
+            logger.debug("Full response data: %s", data)
+            raise GenerationError(f"API returned error: {error_msg}", "API Error", 0, error_msg)
+
+        return data
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return the shared GenPBRClient, creating it on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = GenPBRClient()
+        return _client
+
+
+def close_client():
+    """Close the shared client's connections (called from unregister())."""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
@@ -0,0 +1,130 @@
+"""
+Auto-detection of the base texture of the active object's material.
+
+Changes of the active object and depsgraph updates schedule a detection on a
+debounced timer, so bursts of events (dragging, playback, typing in a node)
+lead to one lookup after they settle, and the panel's draw() only reads the
+result. Objects whose material has no texture are remembered together with
+the lookup version of the material (see lookup.lookup_version) and are only
+searched again once the material, a node tree or an image changed.
+"""
+import os
+import time
+
+import bpy
+from bpy.app.handlers import persistent
+
+try:
+    from . import lookup
+    from .log import logger
+except ImportError:
+    import lookup
+    from log import logger
+
+
+# Quiet time after the last event before the detection runs, in seconds
+DEBOUNCE_SECONDS = 0.2
+
+# (object pointer, material pointer) -> lookup version of a search that found nothing
+_not_found = {}
+_last_event = 0.0
+# Owner of the message bus subscription
+_msgbus_owner = object()
+
+
+def schedule(*args):
+    """Request a detection once events have been quiet for DEBOUNCE_SECONDS."""
+    global _last_event
+    _last_event = time.monotonic()
+    if not bpy.app.timers.is_registered(_run):
+        bpy.app.timers.register(_run, first_interval=DEBOUNCE_SECONDS)
+
+
+def _run():
+    remaining = _last_event + DEBOUNCE_SECONDS - time.monotonic()
+    if remaining > 0:
+        # More events arrived since the timer was registered
+        return remaining
+    try:
+        detect(bpy.context)
+    except Exception:
+        logger.exception("Texture auto-detection failed")
+    return None
+
+
+def detect(context):
+    """
+    Fill in the base texture from the active object's material if none is set.
+
+    The texture is looked up when the detection runs, not when it was
+    scheduled, so a result is never applied to a selection that changed in
+    the meantime, and a path the user set is never overwritten.
+    """
+    scene = context.scene
+    view_layer = context.view_layer
+    props = getattr(scene, "genpbr_props", None) if scene is not None else None
+    if props is None or props.base_texture_path or view_layer is None:
+        return
+
+    obj = view_layer.objects.active
+    mat = obj.active_material if obj is not None else None
+    if mat is None:
+        return
+
+    key = (obj.as_pointer(), mat.as_pointer())
+    version = lookup.lookup_version(mat)
+    if _not_found.get(key) == version:
+        return
+
+    texture_path = lookup.get_base_texture(obj)
+    if texture_path and os.path.isfile(texture_path):
+        _not_found.pop(key, None)
+        props.base_texture_path = texture_path
+        logger.debug("Auto-detected base texture %s for %s", texture_path, obj.name)
+    else:
+        _not_found[key] = version
+
+
+@persistent
+def _on_depsgraph_update(scene, depsgraph):
+    schedule()
+
+
+def _subscribe():
+    bpy.msgbus.clear_by_owner(_msgbus_owner)
+    bpy.msgbus.subscribe_rna(
+        key=(bpy.types.LayerObjects, "active"),
+        owner=_msgbus_owner,
+        args=(),
+        notify=schedule,
+        options={'PERSISTENT'},
+    )
+
+
+@persistent
+def _on_load_post(*args):
+    # Pointers are reused by the newly loaded file
+    _not_found.clear()
+    # Loading a file drops message bus subscriptions, PERSISTENT or not
+    _subscribe()
+    schedule()
+
+
+def register():
+    _subscribe()
+    if _on_depsgraph_update not in bpy.app.handlers.depsgraph_update_post:
+        bpy.app.handlers.depsgraph_update_post.append(_on_depsgraph_update)
+    if _on_load_post not in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.append(_on_load_post)
+    schedule()
+
+
+def unregister():
+    bpy.msgbus.clear_by_owner(_msgbus_owner)
+    if _on_depsgraph_update in bpy.app.handlers.depsgraph_update_post:
+        bpy.app.handlers.depsgraph_update_post.remove(_on_depsgraph_update)
+    if _on_load_post in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.remove(_on_load_post)
+    if bpy.app.timers.is_registered(_run):
+        bpy.app.timers.unregister(_run)
+    _not_found.clear()
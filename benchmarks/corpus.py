@@ -0,0 +1,84 @@
+"""
+Synthetic benchmark inputs.
+
+make_png() needs only the standard library, so the mock server can use it
+outside Blender. build_corpus() writes PNG/JPEG/TIFF base textures through
+Blender's image writer and must run inside Blender (`blender -b`).
+"""
+import os
+import random
+import struct
+import zlib
+
+SIZES = (1024, 2048, 4096, 8192)
+FORMATS = ("png", "jpeg", "tiff")
+
+_BLENDER_FORMATS = {"png": 'PNG', "jpeg": 'JPEG', "tiff": 'TIFF'}
+_EXTENSIONS = {"png": ".png", "jpeg": ".jpg", "tiff": ".tif"}
+
+
+def make_png(size):
+    """Encode a noisy RGB test image as PNG without needing PIL."""
+    rng = random.Random(size)
+    noise = bytes(rng.getrandbits(8) for _ in range(size * 3))
+    raw = b"".join(b"\x00" + noise[y % 97:] + noise[:y % 97] for y in range(size))
+
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+    header = struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw, 6)) + chunk(b"IEND", b"")
+
+
+def corpus_path(directory, size, fmt):
+    return os.path.join(directory, f"base_{size}{_EXTENSIONS[fmt]}")
+
+
+def _texture_pixels(size):
+    """Gradient with per-pixel noise: compresses like a photo-based texture, not like a flat color."""
+    import numpy as np
+
+    rng = np.random.default_rng(size)
+    ramp = np.linspace(0.0, 1.0, size, dtype=np.float32)
+    pixels = np.empty((size, size, 4), dtype=np.float32)
+    pixels[..., 0] = ramp[None, :]
+    pixels[..., 1] = ramp[:, None]
+    pixels[..., 2] = 0.5
+    pixels[..., :3] += rng.normal(0.0, 0.08, (size, size, 3)).astype(np.float32)
+    np.clip(pixels, 0.0, 1.0, out=pixels)
+    pixels[..., 3] = 1.0
+    return pixels
+
+
+def build_corpus(directory, sizes=SIZES, formats=FORMATS):
+    """
+    Write the base textures that do not exist yet.
+
+    Files are reused between runs, so results stay comparable and only the
+    first run pays for generating them.
+
+    Returns:
+        dict: (size, format) -> file path
+    """
+    import bpy
+
+    os.makedirs(directory, exist_ok=True)
+    paths = {}
+    for size in sizes:
+        pixels = None
+        for fmt in formats:
+            path = corpus_path(directory, size, fmt)
+            paths[(size, fmt)] = path
+            if os.path.isfile(path):
+                continue
+            if pixels is None:
+                pixels = _texture_pixels(size).ravel()
+            img = bpy.data.images.new(f"corpus_{size}_{fmt}", size, size)
+            try:
+                img.pixels.foreach_set(pixels)
+                img.filepath_raw = path
+                img.file_format = _BLENDER_FORMATS[fmt]
+                img.save()
+            finally:
+                bpy.data.images.remove(img)
+    return paths
@@ -0,0 +1,44 @@
+"""
+Compare the two compression fallbacks used when PIL is not installed:
+
+  file:   Image.scale(), save a PNG to a temp file and read it back
+  numpy:  pixels.foreach_get() into NumPy, area downsample, PNG encoded in memory
+
+Run headless from the add-on's parent directory:
+
+    blender -b --factory-startup --python genpbr_blender_addon/benchmarks/fallback_benchmark.py
+"""
+import importlib
+import os
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ADDON_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(ADDON_DIR))
+utils = importlib.import_module(os.path.basename(ADDON_DIR) + ".utils")
+
+import corpus  # noqa: E402
+
+SIZES = (2048, 4096, 8192)
+FORMATS = ("png", "jpeg")
+REPEATS = 3
+
+
+def main():
+    paths = corpus.build_corpus(os.path.join(tempfile.gettempdir(), "genpbr_bench_corpus"), SIZES, FORMATS)
+    for (size, fmt), path in sorted(paths.items()):
+        for label, fn in (("file", utils._compress_with_blender_file),
+                          ("numpy", utils._compress_with_blender_numpy)):
+            timings = []
+            for _ in range(REPEATS):
+                start = time.perf_counter()
+                data = fn(path)
+                timings.append(time.perf_counter() - start)
+            print(f"{size}x{size} {fmt:5s} {label:6s} -> {len(data) / 1024 / 1024:6.1f}MB  "
+                  f"best {min(timings) * 1000:8.1f}ms  mean {sum(timings) / len(timings) * 1000:8.1f}ms")
+
+
+main()
@@ -0,0 +1,61 @@
+"""
+Compare the two ways generated maps can be ingested into Blender:
+
+  file:   write PNG bytes to a temp file, bpy.data.images.load(), pack()
+  memory: images.load_packed_image_from_bytes() (pack the bytes directly)
+
+Run headless from the add-on's parent directory:
+
+    blender -b --factory-startup --python genpbr_blender_addon/benchmarks/ingest_benchmark.py
+"""
+import importlib
+import os
+import sys
+import tempfile
+import time
+
+import bpy
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ADDON_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(ADDON_DIR))
+images = importlib.import_module(os.path.basename(ADDON_DIR) + ".images")
+
+from corpus import make_png  # noqa: E402
+
+SIZES = (2048, 4096)
+REPEATS = 3
+
+
+def ingest_via_file(data):
+    fd, path = tempfile.mkstemp(suffix=".png")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    img = images.load_packed_image_from_file("bench", path)
+    _ = img.size[0]
+    os.remove(path)
+    return img
+
+
+def ingest_via_memory(data):
+    img = images.load_packed_image_from_bytes("bench", data)
+    _ = img.size[0]
+    return img
+
+
+def main():
+    for size in SIZES:
+        data = make_png(size)
+        for label, fn in (("file", ingest_via_file), ("memory", ingest_via_memory)):
+            timings = []
+            for _ in range(REPEATS):
+                start = time.perf_counter()
+                img = fn(data)
+                timings.append(time.perf_counter() - start)
+                bpy.data.images.remove(img)
+            print(f"{size}x{size} {label:6s} {len(data) / 1024 / 1024:6.1f}MB  "
+                  f"best {min(timings) * 1000:8.1f}ms  mean {sum(timings) / len(timings) * 1000:8.1f}ms")
+
+
+main()
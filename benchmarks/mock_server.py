@@ -0,0 +1,158 @@
+"""
+Local stand-in for the GenPBR /api/v1/generate-texture endpoint.
+
+Accepts the same JSON request as the real API, waits a configurable time to
+simulate server processing and answers with synthetic PNG maps as base64 data
+URLs plus a usage block. Only needs the standard library.
+
+Standalone, e.g. to point a development build of the add-on at it:
+
+    python benchmarks/mock_server.py --port 8765 --latency 2.0
+"""
+import argparse
+import base64
+import http.server
+import json
+import threading
+import time
+
+try:
+    from . import corpus
+except ImportError:
+    import corpus
+
+GENERATE_TEXTURE_PATH = "/api/v1/generate-texture"
+
+
+class MockGenPBRServer:
+    """
+    Threaded mock API server; use as a context manager.
+
+    Args:
+        latency: Seconds the server "processes" each request before answering
+        map_size: Edge length of the returned maps in pixels
+        port: TCP port (0 picks a free one)
+    """
+
+    def __init__(self, latency=0.0, map_size=2048, port=0):
+        self.latency = latency
+        self.map_size = map_size
+        self.requests = 0
+        self.bytes_received = 0
+        self._maps = {}
+        self._lock = threading.Lock()
+        self._httpd = http.server.ThreadingHTTPServer(("127.0.0.1", port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        """Base URL to pass to api.GenPBRClient(base_url=...)."""
+        return f"http://127.0.0.1:{self._httpd.server_port}/api/v1"
+
+    def map_data_url(self, size):
+        """Base64 PNG data URL of a synthetic map, encoded once per size."""
+        with self._lock:
+            if size not in self._maps:
+                png = corpus.make_png(size)
+                self._maps[size] = "data:image/png;base64," + base64.b64encode(png).decode("ascii")
+            return self._maps[size]
+
+    def serve_forever(self):
+        """Serve on the calling thread until interrupted."""
+        try:
+            self._httpd.serve_forever()
+        finally:
+            self._httpd.server_close()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="GenPBR-mock", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _respond(self, body):
+        request = json.loads(body)
+        texture_types = request.get("textureTypes") or ["normal", "roughness", "metallic", "ao"]
+        if not str(request.get("baseImage", "")).startswith("data:"):
+            return 400, {"success": False, "error": "Bad Request", "message": "baseImage must be a data URL"}
+
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+        data_url = self.map_data_url(self.map_size)
+        with self._lock:
+            self.requests += 1
+            self.bytes_received += len(body)
+        return 200, {
+            "success": True,
+            "textures": {tex_type: data_url for tex_type in texture_types},
+            "usage": {
+                "tier": "benchmark",
+                "monthlyQuota": 0,
+                "remainingQuota": 0,
+                "rateLimit": 0,
+            },
+            "metadata": {"isFreeRegeneration": False},
+        }
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                if self.path.rstrip("/") != GENERATE_TEXTURE_PATH:
+                    self._send(404, {"success": False, "error": "Not Found", "message": self.path})
+                    return
+                if not self.headers.get("x-api-key"):
+                    self._send(401, {"success": False, "error": "Unauthorized", "message": "Missing API key"})
+                    return
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                try:
+                    status, payload = server._respond(body)
+                except ValueError as e:
+                    status, payload = 400, {"success": False, "error": "Bad Request", "message": str(e)}
+                self._send(status, payload)
+
+            def _send(self, status, payload):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated processing time in seconds")
+    parser.add_argument("--map-size", type=int, default=2048, help="edge length of the returned maps")
+    args = parser.parse_args()
+
+    server = MockGenPBRServer(latency=args.latency, map_size=args.map_size, port=args.port)
+    print(f"Mock GenPBR API listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""
+Offline benchmark of the image-prep and result-ingestion pipeline.
+
+For every base texture in a synthetic corpus (PNG/JPEG/TIFF at 1K-8K) this
+times, against a local mock of the GenPBR API:
+
+  compress   utils.encode_jpeg_to_budget() on the downscaled image (5MB budget)
+  prepare    utils.prepare_upload_source() (what a real generation uploads)
+  payload    building and draining the streaming JSON request body
+  generate   generation.generate_maps_worker(): upload, server wait, download, decode
+  material   materials.build_pbr_material() with the returned maps
+
+and writes the results as JSON. Pass an earlier result file with --compare to
+flag stages that got slower.
+
+Run headless from the add-on's parent directory:
+
+    blender -b --factory-startup --python genpbr_blender_addon/benchmarks/pipeline_benchmark.py -- \\
+        --output bench.json [--compare baseline.json] [--sizes 1024 2048] [--formats png jpeg]
+"""
+import argparse
+import datetime
+import importlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import bpy
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ADDON_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(ADDON_DIR))
+
+import corpus  # noqa: E402
+from mock_server import MockGenPBRServer  # noqa: E402
+
+_package = os.path.basename(ADDON_DIR)
+api = importlib.import_module(_package + ".api")
+generation = importlib.import_module(_package + ".generation")
+jobs = importlib.import_module(_package + ".jobs")
+materials = importlib.import_module(_package + ".materials")
+timing = importlib.import_module(_package + ".timing")
+upload = importlib.import_module(_package + ".upload")
+utils = importlib.import_module(_package + ".utils")
+
+# Bump when the layout of the result file changes
+SCHEMA_VERSION = 1
+
+TEXTURE_TYPES = ["normal", "roughness", "metallic", "ao"]
+# The API answers with maps at the resolution of the upload, which is capped by compression
+MAX_MAP_SIZE = 2048
+# Stage breakdown of the 'generate' stage taken from its timing.RunTrace
+GENERATE_SUBSTAGES = ("read/compress", "base64 encode", "upload", "server wait", "download", "parse response", "decode")
+
+
+def parse_args():
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    parser = argparse.ArgumentParser(prog="pipeline_benchmark.py")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(corpus.SIZES))
+    parser.add_argument("--formats", nargs="+", choices=corpus.FORMATS, default=list(corpus.FORMATS))
+    parser.add_argument("--repeats", type=int, default=3, help="timed runs per stage (best and mean are reported)")
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated server processing time in seconds")
+    parser.add_argument("--corpus-dir", default=os.path.join(tempfile.gettempdir(), "genpbr_bench_corpus"),
+                        help="where the generated base textures are kept between runs")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--output", help="write results to this JSON file (default: stdout)")
+    parser.add_argument("--compare", help="earlier result file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15,
+                        help="relative slowdown of a stage's best time reported as a regression")
+    return parser.parse_args(argv)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ADDON_DIR,
+                              capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _max_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _clear_blender_data():
+    for mat in list(bpy.data.materials):
+        bpy.data.materials.remove(mat)
+    for img in list(bpy.data.images):
+        bpy.data.images.remove(img)
+
+
+def _drain(body):
+    """Consume a request body the way requests sends it; returns the byte count."""
+    return sum(len(chunk) for chunk in body)
+
+
+class Case:
+    """One base texture and the stage callables run on it."""
+
+    def __init__(self, path, size, fmt, client):
+        self.path = path
+        self.size = size
+        self.fmt = fmt
+        self.client = client
+        self.source = None
+        self.mime_type = None
+        self.result = None
+        self.trace = None
+
+    def compress(self):
+        if not utils.HAS_PIL:
+            return len(utils._compress_with_blender_numpy(self.path))
+        data, _quality = utils.encode_jpeg_to_budget(utils.load_rgb_image(self.path), utils.DEFAULT_UPLOAD_BUDGET)
+        return len(data)
+
+    def prepare(self):
+        self.source, self.mime_type = utils.prepare_upload_source(self.path)
+        return upload.source_size(self.source)
+
+    def payload(self):
+        body = upload.StreamingJSONBody(self.source, self.mime_type,
+                                        {"textureTypes": TEXTURE_TYPES, "options": {}})
+        return _drain(body)
+
+    def generate(self):
+        self.trace = timing.RunTrace(f"{self.size}/{self.fmt}")
+        job = jobs.GenerationJob(generation.generate_maps_worker, "benchmark", self.path, TEXTURE_TYPES, {},
+                                 retry_policy=api.NO_RETRY, trace=self.trace, client=self.client)
+        job.run()
+        if job.error is not None:
+            raise job.error
+        self.trace.finish()
+        self.result = job.result
+        return sum(len(data) for data in self.result["maps"].values())
+
+    def material(self):
+        mat = bpy.data.materials.new("Benchmark")
+        warnings = materials.build_pbr_material(mat, self.path, self.result["maps"])
+        if warnings:
+            raise RuntimeError("; ".join(warnings))
+        _clear_blender_data()
+        return sum(len(data) for data in self.result["maps"].values())
+
+
+STAGES = ("compress", "prepare", "payload", "generate", "material")
+
+
+def time_stage(fn, repeats):
+    timings = []
+    amount = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        amount = fn()
+        timings.append(time.perf_counter() - start)
+    return {
+        "best_ms": round(min(timings) * 1000, 2),
+        "mean_ms": round(sum(timings) / len(timings) * 1000, 2),
+        "bytes": amount,
+    }
+
+
+def peak_python_memory(fn):
+    """Peak Python heap allocation of one call in MB (C-level buffers of PIL and Blender are not seen)."""
+    tracemalloc.start()
+    try:
+        fn()
+        return round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 2)
+    finally:
+        tracemalloc.stop()
+
+
+def run_case(case, args):
+    stages = {}
+    for name in STAGES:
+        fn = getattr(case, name)
+        stages[name] = time_stage(fn, args.repeats)
+        if not args.no_memory:
+            stages[name]["py_peak_mb"] = peak_python_memory(fn)
+        if name == "generate":
+            totals = case.trace.stage_totals()
+            stages[name]["breakdown_ms"] = {stage: round(totals[stage] * 1000, 2)
+                                             for stage in GENERATE_SUBSTAGES if stage in totals}
+    return {
+        "case": f"{case.size}/{case.fmt}",
+        "size": case.size,
+        "format": case.fmt,
+        "source_bytes": os.path.getsize(case.path),
+        "stages": stages,
+    }
+
+
+def compare(results, baseline, threshold):
+    """Print per-stage ratios against a baseline (to stderr); returns the list of regressions."""
+    base_cases = {case["case"]: case for case in baseline.get("results", [])}
+    regressions = []
+    print(f"\nCompared with {baseline.get('environment', {}).get('commit') or 'baseline'}:", file=sys.stderr)
+    for case in results:
+        base = base_cases.get(case["case"])
+        if base is None:
+            continue
+        for stage, entry in case["stages"].items():
+            before = base["stages"].get(stage, {}).get("best_ms")
+            if not before:
+                continue
+            ratio = entry["best_ms"] / before
+            flag = ""
+            if ratio > 1 + threshold:
+                flag = "  REGRESSION"
+                regressions.append((case["case"], stage, ratio))
+            elif ratio < 1 - threshold:
+                flag = "  faster"
+            print(f"  {case['case']:12s} {stage:9s} {before:10.1f}ms -> {entry['best_ms']:10.1f}ms  x{ratio:5.2f}{flag}",
+                  file=sys.stderr)
+    return regressions
+
+
+def main():
+    args = parse_args()
+    _clear_blender_data()
+
+    paths = corpus.build_corpus(args.corpus_dir, args.sizes, args.formats)
+    results = []
+    with MockGenPBRServer(latency=args.latency) as server:
+        client = api.GenPBRClient(base_url=server.url)
+        try:
+            for size in args.sizes:
+                server.map_size = min(size, MAX_MAP_SIZE)
+                for fmt in args.formats:
+                    case = Case(paths[(size, fmt)], size, fmt, client)
+                    results.append(run_case(case, args))
+                    print(f"{case.size}/{case.fmt}: " + ", ".join(
+                        f"{name} {entry['best_ms']:.1f}ms" for name, entry in results[-1]["stages"].items()),
+                        file=sys.stderr)
+        finally:
+            client.close()
+
+    report = {
+        "schema": SCHEMA_VERSION,
+        "environment": {
+            "commit": _git_commit(),
+            "date": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "blender": bpy.app.version_string,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "pil": utils.HAS_PIL,
+            "max_rss_mb": _max_rss_mb(),
+        },
+        "settings": {
+            "sizes": args.sizes,
+            "formats": args.formats,
+            "repeats": args.repeats,
+            "latency": args.latency,
+        },
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} stage(s) slower than the baseline by more than {args.threshold:.0%}",
+                  file=sys.stderr)
+            sys.exit(1)
+
+
+main()
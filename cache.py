@@ -0,0 +1,184 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+try:
+    from .log import logger
+except ImportError:
+    from log import logger
+
+
+MANIFEST_NAME = "manifest.json"
+
+
+def make_cache_key(image_hash, texture_types, options):
+    """
+    Build a content-addressed cache key.
+
+    Args:
+        image_hash: SHA-256 hex digest of the image bytes exactly as uploaded
+        texture_types: List of requested texture types
+        options: API options dict
+
+    Returns:
+        str: Hex digest identifying the image content and generation options
+    """
+    canonical = json.dumps(
+        {"image": image_hash, "textureTypes": sorted(texture_types), "options": options},
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class MapCache:
+    """
+    Persistent on-disk cache of generated maps with a size cap and LRU eviction.
+
+    Each entry is a directory <root>/<key[:2]>/<key>/ holding one PNG per texture
+    type and a manifest. The manifest's mtime is the entry's last-use time.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def _entry_dir(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key, texture_types):
+        """
+        Look up the maps for a key.
+
+        Returns:
+            dict: texture type -> file path, or None if any requested type is missing
+        """
+        entry_dir = self._entry_dir(key)
+        manifest_path = os.path.join(entry_dir, MANIFEST_NAME)
+        with self._lock:
+            if not os.path.isfile(manifest_path):
+                return None
+            paths = {}
+            for tex_type in texture_types:
+                path = os.path.join(entry_dir, f"{tex_type}.png")
+                if not os.path.isfile(path):
+                    return None
+                paths[tex_type] = path
+            # Mark as recently used
+            os.utime(manifest_path, None)
+        return paths
+
+    def put(self, key, maps):
+        """
+        Store decoded maps under a key and evict old entries if over the size cap.
+
+        Args:
+            key: Cache key from make_cache_key
+            maps: Dict of texture type -> PNG bytes
+
+        Returns:
+            dict: texture type -> cached file path
+        """
+        entry_dir = self._entry_dir(key)
+        with self._lock:
+            os.makedirs(entry_dir, exist_ok=True)
+            paths = {}
+            for tex_type, image_bytes in maps.items():
+                path = os.path.join(entry_dir, f"{tex_type}.png")
+                tmp_path = f"{path}.{threading.get_ident()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(image_bytes)
+                os.replace(tmp_path, path)
+                paths[tex_type] = path
+
+            # The manifest is written last so partially written entries are never hit
+            with open(os.path.join(entry_dir, MANIFEST_NAME), "w") as f:
+                json.dump({"created": time.time(), "types": sorted(maps)}, f)
+
+            self._evict_locked(keep=key)
+        return paths
+
+    def _entries(self):
+        """Yield (key, entry_dir, last_used, size_bytes) for every complete entry."""
+        if not os.path.isdir(self.directory):
+            return
+        for prefix in os.listdir(self.directory):
+            prefix_dir = os.path.join(self.directory, prefix)
+            if len(prefix) != 2 or not os.path.isdir(prefix_dir):
+                continue
+            for key in os.listdir(prefix_dir):
+                if not key.startswith(prefix):
+                    continue
+                entry_dir = os.path.join(prefix_dir, key)
+                manifest_path = os.path.join(entry_dir, MANIFEST_NAME)
+                try:
+                    last_used = os.path.getmtime(manifest_path)
+                    size = sum(
+                        os.path.getsize(os.path.join(entry_dir, name))
+                        for name in os.listdir(entry_dir)
+                    )
+                except OSError:
+                    continue
+                yield key, entry_dir, last_used, size
+
+    def _evict_locked(self, keep=None):
+        if self.max_bytes <= 0:
+            return
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total = sum(entry[3] for entry in entries)
+        for key, entry_dir, _last_used, size in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
+            logger.debug("Cache evicted %s (%.2fMB)", key[:12], size / 1024 / 1024)
+
+    def size_bytes(self):
+        with self._lock:
+            return sum(entry[3] for entry in self._entries())
+
+    def clear(self):
+        """
+        Delete every entry. Only entry directories are removed, and prefix
+        directories once they are empty; anything else in the directory (the
+        job queue, files of the user) is kept.
+        """
+        with self._lock:
+            prefix_dirs = set()
+            for _key, entry_dir, _last_used, _size in list(self._entries()):
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                prefix_dirs.add(os.path.dirname(entry_dir))
+            for prefix_dir in prefix_dirs:
+                try:
+                    os.rmdir(prefix_dir)
+                except OSError:
+                    # Not empty
+                    pass
+
+
+# Shared cache instances by directory, so concurrent workers share one lock
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(directory, max_bytes):
+    """Return the shared MapCache for a directory, updating its size cap."""
+    directory = os.path.abspath(directory)
+    with _caches_lock:
+        cache = _caches.get(directory)
+        if cache is None:
+            cache = MapCache(directory, max_bytes)
+            _caches[directory] = cache
+        cache.max_bytes = max_bytes
+        return cache
+
+
+def default_cache_directory():
+    import bpy
+    return bpy.utils.user_resource('DATAFILES', path="genpbr_cache")
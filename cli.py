@@ -0,0 +1,470 @@
+"""
+Headless batch runner for processing texture libraries without the UI.
+
+Inside Blender, every material of the open .blend file, or of each .blend file
+given (directories are searched recursively), is updated with generated maps:
+
+    blender -b library.blend --python genpbr_blender_addon/cli.py -- --manifest run.json --save
+    blender -b --python-expr "import genpbr_blender_addon.cli as cli; cli.main()" -- assets/ --manifest run.json --save
+
+Outside Blender (needs Pillow), maps are generated for every image in a folder
+and written next to each other as PNG files:
+
+    python genpbr_blender_addon/cli.py --images textures/ --output maps/ --manifest run.json
+
+The API key is read from --api-key or the GENPBR_API_KEY environment variable.
+Results and per-stage timings are written to the manifest as textures finish;
+running the same command again skips the work the manifest records as done.
+"""
+import argparse
+import concurrent.futures
+import datetime
+import json
+import os
+import queue
+import sys
+import threading
+import time
+
+try:
+    from . import utils
+    from . import jobs
+    from . import cache as map_cache
+    from . import api
+    from . import timing
+    from . import generation
+    from . import log
+    from .log import logger
+except ImportError:
+    # Run as a script (python cli.py, blender --python cli.py): import the
+    # add-on's modules from the folder of this file
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import utils
+    import jobs
+    import cache as map_cache
+    import api
+    import timing
+    import generation
+    import log
+    from log import logger
+
+
+# Bump when the layout of the manifest changes
+MANIFEST_VERSION = 1
+# Minimum seconds between manifest writes while textures are finishing
+MANIFEST_SAVE_INTERVAL = 2.0
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff')
+TEXTURE_TYPES = ("normal", "metallic", "roughness", "ao")
+
+# Exit codes
+EXIT_OK = 0
+EXIT_FAILURES = 1
+EXIT_USAGE = 2
+EXIT_INTERRUPTED = 130
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds")
+
+
+class Manifest:
+    """
+    Resumable JSON record of a run.
+
+    Items are keyed by texture (and .blend file, inside Blender). An item counts
+    as done only if it finished with the same settings fingerprint, so changing
+    the options regenerates everything. Writes go to a temp file that replaces
+    the manifest, so an interrupted run never leaves a truncated file.
+    """
+
+    def __init__(self, path, fingerprint):
+        self.path = path
+        self.fingerprint = fingerprint
+        self._lock = threading.Lock()
+        self._last_save = 0.0
+        self.data = {"version": MANIFEST_VERSION, "created": _now(), "items": {}, "files": {}}
+        if path and os.path.isfile(path):
+            with open(path) as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                self.data = data
+            else:
+                logger.warning("Ignoring manifest %s with unsupported version %s", path, data.get("version"))
+
+    def is_done(self, section, key, **match):
+        entry = self.data[section].get(key)
+        return (entry is not None and entry.get("status") == "done"
+                and entry.get("fingerprint") == self.fingerprint
+                and all(entry.get(name) == value for name, value in match.items()))
+
+    def record(self, section, key, entry):
+        with self._lock:
+            self.data[section][key] = dict(entry, fingerprint=self.fingerprint, updated=_now())
+        self.save(force=False)
+
+    def update(self, section, key, **fields):
+        with self._lock:
+            self.data[section][key].update(fields, updated=_now())
+
+    def save(self, force=True):
+        if not self.path:
+            return
+        with self._lock:
+            if not force and time.monotonic() - self._last_save < MANIFEST_SAVE_INTERVAL:
+                return
+            self._last_save = time.monotonic()
+            self.data["updated"] = _now()
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.data, f, indent=1)
+            os.replace(tmp_path, self.path)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="cli.py", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("blend_files", nargs="*",
+                        help=".blend files or folders to process (inside Blender; default: the open file)")
+    parser.add_argument("--images", help="folder of base textures to process outside Blender")
+    parser.add_argument("--output", help="folder for the generated maps (with --images)")
+    parser.add_argument("--manifest", help="JSON manifest of results; resumes the run it records")
+    parser.add_argument("--api-key", default=os.environ.get("GENPBR_API_KEY", ""))
+    parser.add_argument("--base-url", help="API base URL (default: the GenPBR API)")
+    parser.add_argument("--types", nargs="+", choices=TEXTURE_TYPES, default=list(TEXTURE_TYPES))
+    parser.add_argument("--normal-strength", type=float, default=5.0)
+    parser.add_argument("--metallic-intensity", type=float, default=0.8)
+    parser.add_argument("--roughness-intensity", type=float, default=2.0)
+    parser.add_argument("--ao-intensity", type=float, default=2.0)
+    parser.add_argument("--ao-radius", type=float, default=12.0)
+    parser.add_argument("--tiled", action="store_true", help="generate large textures at full resolution from tiles")
+    parser.add_argument("--workers", type=int, default=4, help="concurrent API requests")
+    parser.add_argument("--max-retries", type=int, default=3)
+    parser.add_argument("--upload-budget-mb", type=float, default=utils.DEFAULT_UPLOAD_BUDGET / 1024 / 1024)
+    parser.add_argument("--cache-dir", help="map cache folder (inside Blender: the add-on's cache by default)")
+    parser.add_argument("--cache-size-mb", type=int, default=1024)
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--map-dir", help="save maps as external files in this folder instead of packing them "
+                                          "(inside Blender; // is relative to each .blend file)")
+    parser.add_argument("--save", action="store_true", help="save each .blend file after updating it")
+    parser.add_argument("--all-maps", action="store_true",
+                        help="regenerate every map type, not only those whose inputs changed")
+    parser.add_argument("--log-level", choices=[item[0] for item in log.VERBOSITY_ITEMS], default='INFO')
+    return parser.parse_args(argv)
+
+
+def _options(args):
+    return {
+        "normalStrength": args.normal_strength,
+        "metallicIntensity": args.metallic_intensity,
+        "roughnessIntensity": args.roughness_intensity,
+        "aoIntensity": args.ao_intensity,
+        "aoRadius": args.ao_radius,
+    }
+
+
+def _fingerprint(args):
+    """Settings that change the generated maps; done items with another fingerprint are redone."""
+    return json.dumps({
+        "types": sorted(args.types),
+        "options": _options(args),
+        "tiled": args.tiled,
+        "upload_budget_mb": args.upload_budget_mb,
+    }, sort_keys=True)
+
+
+def _get_cache(args, in_blender):
+    if args.no_cache:
+        return None
+    directory = args.cache_dir
+    if not directory:
+        if not in_blender:
+            return None
+        directory = map_cache.default_cache_directory()
+    return map_cache.get_cache(directory, args.cache_size_mb * 1024 * 1024)
+
+
+def run_generations(items, args, client, cache, on_result):
+    """
+    Generate maps for many base textures concurrently.
+
+    Workers run on a thread pool; on_result(key, result, error, trace) is called
+    on the calling thread as each texture finishes, so it may touch bpy. Images
+    that only Blender can re-encode (no Pillow) are re-encoded on the calling
+    thread before the workers start. Ctrl+C cancels the outstanding requests.
+
+    Args:
+        items: Dict of item key -> (base texture path, previous map keys or None)
+    """
+    root = jobs.GenerationJob(None)
+    finished = queue.Queue()
+    retry_policy = api.RetryPolicy(max_retries=args.max_retries)
+    upload_budget = int(args.upload_budget_mb * 1024 * 1024)
+    options = _options(args)
+
+    def run_one(key, path, previous_keys, upload_source, trace):
+        child = root.spawn(generation.generate_maps_worker, args.api_key, path, list(args.types), options, cache,
+                           retry_policy, trace, client=client, upload_budget=upload_budget, tiled=args.tiled,
+                           previous_keys=previous_keys, upload_source=upload_source)
+        try:
+            child.run()
+        finally:
+            trace.finish()
+            finished.put((key, child, trace))
+
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, args.workers), thread_name_prefix="GenPBR-cli")
+    try:
+        submitted = 0
+        for key, (path, previous_keys) in items.items():
+            trace = timing.RunTrace(key)
+            upload_source = None
+            if utils.needs_main_thread_encode(path, upload_budget):
+                try:
+                    with trace.stage("read/compress"):
+                        upload_source = utils.compress_image_if_needed(path, upload_budget)
+                except Exception as e:
+                    trace.finish()
+                    on_result(key, None, e, trace)
+                    continue
+            pool.submit(run_one, key, path, previous_keys, upload_source, trace)
+            submitted += 1
+        for _ in range(submitted):
+            key, child, trace = finished.get()
+            on_result(key, child.result, child.error, trace)
+    except BaseException:
+        # Interrupted, or on_result failed: stop the requests that are still running
+        root.cancel()
+        raise
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _result_entry(result, error, trace, **fields):
+    """Manifest entry for one finished texture."""
+    entry = dict(fields, elapsed=round(trace.duration, 3),
+                 stages={stage: round(seconds, 3) for stage, seconds in trace.stage_totals().items()})
+    if error is not None:
+        entry.update(status="failed", error=f"{type(error).__name__}: {error}")
+        return entry
+    entry.update(status="done", maps=sorted(result["maps"]), reused=result.get("reused", []),
+                 cached=result.get("cached", False), shared=result.get("shared", False),
+                 retries=result.get("retries", 0), warnings=result.get("warnings", []))
+    return entry
+
+
+# --- Outside Blender: folders of images ---
+
+def _same_path(a, b):
+    return os.path.normcase(os.path.realpath(a)) == os.path.normcase(os.path.realpath(b))
+
+
+def _find_images(folder, exclude=None):
+    """Image files under folder; the exclude folder (the output) is not searched."""
+    for root, dirs, files in os.walk(folder):
+        if exclude is not None:
+            dirs[:] = [name for name in dirs if not _same_path(os.path.join(root, name), exclude)]
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.join(root, name)
+
+
+def _write_file(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def run_image_folder(args, client, manifest, stats):
+    images_dir = os.path.abspath(args.images)
+    output_dir = os.path.abspath(args.output)
+    cache = _get_cache(args, in_blender=False)
+
+    items = {}
+    outputs = {}
+    for path in _find_images(images_dir, exclude=output_dir):
+        stat = os.stat(path)
+        if manifest.is_done("items", path, size=stat.st_size, mtime=stat.st_mtime):
+            stats["skipped"] += 1
+            continue
+        stem = os.path.splitext(os.path.relpath(path, images_dir))[0]
+        outputs[path] = (os.path.join(output_dir, stem), stat)
+        items[path] = (path, None)
+    logger.info("%d images to process, %d already done", len(items), stats["skipped"])
+
+    def on_result(key, result, error, trace):
+        prefix, stat = outputs[key]
+        written = {}
+        if error is None:
+            for tex_type, data in result["maps"].items():
+                written[tex_type] = f"{prefix}_{tex_type}.png"
+                _write_file(written[tex_type], data)
+        entry = _result_entry(result, error, trace, source=key, size=stat.st_size, mtime=stat.st_mtime,
+                              files=written)
+        manifest.record("items", key, entry)
+        _count(stats, key, entry)
+
+    run_generations(items, args, client, cache, on_result)
+
+
+# --- Inside Blender: materials of .blend files ---
+
+def _find_blend_files(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _dirs, files in os.walk(path):
+                for name in sorted(files):
+                    if name.endswith(".blend"):
+                        yield os.path.abspath(os.path.join(root, name))
+        else:
+            yield os.path.abspath(path)
+
+
+def run_blend_file(args, client, manifest, stats):
+    """Update every local material of the open .blend file."""
+    import bpy
+    try:
+        from . import materials
+    except ImportError:
+        import materials
+
+    blend_path = os.path.abspath(bpy.data.filepath) if bpy.data.filepath else "<unsaved>"
+    map_directory = bpy.path.abspath(args.map_dir) if args.map_dir else None
+    cache = _get_cache(args, in_blender=True)
+    start = time.monotonic()
+
+    local_materials = [mat for mat in bpy.data.materials if mat.library is None]
+    textures = utils.collect_material_textures(local_materials)
+    items = {}
+    item_textures = {}
+    for path, names in textures.items():
+        key = f"{blend_path}|{path}"
+        if manifest.is_done("items", key):
+            stats["skipped"] += 1
+            continue
+        previous_keys = None
+        if not args.all_maps:
+            previous_keys = materials.shared_map_record([bpy.data.materials.get(name) for name in names])
+        items[key] = (path, previous_keys)
+        item_textures[key] = (path, names)
+    logger.info("%s: %d materials, %d textures to process", blend_path, len(local_materials), len(items))
+    if args.save and not bpy.data.filepath:
+        logger.warning("The open file was never saved; --save is ignored")
+
+    # Items are only done once the file is saved (or right away without --save)
+    applied = []
+
+    def on_result(key, result, error, trace):
+        path, names = item_textures[key]
+        warnings = []
+        if error is None and result["maps"]:
+            with trace.stage("material update"):
+                for name in names:
+                    mat = bpy.data.materials.get(name)
+                    if mat is None:
+                        continue
+                    for warning in materials.build_pbr_material(mat, path, result["maps"], trace, map_directory):
+                        warnings.append(f"{name}: {warning}")
+                    materials.store_map_record(mat, generation.applied_map_keys(result))
+        entry = _result_entry(result, error, trace, blend=blend_path, source=path, materials=names)
+        if error is None:
+            entry["warnings"] += warnings
+        if error is None and args.save:
+            entry["status"] = "applied"
+            applied.append(key)
+        manifest.record("items", key, entry)
+        _count(stats, key, entry)
+
+    run_generations(items, args, client, cache, on_result)
+
+    saved = False
+    if args.save and bpy.data.filepath and applied:
+        bpy.ops.wm.save_mainfile()
+        saved = True
+        for key in applied:
+            manifest.update("items", key, status="done")
+    failed = sum(1 for key in items if manifest.data["items"][key]["status"] == "failed")
+    manifest.record("files", blend_path, {
+        "status": "failed" if failed else "done",
+        "textures": len(textures),
+        "failed": failed,
+        "saved": saved,
+        "elapsed": round(time.monotonic() - start, 3),
+    })
+
+
+def run_blender(args, client, manifest, stats):
+    import bpy
+
+    if not args.blend_files:
+        run_blend_file(args, client, manifest, stats)
+        return
+    for blend_path in _find_blend_files(args.blend_files):
+        if manifest.is_done("files", blend_path):
+            logger.info("Skipping %s (done)", blend_path)
+            continue
+        logger.info("Opening %s", blend_path)
+        bpy.ops.wm.open_mainfile(filepath=blend_path)
+        run_blend_file(args, client, manifest, stats)
+        manifest.save()
+
+
+def _count(stats, key, entry):
+    # Applied items become done when their file is saved
+    status = "done" if entry["status"] == "applied" else entry["status"]
+    stats[status] = stats.get(status, 0) + 1
+    if entry["status"] == "failed":
+        logger.error("%s: %s", key, entry["error"])
+    else:
+        logger.info("%s: %s in %.1fs", key, ", ".join(entry["maps"]) or "up to date", entry["elapsed"])
+
+
+def main(argv=None):
+    """Entry point; arguments after "--" are used when running inside Blender."""
+    if argv is None:
+        argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+    args = parse_args(argv)
+    log.set_verbosity(args.log_level)
+
+    if not args.api_key:
+        logger.error("No API key: pass --api-key or set GENPBR_API_KEY")
+        return EXIT_USAGE
+    if args.images and not args.output:
+        logger.error("--images needs --output")
+        return EXIT_USAGE
+    if args.images and _same_path(args.images, args.output):
+        # The maps would be picked up as base textures on the next run
+        logger.error("--output must not be the --images folder")
+        return EXIT_USAGE
+    if not args.images and not utils.HAS_BPY:
+        logger.error("Outside Blender, pass a folder of images with --images and --output")
+        return EXIT_USAGE
+
+    manifest = Manifest(args.manifest, _fingerprint(args))
+    client = api.GenPBRClient(base_url=args.base_url) if args.base_url else api.get_client()
+    stats = {"skipped": 0}
+    start = time.monotonic()
+    try:
+        if args.images:
+            run_image_folder(args, client, manifest, stats)
+        else:
+            run_blender(args, client, manifest, stats)
+    except KeyboardInterrupt:
+        logger.warning("Interrupted; run the same command again to resume")
+        return EXIT_INTERRUPTED
+    finally:
+        manifest.save()
+        if args.base_url:
+            client.close()
+
+    logger.info("Finished in %.1fs: %s", time.monotonic() - start,
+                ", ".join(f"{count} {status}" for status, count in sorted(stats.items())))
+    return EXIT_FAILURES if stats.get("failed") else EXIT_OK
+
+
+if __name__ == "__main__":
+    status = main()
+    # Blender keeps running after --python scripts; only exit on failure or outside Blender
+    if status or not utils.HAS_BPY:
+        sys.exit(status)
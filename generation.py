@@ -0,0 +1,502 @@
+"""
+The generation pipeline: upload, API request, decoding and caching of maps.
+
+Everything here runs on worker threads (see jobs.GenerationJob) and does not
+touch bpy, so it is shared by the operators and the headless runner (cli).
+"""
+import base64
+import concurrent.futures
+import time
+
+try:
+    from . import utils
+    from . import jobs
+    from . import cache as map_cache
+    from . import upload
+    from . import api
+    from . import timing
+    from . import tiling
+    from . import inflight
+    from .log import logger
+    from .api import GenerationError
+except ImportError:
+    import utils
+    import jobs
+    import cache as map_cache
+    import upload
+    import api
+    import timing
+    import tiling
+    import inflight
+    from log import logger
+    from api import GenerationError
+
+
+# Option -> the map type it affects; other options affect every map type
+_OPTION_MAP_TYPES = {
+    "normalStrength": "normal",
+    "metallicIntensity": "metallic",
+    "roughnessIntensity": "roughness",
+    "aoIntensity": "ao",
+    "aoRadius": "ao",
+}
+
+
+def _map_keys(image_hash, texture_types, options):
+    """Key of the image and of the options affecting each map type, by map type."""
+    return {
+        tex_type: map_cache.make_cache_key(image_hash, [tex_type], {
+            name: value for name, value in options.items()
+            if _OPTION_MAP_TYPES.get(name, tex_type) == tex_type
+        })
+        for tex_type in texture_types
+    }
+
+
+def _partial_request(texture_types, map_keys, previous_keys):
+    """
+    Split the requested map types into those to generate and those whose
+    current map was made from the same inputs.
+
+    Returns:
+        tuple: (types to generate, types that can be kept)
+    """
+    previous_keys = previous_keys or {}
+    changed = [t for t in texture_types if previous_keys.get(t) != map_keys[t]]
+    return changed, [t for t in texture_types if t not in changed]
+
+
+def _up_to_date_result():
+    return {
+        "maps": {},
+        "usage": None,
+        "metadata": None,
+        "warnings": [],
+        "cached": False,
+        "retries": 0,
+    }
+
+
+def _read_cached_maps(cache, cache_key, texture_types, trace):
+    """Read the cached map files for cache_key, or return None on a miss."""
+    with trace.stage("cache read"):
+        cached_files = cache.get(cache_key, texture_types)
+        if not cached_files:
+            return None
+        maps = {}
+        for tex_type, path in cached_files.items():
+            with open(path, "rb") as f:
+                maps[tex_type] = f.read()
+    trace.count("cache hits")
+    return maps
+
+
+def _cached_result(maps):
+    return {
+        "maps": maps,
+        "usage": None,
+        "metadata": None,
+        "warnings": [],
+        "cached": True,
+        "retries": 0,
+    }
+
+
+def _decode_data_url(data_url):
+    # Extract and decode base64 data
+    if data_url.startswith('data:'):
+        return base64.b64decode(data_url.split(',', 1)[1])
+    return base64.b64decode(data_url)
+
+
+def generate_maps_worker(job, api_key, base_texture_path, texture_types, options, cache=None,
+                         retry_policy=None, trace=None, client=None, upload_budget=utils.DEFAULT_UPLOAD_BUDGET,
+                         tiled=False, max_workers=1, previous_keys=None, upload_source=None):
+    """
+    Upload the base texture and decode the returned maps in memory.
+
+    Runs on a worker thread (see jobs.GenerationJob) and must not touch bpy data.
+    When a cache.MapCache is given, a hit skips the network entirely and fresh
+    maps are also stored in the cache. A request identical to one already in
+    flight (same upload bytes, map types and options) waits for that request
+    and shares its result instead of sending another one (see inflight).
+    Transient API failures are retried according to retry_policy (api.RetryPolicy).
+    Images over upload_budget bytes, or stored uncompressed, are re-encoded to fit it.
+    Stage timings are recorded on trace (timing.RunTrace) when given. Requests go
+    through the shared api.get_client() unless another client is passed.
+    With tiled=True, images larger than the API's 2048px limit are generated at
+    full resolution from overlapping tiles, up to max_workers at a time.
+    previous_keys (map type -> key, see materials.get_map_record) describes
+    the maps the target material already has; types whose key is unchanged
+    are not requested again. upload_source is the (source, mime type) of an
+    image re-encoded on the main thread (see utils.needs_main_thread_encode);
+    it is uploaded instead of reading the file.
+
+    Returns:
+        dict: maps (tex_type -> PNG bytes), usage, metadata, warnings, cached and
+        shared flags, the number of retries needed, image_hash (of the upload,
+        or of the file when tiled), map_keys (tex_type -> key of its inputs)
+        and reused (types kept from the previous maps)
+    """
+    trace = trace or timing.NULL_TRACE
+    client = client or api.get_client()
+    job.report(5, "Reading image...")
+
+    if tiled and tiling.HAS_TILING:
+        try:
+            image_size = tiling.image_size(base_texture_path)
+        except Exception as e:
+            raise GenerationError(f"Failed to read image file: {e}")
+        if tiling.needs_tiling(*image_size):
+            return _generate_tiled_maps(job, api_key, base_texture_path, image_size, texture_types, options,
+                                        cache, retry_policy, trace, client, upload_budget, max_workers,
+                                        previous_keys)
+
+    try:
+        # Files under the size limit are streamed from disk instead of being read here
+        with trace.stage("read/compress"):
+            if upload_source is not None:
+                image_source, mime_type = upload_source
+            else:
+                image_source, mime_type = utils.prepare_upload_source(base_texture_path, upload_budget)
+        image_size = upload.source_size(image_source)
+    except Exception as e:
+        raise GenerationError(f"Failed to read image file: {e}")
+
+    with trace.stage("hash"):
+        image_hash = upload.hash_source(image_source)
+    map_keys = _map_keys(image_hash, texture_types, options)
+    texture_types, reused = _partial_request(texture_types, map_keys, previous_keys)
+    if not texture_types:
+        logger.info("Maps for %s are up to date", base_texture_path)
+        return dict(_up_to_date_result(), image_hash=image_hash, map_keys=map_keys, reused=reused)
+    request_key = map_cache.make_cache_key(image_hash, texture_types, options)
+
+    def request_maps():
+        if cache is not None:
+            maps = _read_cached_maps(cache, request_key, texture_types, trace)
+            if maps:
+                logger.info("Cache hit %s for %s", request_key[:12], base_texture_path)
+                job.report(60, "Loaded maps from cache")
+                return _cached_result(maps)
+        return _request_maps(job, api_key, image_source, mime_type, image_size, texture_types, options,
+                             cache, request_key, retry_policy, trace, client)
+
+    result = _coalesce(job, request_key, request_maps, base_texture_path)
+    return dict(result, image_hash=image_hash, map_keys=map_keys, reused=reused)
+
+
+def _coalesce(job, request_key, compute, base_texture_path):
+    """
+    Run compute() unless an identical request is already in flight, in which
+    case wait for that request and share its result (see inflight).
+    """
+    result, shared = inflight.get_requests().run(
+        request_key, job, compute, on_wait=lambda: job.report(15, "Waiting for an identical request..."))
+    if not shared:
+        return result
+    logger.info("Shared in-flight request %s for %s", request_key[:12], base_texture_path)
+    job.report(60, "Building material...")
+    # Usage was already counted by the request that produced the maps
+    return dict(result, shared=True, retries=0)
+
+
+def _request_maps(job, api_key, image_source, mime_type, image_size, texture_types, options,
+                  cache, cache_key, retry_policy, trace, client):
+    """Send one generation request and decode the returned maps; see generate_maps_worker."""
+    job.check_cancelled()
+    logger.debug("Image size: %d bytes", image_size)
+    job.report(15, "Uploading image...")
+
+    retries = 0
+
+    def on_retry(retry_number, delay, reason):
+        nonlocal retries
+        retries = retry_number
+        job.check_cancelled()
+        job.report(15, f"{reason}, retrying in {delay:.0f}s ({retry_number}/{retry_policy.max_retries})...")
+
+    def on_progress(phase, done, total):
+        # Upload maps to 15-30%, the server wait holds at 30%, download maps to 30-40%
+        if phase == "upload":
+            if total and done < total:
+                job.report(15 + 15 * done / total, f"Uploading image {100 * done // total}%...")
+            else:
+                job.report(30, "Waiting for GenPBR server...")
+        elif phase == "download":
+            if total:
+                job.report(30 + 10 * min(done, total) / total, f"Downloading maps {100 * min(done, total) // total}%...")
+            else:
+                job.report(30, f"Downloading maps ({done // 1024} KB)...")
+
+    data = client.generate_texture(
+        api_key, image_source, mime_type, texture_types, options,
+        retry_policy=retry_policy, on_retry=on_retry, sleep=job.sleep,
+        trace=trace, on_progress=on_progress,
+    )
+
+    job.check_cancelled()
+
+    textures = data.get("textures", {})
+    logger.debug("Received texture types: %s", list(textures))
+
+    job.report(40, "Decoding maps...")
+
+    decoded = {}
+    warnings = []
+
+    try:
+        with trace.stage("decode"):
+            for index, (tex_type, data_url) in enumerate(textures.items()):
+                job.check_cancelled()
+                decoded[tex_type] = _decode_data_url(data_url)
+                trace.count("bytes_decoded", len(decoded[tex_type]))
+                job.report(40 + 15 * (index + 1) / len(textures))
+
+    except jobs.JobCancelled:
+        raise
+    except Exception as e:
+        warnings.append(f"Failed to decode textures: {e}")
+
+    if cache is not None and decoded and not warnings:
+        try:
+            with trace.stage("cache write"):
+                cache.put(cache_key, decoded)
+        except OSError as e:
+            logger.warning("Failed to write map cache: %s", e)
+
+    job.report(60, "Building material...")
+
+    return {
+        "maps": decoded,
+        "usage": data.get("usage"),
+        "metadata": data.get("metadata"),
+        "warnings": warnings,
+        "cached": False,
+        "retries": retries,
+    }
+
+
+def _tile_worker(job, client, api_key, tile_image, texture_types, options, retry_policy, trace, upload_budget):
+    """Encode and generate one tile; returns (response data, retries)."""
+    with trace.stage("read/compress"):
+        data, _quality = utils.encode_jpeg_to_budget(tile_image, upload_budget)
+
+    retries = 0
+
+    def on_retry(retry_number, delay, reason):
+        nonlocal retries
+        retries = retry_number
+        job.check_cancelled()
+
+    response = client.generate_texture(
+        api_key, data, 'image/jpeg', texture_types, options,
+        retry_policy=retry_policy, on_retry=on_retry, sleep=job.sleep, trace=trace,
+    )
+    return response, retries
+
+
+def _generate_tiled_maps(job, api_key, base_texture_path, image_size, texture_types, options, cache,
+                         retry_policy, trace, client, upload_budget, max_workers, previous_keys):
+    """
+    Generate full-resolution maps for a large image from overlapping tiles.
+
+    Tiles are requested concurrently through the client, whose token bucket
+    paces them to the API's rate limit, and the returned maps are blended back
+    together with tiling.stitch_map. Returns the same dict as generate_maps_worker.
+    """
+    width, height = image_size
+    columns, rows = tiling.plan_tiles(width, height)
+    tile_count = len(columns) * len(rows)
+    logger.info("Tiled generation: %dx%d as %d tiles", width, height, tile_count)
+
+    with trace.stage("hash"):
+        image_hash = upload.hash_source(base_texture_path)
+    # Tiled maps differ from the downscaled ones, so the tiling is part of the key
+    key_options = dict(options, tiles=[tiling.TILE_SIZE, tiling.TILE_OVERLAP])
+    map_keys = _map_keys(image_hash, texture_types, key_options)
+    texture_types, reused = _partial_request(texture_types, map_keys, previous_keys)
+    if not texture_types:
+        logger.info("Maps for %s are up to date", base_texture_path)
+        return dict(_up_to_date_result(), image_hash=image_hash, map_keys=map_keys, reused=reused)
+    request_key = map_cache.make_cache_key(image_hash, texture_types, key_options)
+
+    def request_maps():
+        if cache is not None:
+            maps = _read_cached_maps(cache, request_key, texture_types, trace)
+            if maps:
+                logger.info("Cache hit %s for %s", request_key[:12], base_texture_path)
+                job.report(60, "Loaded maps from cache")
+                return _cached_result(maps)
+        return _request_tiled_maps(job, api_key, base_texture_path, width, height, columns, rows, texture_types,
+                                   options, cache, request_key, retry_policy, trace, client, upload_budget,
+                                   max_workers)
+
+    result = _coalesce(job, request_key, request_maps, base_texture_path)
+    return dict(result, image_hash=image_hash, map_keys=map_keys, reused=reused)
+
+
+def _request_tiled_maps(job, api_key, base_texture_path, width, height, columns, rows, texture_types, options,
+                        cache, cache_key, retry_policy, trace, client, upload_budget, max_workers):
+    """Generate every tile and stitch the maps; see _generate_tiled_maps."""
+    tile_count = len(columns) * len(rows)
+    try:
+        with trace.stage("read/compress"):
+            image = utils.load_rgb_image(base_texture_path, max_dimension=None)
+    except Exception as e:
+        raise GenerationError(f"Failed to read image file: {e}")
+
+    job.check_cancelled()
+    job.report(15, f"Generating 0/{tile_count} tiles...")
+
+    def run_tile(column_index, row_index):
+        tile_image = tiling.crop_tile(image, columns[column_index], rows[row_index])
+        child = job.spawn(_tile_worker, client, api_key, tile_image, texture_types, options,
+                          retry_policy, trace, upload_budget)
+        child.run()
+        if child.error is not None:
+            raise child.error
+        return child.result
+
+    # tex_type -> (column index, row index) -> PNG bytes
+    tiles = {}
+    last_response = {}
+    retries = 0
+    error = None
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, max_workers),
+                                               thread_name_prefix="GenPBR-tile") as pool:
+        futures = {pool.submit(run_tile, c, r): (c, r) for r in range(len(rows)) for c in range(len(columns))}
+        try:
+            for done_count, future in enumerate(concurrent.futures.as_completed(futures), 1):
+                try:
+                    response, tile_retries = future.result()
+                except Exception as e:
+                    # One missing tile leaves a hole in every map; stop scheduling the rest
+                    error = error or e
+                    for pending in futures:
+                        pending.cancel()
+                    continue
+                retries += tile_retries
+                last_response = response
+                with trace.stage("decode"):
+                    for tex_type, data_url in response.get("textures", {}).items():
+                        tiles.setdefault(tex_type, {})[futures[future]] = _decode_data_url(data_url)
+                job.report(15 + 40 * done_count / tile_count, f"Generating {done_count}/{tile_count} tiles...")
+        finally:
+            if job.cancelled:
+                for future in futures:
+                    future.cancel()
+
+    job.check_cancelled()
+    if error is not None:
+        raise error
+    del image
+
+    job.report(55, "Blending tiles...")
+    maps = {}
+    warnings = []
+    for tex_type, map_tiles in tiles.items():
+        job.check_cancelled()
+        if len(map_tiles) != tile_count:
+            warnings.append(f"{tex_type} map is missing tiles and was skipped")
+            continue
+        with trace.stage("stitch", map=tex_type):
+            maps[tex_type] = tiling.stitch_map(map_tiles, columns, rows, width, height,
+                                               is_normal=(tex_type == "normal"))
+        tiles[tex_type] = None
+
+    if cache is not None and maps and not warnings:
+        try:
+            with trace.stage("cache write"):
+                cache.put(cache_key, maps)
+        except OSError as e:
+            logger.warning("Failed to write map cache: %s", e)
+
+    job.report(60, "Building material...")
+
+    return {
+        "maps": maps,
+        "usage": last_response.get("usage"),
+        "metadata": last_response.get("metadata"),
+        "warnings": warnings,
+        "cached": False,
+        "retries": retries,
+    }
+
+
+def applied_map_keys(result):
+    """Input keys of the maps a worker result delivers."""
+    return {t: key for t, key in result.get("map_keys", {}).items() if t in result["maps"]}
+
+
+def batch_generate_worker(job, api_key, textures, texture_types, options, max_workers, cache=None,
+                          retry_policy=None, trace=None, upload_budget=utils.DEFAULT_UPLOAD_BUDGET, tiled=False,
+                          previous_keys=None, on_result=None, upload_sources=None):
+    """
+    Generate maps for many base textures on a bounded thread pool.
+
+    Args:
+        job: Parent GenerationJob (progress and cancellation)
+        textures: Dict of base texture path -> material names using it
+        max_workers: Maximum number of concurrent requests; the client's rate limiter
+            paces them to the API's rate limit
+        cache: Optional cache.MapCache shared by all requests
+        retry_policy: Optional api.RetryPolicy applied to every request
+        trace: Optional timing.RunTrace shared by all requests
+        upload_budget: Upload byte budget per texture
+        tiled: Generate large textures at full resolution from tiles (one tile at a
+            time per texture; the textures themselves run in parallel)
+        previous_keys: Optional dict of base texture path -> map keys shared by all
+            materials using it; unchanged map types are not requested again
+        on_result: Optional callable(path, result, error) run on the worker thread
+            as each texture finishes, with either a result or the exception
+        upload_sources: Optional dict of base texture path -> (source, mime type)
+            re-encoded on the main thread (see utils.needs_main_thread_encode)
+
+    Returns:
+        dict: results (path -> worker result), errors (path -> exception), elapsed seconds
+    """
+    total = len(textures)
+    results = {}
+    errors = {}
+
+    def run_one(path):
+        child = job.spawn(generate_maps_worker, api_key, path, texture_types, options, cache,
+                          retry_policy, trace, upload_budget=upload_budget, tiled=tiled,
+                          previous_keys=(previous_keys or {}).get(path),
+                          upload_source=(upload_sources or {}).get(path))
+        child.run()
+        if child.error is not None:
+            raise child.error
+        return child.result
+
+    start = time.monotonic()
+    job.report(0, f"Generating 0/{total} textures...")
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="GenPBR-batch") as pool:
+        futures = {pool.submit(run_one, path): path for path in textures}
+        try:
+            for done_count, future in enumerate(concurrent.futures.as_completed(futures), 1):
+                path = futures[future]
+                try:
+                    results[path] = future.result()
+                except jobs.JobCancelled:
+                    pass
+                except Exception as e:
+                    logger.warning("Batch item failed for %s: %s", path, e)
+                    errors[path] = e
+                if on_result is not None and (path in results or path in errors):
+                    on_result(path, results.get(path), errors.get(path))
+                job.report(100 * done_count / total, f"Generating {done_count}/{total} textures...")
+        finally:
+            if job.cancelled:
+                for future in futures:
+                    future.cancel()
+
+    job.check_cancelled()
+
+    return {
+        "results": results,
+        "errors": errors,
+        "elapsed": time.monotonic() - start,
+    }
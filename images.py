@@ -0,0 +1,210 @@
+import hashlib
+import os
+import tempfile
+
+import bpy
+
+try:
+    from .log import logger
+except ImportError:
+    from log import logger
+
+
+# Custom property holding the SHA-256 of the bytes an image was created from
+HASH_PROPERTY = "genpbr_hash"
+
+# Content hash -> image datablock name. Names are looked up again on use, so
+# stale entries (renamed or removed images, undo, a newly opened file) only
+# cost a rescan.
+_registry = {}
+
+
+def load_packed_image_from_bytes(name, data, colorspace='Non-Color', extension=".png"):
+    """
+    Create a packed image datablock directly from encoded image bytes.
+
+    The bytes are packed into the .blend file as-is and Blender decodes them
+    from memory, so there is no temp-file write and read-back.
+
+    Args:
+        name: Name for the image datablock
+        data: Encoded image bytes (PNG, JPEG, ...)
+        colorspace: Color space name ('sRGB', 'Non-Color', ...)
+        extension: File extension used for the image's nominal file path
+
+    Returns:
+        bpy.types.Image: The packed image
+    """
+    img = bpy.data.images.new(name, 8, 8)
+    try:
+        img.pack(data=data, data_len=len(data))
+        # Nominal path, used if the user unpacks the image later
+        img.filepath_raw = "//" + bpy.path.clean_name(name) + extension
+        img.source = 'FILE'
+        # Accessing the size decodes the packed data; 0x0 means Blender could not read it
+        if img.size[0] == 0 or img.size[1] == 0:
+            raise RuntimeError(f"Blender could not decode packed image data for '{name}'")
+    except Exception:
+        bpy.data.images.remove(img)
+        raise
+
+    img.colorspace_settings.name = colorspace
+    return img
+
+
+def load_packed_image_from_file(name, filepath, colorspace='Non-Color'):
+    """Load an image file and pack it into the .blend file."""
+    img = bpy.data.images.load(filepath)
+    img.name = name
+    img.colorspace_settings.name = colorspace
+    # Pack image into blend file for undo safety
+    img.pack()
+    return img
+
+
+def _file_hash(filepath, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _matches(img, content_hash, colorspace, packed):
+    return (img.get(HASH_PROPERTY) == content_hash
+            and img.colorspace_settings.name == colorspace
+            and bool(img.packed_file) == packed
+            and not img.is_dirty)
+
+
+def find_image(content_hash, colorspace, packed=True):
+    """
+    Find an image datablock created by GenPBR from the same bytes.
+
+    Args:
+        content_hash: SHA-256 hex digest of the encoded image bytes
+        colorspace: Required color space name
+        packed: Whether the image must be packed (True) or an external file (False)
+
+    Returns:
+        bpy.types.Image: The existing image, or None
+    """
+    name = _registry.get(content_hash)
+    img = bpy.data.images.get(name) if name else None
+    if img is not None and _matches(img, content_hash, colorspace, packed):
+        return img
+
+    _registry.pop(content_hash, None)
+    for img in bpy.data.images:
+        if _matches(img, content_hash, colorspace, packed):
+            _registry[content_hash] = img.name
+            return img
+    return None
+
+
+def _register(img, content_hash):
+    img[HASH_PROPERTY] = content_hash
+    _registry[content_hash] = img.name
+
+
+def load_base_image(name, filepath, colorspace='sRGB', pack=True):
+    """
+    Image datablock for a base texture file, reusing an existing one if possible.
+
+    An image GenPBR created earlier from the same bytes is reused. Without
+    pack, so is an unpacked image that already points at the same file; it is
+    shared as it is. Images of the user are never packed or renamed: packing
+    loads a separate copy of the file.
+    """
+    content_hash = _file_hash(filepath)
+    img = find_image(content_hash, colorspace, packed=pack)
+    if img is not None:
+        logger.debug("Reusing image %s for %s", img.name, filepath)
+        return img
+
+    if not pack:
+        abs_path = os.path.normcase(os.path.abspath(filepath))
+        for candidate in bpy.data.images:
+            if (candidate.source == 'FILE' and not candidate.packed_file and not candidate.is_dirty
+                    and candidate.colorspace_settings.name == colorspace
+                    and os.path.normcase(bpy.path.abspath(candidate.filepath)) == abs_path):
+                logger.debug("Sharing image %s for %s", candidate.name, filepath)
+                return candidate
+
+    if pack:
+        img = load_packed_image_from_file(name, filepath, colorspace)
+    else:
+        img = bpy.data.images.load(filepath, check_existing=False)
+        img.name = name
+        img.colorspace_settings.name = colorspace
+    _register(img, content_hash)
+    return img
+
+
+def save_map_image(name, data, directory, colorspace='Non-Color', content_hash=None):
+    """
+    Write a generated map into a folder and load it as an external image.
+
+    The file name includes the content hash, so identical maps share one file
+    and a new map never overwrites one that other materials still use.
+    """
+    content_hash = content_hash or hashlib.sha256(data).hexdigest()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{bpy.path.clean_name(name)}_{content_hash[:12]}.png")
+    if not os.path.isfile(path):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    img = bpy.data.images.load(path, check_existing=True)
+    img.name = name
+    img.colorspace_settings.name = colorspace
+    if bpy.data.filepath:
+        try:
+            img.filepath = bpy.path.relpath(path)
+        except ValueError:
+            # On another drive than the .blend file (Windows)
+            pass
+    return img
+
+
+def load_map_image(name, data, colorspace='Non-Color', directory=None):
+    """
+    Image datablock for a generated map, reusing an existing one with the same bytes.
+
+    New maps are packed, from memory when possible, or written to `directory`
+    as external files when one is given. Packing falls back to writing a temp
+    file and loading it if packing from memory fails (e.g. an older Blender
+    build without Image.pack(data=...)).
+    """
+    content_hash = hashlib.sha256(data).hexdigest()
+    img = find_image(content_hash, colorspace, packed=directory is None)
+    if img is not None:
+        logger.debug("Reusing image %s for %s", img.name, name)
+        return img
+
+    if directory is not None:
+        img = save_map_image(name, data, directory, colorspace, content_hash)
+    else:
+        img = _load_packed_map_image(name, data, colorspace)
+    _register(img, content_hash)
+    return img
+
+
+def _load_packed_map_image(name, data, colorspace):
+    try:
+        return load_packed_image_from_bytes(name, data, colorspace)
+    except Exception as e:
+        logger.warning("In-memory image load failed for %s, using a temp file: %s", name, e)
+
+    fd, temp_path = tempfile.mkstemp(prefix="genpbr_", suffix=".png")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        return load_packed_image_from_file(name, temp_path, colorspace)
+    finally:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
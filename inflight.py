@@ -0,0 +1,94 @@
+import concurrent.futures
+import threading
+
+try:
+    from . import jobs
+except ImportError:
+    import jobs
+
+
+# How often a waiting caller checks its own job for cancellation, in seconds
+WAIT_POLL_INTERVAL = 0.1
+
+
+class InFlightRequests:
+    """
+    Table of generation requests that are currently running, keyed by request.
+
+    The first caller for a key (the leader) runs the request; callers arriving
+    with the same key while it runs wait for the leader's future instead of
+    sending their own. The entry is removed once the leader finishes, so later
+    callers start a new request (or find the result in the map cache).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def run(self, key, job, compute, on_wait=None):
+        """
+        Run compute() once for all concurrent callers with the same key.
+
+        Args:
+            key: Request key, e.g. cache.make_cache_key() of the upload and options
+            job: The caller's GenerationJob; waiting stops when it is cancelled
+            compute: Callable producing the result, run only by the leader
+            on_wait: Optional callable invoked when the caller starts waiting
+
+        Returns:
+            tuple: (result, shared) where shared is True if another caller's
+            request produced the result
+
+        Raises:
+            The leader's exception, except that a cancelled leader is replaced:
+            one of its waiters runs the request instead.
+        """
+        while True:
+            with self._lock:
+                future = self._pending.get(key)
+                leader = future is None
+                if leader:
+                    future = concurrent.futures.Future()
+                    self._pending[key] = future
+
+            if leader:
+                return self._lead(key, future, compute), False
+
+            if on_wait is not None:
+                on_wait()
+            try:
+                return self._wait(future, job), True
+            except jobs.JobCancelled:
+                # The leader belonged to a job that was cancelled; ours was not
+                job.check_cancelled()
+
+    def _lead(self, key, future, compute):
+        try:
+            result = compute()
+        except BaseException as e:
+            self._release(key)
+            future.set_exception(e)
+            raise
+        self._release(key)
+        future.set_result(result)
+        return result
+
+    def _release(self, key):
+        with self._lock:
+            del self._pending[key]
+
+    def _wait(self, future, job):
+        while True:
+            job.check_cancelled()
+            try:
+                return future.result(timeout=WAIT_POLL_INTERVAL)
+            except concurrent.futures.TimeoutError:
+                continue
+
+
+# Shared by all generation workers
+_requests = InFlightRequests()
+
+
+def get_requests():
+    return _requests
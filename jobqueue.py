@@ -0,0 +1,318 @@
+"""
+Durable queue of batch generation jobs, kept in an SQLite file in the map
+cache folder.
+
+Every texture of a batch is recorded before any request is sent, and the
+maps are stored as soon as they are received. A batch interrupted by a crash,
+a restart or a cancel can then be resumed: received maps are applied again
+without calling the API and only the textures without a result are requested.
+Nothing here touches bpy.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+try:
+    from .log import logger
+except ImportError:
+    from log import logger
+
+
+QUEUE_NAME = "jobs.sqlite"
+
+# Job states
+PENDING = "pending"      # not generated yet
+FAILED = "failed"        # the last attempt failed; generated again on resume
+RECEIVED = "received"    # maps stored, not applied to the materials yet
+APPLIED = "applied"      # applied, but the .blend file has not been saved since
+DONE = "done"            # applied and saved; the stored maps are dropped
+
+# Batches not updated for this long are dropped
+RETENTION_SECONDS = 30 * 24 * 3600
+
+# Errors raised by the queue; callers log them and carry on without it
+QUEUE_ERRORS = (sqlite3.Error, OSError)
+
+# Identifies the Blender session that last ran a batch. Applied but unsaved
+# jobs only need re-applying when that session is gone.
+SESSION_ID = uuid.uuid4().hex
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS batches (
+    id INTEGER PRIMARY KEY,
+    session TEXT NOT NULL,
+    blend_file TEXT NOT NULL,
+    texture_types TEXT NOT NULL,
+    options TEXT NOT NULL,
+    tiled INTEGER NOT NULL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    batch_id INTEGER NOT NULL REFERENCES batches(id) ON DELETE CASCADE,
+    texture_path TEXT NOT NULL,
+    materials TEXT NOT NULL,
+    status TEXT NOT NULL,
+    image_hash TEXT,
+    result TEXT,
+    error TEXT,
+    UNIQUE (batch_id, texture_path)
+);
+CREATE TABLE IF NOT EXISTS maps (
+    job_id INTEGER NOT NULL REFERENCES jobs(id) ON DELETE CASCADE,
+    texture_type TEXT NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (job_id, texture_type)
+);
+CREATE INDEX IF NOT EXISTS batches_by_file ON batches (blend_file);
+"""
+
+# Worker result fields kept with the stored maps
+_RESULT_FIELDS = ("usage", "metadata", "warnings", "cached", "shared", "retries", "map_keys", "reused")
+
+
+class JobQueue:
+    """
+    Batches and their jobs (one per base texture) in an SQLite file.
+
+    Each call opens its own short-lived connection, so the queue can be used
+    from the main thread and from worker threads alike.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._initialized = False
+        # blend file -> interrupted_batch() result, cleared on every write
+        self._interrupted = {}
+
+    def _connect(self):
+        if not self._initialized:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA foreign_keys = ON")
+        if not self._initialized:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.executescript(_SCHEMA)
+            self._initialized = True
+        return conn
+
+    def _execute(self, fn, write=True):
+        """Run fn(conn) in one transaction."""
+        with self._lock:
+            if write:
+                self._interrupted.clear()
+            conn = self._connect()
+            try:
+                with conn:
+                    return fn(conn)
+            finally:
+                conn.close()
+
+    def create_batch(self, blend_file, textures, texture_types, options, tiled):
+        """
+        Record a new batch with one pending job per base texture.
+
+        Args:
+            blend_file: Path of the .blend file the batch applies to ('' if unsaved)
+            textures: Dict of base texture path -> material names using it
+            texture_types: Requested map types
+            options: API options dict
+            tiled: Whether large textures are generated from tiles
+
+        Returns:
+            int: The batch id
+        """
+        def create(conn):
+            now = time.time()
+            batch_id = conn.execute(
+                "INSERT INTO batches (session, blend_file, texture_types, options, tiled, created, updated)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (SESSION_ID, blend_file, json.dumps(texture_types), json.dumps(options), int(tiled), now, now),
+            ).lastrowid
+            conn.executemany(
+                "INSERT INTO jobs (batch_id, texture_path, materials, status) VALUES (?, ?, ?, ?)",
+                [(batch_id, path, json.dumps(list(names)), PENDING) for path, names in textures.items()],
+            )
+            return batch_id
+
+        return self._execute(create)
+
+    def record_result(self, batch_id, texture_path, result):
+        """Store a worker result and its maps (see generation.generate_maps_worker)."""
+        def record(conn):
+            job_id = self._job_id(conn, batch_id, texture_path)
+            conn.execute("DELETE FROM maps WHERE job_id = ?", (job_id,))
+            conn.executemany(
+                "INSERT INTO maps (job_id, texture_type, data) VALUES (?, ?, ?)",
+                [(job_id, tex_type, sqlite3.Binary(data)) for tex_type, data in result["maps"].items()],
+            )
+            fields = {name: result[name] for name in _RESULT_FIELDS if name in result}
+            conn.execute(
+                "UPDATE jobs SET status = ?, image_hash = ?, result = ?, error = NULL WHERE id = ?",
+                (RECEIVED, result.get("image_hash"), json.dumps(fields), job_id),
+            )
+            self._touch(conn, batch_id)
+
+        self._execute(record)
+
+    def record_failure(self, batch_id, texture_path, error):
+        def record(conn):
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ? WHERE batch_id = ? AND texture_path = ? AND status IN (?, ?)",
+                (FAILED, str(error), batch_id, texture_path, PENDING, FAILED),
+            )
+            self._touch(conn, batch_id)
+
+        self._execute(record)
+
+    def mark_applied(self, batch_id, texture_paths):
+        """Mark jobs whose maps were applied to their materials."""
+        def mark(conn):
+            conn.executemany(
+                "UPDATE jobs SET status = ? WHERE batch_id = ? AND texture_path = ? AND status = ?",
+                [(APPLIED, batch_id, path, RECEIVED) for path in texture_paths],
+            )
+            self._touch(conn, batch_id)
+
+        self._execute(mark)
+
+    def mark_saved(self, blend_file, previous_file=None):
+        """
+        Mark the applied jobs of this session's batches for a .blend file as done
+        once the file was saved, drop their maps and remove finished batches.
+
+        Args:
+            blend_file: Path the file was saved to
+            previous_file: Path before saving, if it changed (Save As); this
+                session's batches move to the new path
+        """
+        def mark(conn):
+            if previous_file is not None and previous_file != blend_file:
+                conn.execute("UPDATE batches SET blend_file = ? WHERE blend_file = ? AND session = ?",
+                             (blend_file, previous_file, SESSION_ID))
+            conn.execute(
+                "UPDATE jobs SET status = ? WHERE status = ? AND batch_id IN"
+                " (SELECT id FROM batches WHERE blend_file = ? AND session = ?)",
+                (DONE, APPLIED, blend_file, SESSION_ID),
+            )
+            conn.execute("DELETE FROM maps WHERE job_id IN (SELECT id FROM jobs WHERE status = ?)", (DONE,))
+            conn.execute("DELETE FROM batches WHERE NOT EXISTS"
+                         " (SELECT 1 FROM jobs WHERE jobs.batch_id = batches.id AND jobs.status != ?)", (DONE,))
+
+        self._execute(mark)
+
+    def claim(self, batch_id):
+        """Take over a batch for this session (its applied jobs no longer need re-applying)."""
+        self._execute(lambda conn: conn.execute("UPDATE batches SET session = ?, updated = ? WHERE id = ?",
+                                                (SESSION_ID, time.time(), batch_id)))
+
+    def discard(self, batch_id):
+        self._execute(lambda conn: conn.execute("DELETE FROM batches WHERE id = ?", (batch_id,)))
+
+    def prune(self, max_age=RETENTION_SECONDS):
+        """Remove batches that were not updated for max_age seconds."""
+        self._execute(lambda conn: conn.execute("DELETE FROM batches WHERE updated < ?", (time.time() - max_age,)))
+
+    def interrupted_batch(self, blend_file):
+        """
+        The most recent batch for a .blend file that still has work left:
+        jobs to generate, maps to apply, or maps applied by a session that
+        ended before the file was saved.
+
+        Returns:
+            dict: id, texture_types, options, tiled, to_generate and to_apply
+            counts, or None
+        """
+        with self._lock:
+            if blend_file in self._interrupted:
+                return self._interrupted[blend_file]
+        batch = self._execute(lambda conn: self._find_interrupted(conn, blend_file), write=False)
+        with self._lock:
+            self._interrupted[blend_file] = batch
+        return batch
+
+    def _find_interrupted(self, conn, blend_file):
+        rows = conn.execute(
+            "SELECT batches.*,"
+            " SUM(jobs.status IN (?, ?)) AS to_generate,"
+            " SUM(jobs.status = ? OR (jobs.status = ? AND batches.session != ?)) AS to_apply"
+            " FROM batches JOIN jobs ON jobs.batch_id = batches.id"
+            " WHERE batches.blend_file = ? GROUP BY batches.id ORDER BY batches.created DESC",
+            (PENDING, FAILED, RECEIVED, APPLIED, SESSION_ID, blend_file),
+        ).fetchall()
+        for row in rows:
+            if row["to_generate"] or row["to_apply"]:
+                return {
+                    "id": row["id"],
+                    "texture_types": json.loads(row["texture_types"]),
+                    "options": json.loads(row["options"]),
+                    "tiled": bool(row["tiled"]),
+                    "to_generate": row["to_generate"],
+                    "to_apply": row["to_apply"],
+                }
+        return None
+
+    def stored_results(self, batch_id):
+        """
+        Received (and, for batches of another session, applied) jobs of a batch.
+
+        Returns:
+            list: (texture path, material names, job id) tuples; see load_result
+        """
+        rows = self._execute(lambda conn: conn.execute(
+            "SELECT jobs.id, texture_path, materials FROM jobs JOIN batches ON batches.id = jobs.batch_id"
+            " WHERE batch_id = ? AND (status = ? OR (status = ? AND session != ?))",
+            (batch_id, RECEIVED, APPLIED, SESSION_ID),
+        ).fetchall(), write=False)
+        return [(row["texture_path"], json.loads(row["materials"]), row["id"]) for row in rows]
+
+    def load_result(self, job_id):
+        """A stored worker result with its maps, as generation.generate_maps_worker returned it."""
+        def load(conn):
+            row = conn.execute("SELECT image_hash, result FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            maps = {r["texture_type"]: bytes(r["data"]) for r in
+                    conn.execute("SELECT texture_type, data FROM maps WHERE job_id = ?", (job_id,))}
+            return dict(json.loads(row["result"]), image_hash=row["image_hash"], maps=maps)
+
+        return self._execute(load, write=False)
+
+    def incomplete_textures(self, batch_id):
+        """Base texture path -> material names of the jobs still to generate."""
+        rows = self._execute(lambda conn: conn.execute(
+            "SELECT texture_path, materials FROM jobs WHERE batch_id = ? AND status IN (?, ?)",
+            (batch_id, PENDING, FAILED),
+        ).fetchall(), write=False)
+        return {row["texture_path"]: json.loads(row["materials"]) for row in rows}
+
+    def _job_id(self, conn, batch_id, texture_path):
+        row = conn.execute("SELECT id FROM jobs WHERE batch_id = ? AND texture_path = ?",
+                           (batch_id, texture_path)).fetchone()
+        if row is None:
+            raise sqlite3.IntegrityError(f"No job for {texture_path} in batch {batch_id}")
+        return row["id"]
+
+    def _touch(self, conn, batch_id):
+        conn.execute("UPDATE batches SET updated = ? WHERE id = ?", (time.time(), batch_id))
+
+
+# Shared queue instances by path, so concurrent workers share one lock
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+def get_queue(path):
+    """Return the shared JobQueue for a database file."""
+    path = os.path.abspath(path)
+    with _queues_lock:
+        queue = _queues.get(path)
+        if queue is None:
+            queue = JobQueue(path)
+            _queues[path] = queue
+            logger.debug("Job queue at %s", path)
+        return queue
@@ -0,0 +1,121 @@
+import threading
+
+
+class JobCancelled(Exception):
+    """Raised inside a worker when the job has been cancelled."""
+
+
+class GenerationJob:
+    """
+    Run a generation function on a worker thread.
+
+    The target is called as target(job, *args, **kwargs) and must not touch bpy.
+    It reports progress through job.report() and should call job.check_cancelled()
+    between stages. The main thread polls done/progress and reads result/error.
+    """
+
+    def __init__(self, target, *args, **kwargs):
+        self._target = target
+        self._args = args
+        self._kwargs = kwargs
+        self._lock = threading.Lock()
+        self._cancel_event = threading.Event()
+        self._done_event = threading.Event()
+        self._thread = None
+        self._progress = 0.0
+        self._status = ""
+        # Optional callable(progress, status), invoked from the reporting thread
+        self.on_report = None
+        self.result = None
+        self.error = None
+
+    def start(self):
+        """Start the job on a daemon worker thread."""
+        self._thread = threading.Thread(target=self.run, name="GenPBR-worker", daemon=True)
+        self._thread.start()
+
+    def run(self):
+        """Run the job in the calling thread (used directly for synchronous execution)."""
+        try:
+            self.result = self._target(self, *self._args, **self._kwargs)
+        except Exception as e:
+            self.error = e
+        finally:
+            self._done_event.set()
+
+    def spawn(self, target, *args, **kwargs):
+        """
+        Create a child job that shares this job's cancellation.
+
+        Used by batch jobs to run per-texture work on a thread pool; the child is
+        run with child.run() on the pool thread and its progress is not tracked.
+        """
+        child = GenerationJob(target, *args, **kwargs)
+        child._cancel_event = self._cancel_event
+        return child
+
+    def cancel(self):
+        """Request cancellation; the worker stops at its next checkpoint."""
+        self._cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    @property
+    def done(self):
+        return self._done_event.is_set()
+
+    def wait(self, timeout=None):
+        """Block until the job has finished. Returns True if it finished."""
+        return self._done_event.wait(timeout)
+
+    def check_cancelled(self):
+        """Raise JobCancelled if cancellation was requested."""
+        if self._cancel_event.is_set():
+            raise JobCancelled()
+
+    def sleep(self, seconds):
+        """Wait for the given time, waking up early and raising JobCancelled on cancellation."""
+        if self._cancel_event.wait(seconds):
+            raise JobCancelled()
+
+    def report(self, progress, status=""):
+        """Record progress (0-100) and a short status text. Safe to call from any thread."""
+        with self._lock:
+            self._progress = progress
+            if status:
+                self._status = status
+        if self.on_report is not None:
+            self.on_report(progress, status)
+
+    @property
+    def progress(self):
+        with self._lock:
+            return self._progress
+
+    @property
+    def status(self):
+        with self._lock:
+            return self._status
+
+
+# Job currently driven by the modal generate operator (None when idle)
+_active_job = None
+
+
+def get_active_job():
+    return _active_job
+
+
+def set_active_job(job):
+    global _active_job
+    _active_job = job
+
+
+def cancel_active_job():
+    """Cancel the active job if there is one. Returns True if a job was cancelled."""
+    if _active_job is not None and not _active_job.done:
+        _active_job.cancel()
+        return True
+    return False
@@ -0,0 +1,40 @@
+import logging
+
+
+# Verbosity choices for the add-on preferences: (identifier, name, description)
+VERBOSITY_ITEMS = [
+    ('OFF', "Off", "Do not log anything"),
+    ('ERROR', "Errors", "Log errors only"),
+    ('WARNING', "Warnings", "Log warnings and errors"),
+    ('INFO', "Info", "Log progress information"),
+    ('DEBUG', "Debug", "Log detailed request and node-search information"),
+]
+
+DEFAULT_VERBOSITY = 'WARNING'
+
+logger = logging.getLogger("genpbr")
+logger.propagate = False
+
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("[GenPBR] %(levelname)s: %(message)s"))
+    logger.addHandler(_handler)
+
+
+def set_verbosity(verbosity):
+    """
+    Set the add-on log level from a VERBOSITY_ITEMS identifier.
+
+    'OFF' disables the logger so every logging call returns after a single
+    attribute check. Use lazy %-style arguments (logger.debug("x %s", y)) and
+    guard expensive arguments with logger.isEnabledFor().
+    """
+    if verbosity == 'OFF':
+        logger.disabled = True
+        logger.setLevel(logging.CRITICAL + 1)
+    else:
+        logger.disabled = False
+        logger.setLevel(getattr(logging, verbosity, logging.WARNING))
+
+
+set_verbosity(DEFAULT_VERBOSITY)
@@ -0,0 +1,128 @@
+import bpy
+from bpy.app.handlers import persistent
+
+try:
+    from . import utils
+except ImportError:
+    import utils
+
+
+# Material pointer -> (node tree pointer, base texture path or None)
+_texture_cache = {}
+
+# Node tree pointer -> nodegraph.NodeGraph, shared by all lookups
+_graphs = {}
+
+# Bumped whenever a material's cached lookup is dropped, so callers can tell
+# whether its result may have changed: material pointer -> count, plus an
+# epoch bumped when every lookup is dropped
+_versions = {}
+_epoch = 0
+
+
+def get_base_texture(obj, material=None):
+    """
+    Memoized utils.get_base_texture_from_material.
+
+    Results are cached per material and node-tree identity and dropped by the
+    depsgraph handler when the material, a node tree or an image changes, so
+    repeated lookups (e.g. panel redraws) are O(1) and print nothing.
+
+    Args:
+        obj: Blender object with a material
+        material: Material to inspect (default: the object's active material)
+
+    Returns:
+        str: File path to the base texture, or None if not found
+    """
+    mat = material if material is not None else (obj.active_material if obj else None)
+    if mat is None:
+        return None
+
+    tree = mat.node_tree if mat.use_nodes else None
+    tree_pointer = tree.as_pointer() if tree else 0
+    key = mat.as_pointer()
+
+    entry = _texture_cache.get(key)
+    if entry is not None and entry[0] == tree_pointer:
+        return entry[1]
+
+    texture_path = utils.get_base_texture_from_material(obj, mat, graphs=_graphs)
+    _texture_cache[key] = (tree_pointer, texture_path)
+    return texture_path
+
+
+def lookup_version(material):
+    """
+    Version of a material's lookup result.
+
+    It changes whenever the material, a node tree or an image changes, so a
+    result (including "no texture") remembered with the version stays valid
+    while the version is the same.
+    """
+    return _epoch, _versions.get(material.as_pointer(), 0)
+
+
+def _drop(material):
+    pointer = material.as_pointer()
+    _texture_cache.pop(pointer, None)
+    _versions[pointer] = _versions.get(pointer, 0) + 1
+    if material.node_tree is not None:
+        _graphs.pop(material.node_tree.as_pointer(), None)
+
+
+def _drop_all():
+    global _epoch
+    _texture_cache.clear()
+    _graphs.clear()
+    _versions.clear()
+    _epoch += 1
+
+
+def invalidate(material=None):
+    """Drop the cached lookup for one material, or for all materials."""
+    if material is None:
+        _drop_all()
+    else:
+        _drop(material)
+
+
+@persistent
+def _on_depsgraph_update(scene, depsgraph):
+    for update in depsgraph.updates:
+        id_data = update.id
+        if isinstance(id_data, bpy.types.Material):
+            _drop(id_data.original)
+        elif isinstance(id_data, (bpy.types.NodeTree, bpy.types.Image)):
+            # Node groups and images can be shared by many materials
+            _drop_all()
+            return
+
+
+@persistent
+def _on_reload(*args):
+    # Files loaded and undo steps replace the data the cached node graphs point
+    # to, and pointers are reused
+    _drop_all()
+
+
+_RELOAD_HANDLERS = ("load_post", "undo_post", "redo_post")
+
+
+def register():
+    if _on_depsgraph_update not in bpy.app.handlers.depsgraph_update_post:
+        bpy.app.handlers.depsgraph_update_post.append(_on_depsgraph_update)
+    for name in _RELOAD_HANDLERS:
+        handlers = getattr(bpy.app.handlers, name)
+        if _on_reload not in handlers:
+            handlers.append(_on_reload)
+
+
+def unregister():
+    if _on_depsgraph_update in bpy.app.handlers.depsgraph_update_post:
+        bpy.app.handlers.depsgraph_update_post.remove(_on_depsgraph_update)
+    for name in _RELOAD_HANDLERS:
+        handlers = getattr(bpy.app.handlers, name)
+        if _on_reload in handlers:
+            handlers.remove(_on_reload)
+    _drop_all()
@@ -0,0 +1,316 @@
+try:
+    from . import images
+    from . import timing
+    from .log import logger
+except ImportError:
+    import images
+    import timing
+    from log import logger
+
+
+# Custom property marking the nodes GenPBR manages and what each one is for
+NODE_ROLE_PROPERTY = "genpbr_role"
+
+# Material custom property recording, per map type, the key of the inputs the
+# map was generated from and the hash of the image it was loaded as
+RECORD_PROPERTY = "genpbr_maps"
+
+# Labels of the image nodes; untagged image nodes with these labels (built by
+# earlier versions, which cleared the tree) are adopted instead of duplicated
+MAP_LABELS = {
+    "albedo": "Albedo",
+    "ao": "Ambient Occlusion",
+    "metallic": "Metallic",
+    "roughness": "Roughness",
+    "normal": "Normal Map",
+}
+
+# Image node slots, used only when a node is created
+_IMAGE_LOCATIONS = {
+    "albedo": (-400, 0),
+    "ao": (-400, -200),
+    "metallic": (-400, -400),
+    "roughness": (-400, -600),
+    "normal": (-400, -800),
+}
+
+
+class PBRNodeTree:
+    """
+    The GenPBR-managed part of a material's node tree.
+
+    Managed nodes are found by their role tag and only created when missing.
+    Links are only added when they do not exist yet and images only assigned
+    when they differ, so an update that changes one map touches one node.
+    Untagged nodes are left alone.
+    """
+
+    def __init__(self, node_tree):
+        self.nodes = node_tree.nodes
+        self.links = node_tree.links
+        self.by_role = {}
+        for node in self.nodes:
+            role = node.get(NODE_ROLE_PROPERTY)
+            if role and role not in self.by_role:
+                self.by_role[role] = node
+        self.nodes_created = 0
+        self.links_created = 0
+        self.images_swapped = 0
+
+    def find(self, role):
+        return self.by_role.get(role)
+
+    def adopt(self, node, role):
+        """Tag an existing node as the managed node for a role."""
+        node[NODE_ROLE_PROPERTY] = role
+        self.by_role[role] = node
+        return node
+
+    def adopt_first(self, role, predicate):
+        """Adopt the first untagged node matching predicate if no node has the role yet."""
+        if role in self.by_role:
+            return self.by_role[role]
+        for node in self.nodes:
+            if not node.get(NODE_ROLE_PROPERTY) and predicate(node):
+                return self.adopt(node, role)
+        return None
+
+    def ensure(self, role, node_type, location, label="", setup=None):
+        """
+        Return the node for a role, creating it if missing.
+
+        Args:
+            role: Role name stored in NODE_ROLE_PROPERTY
+            node_type: Node bl_idname
+            location: Location of a newly created node
+            label: Label of a newly created node
+            setup: Optional callable(node) run only on a newly created node
+        """
+        node = self.by_role.get(role)
+        if node is not None and node.bl_idname == node_type:
+            return node
+        node = self.nodes.new(type=node_type)
+        node.location = location
+        if label:
+            node.label = label
+        if setup is not None:
+            setup(node)
+        self.nodes_created += 1
+        return self.adopt(node, role)
+
+    def link(self, from_socket, to_socket):
+        """Link two sockets unless they already are (replaces other links into to_socket)."""
+        for link in to_socket.links:
+            if link.from_socket == from_socket:
+                return
+        self.links.new(from_socket, to_socket)
+        self.links_created += 1
+
+    def set_image(self, node, image):
+        if node.image != image:
+            node.image = image
+            self.images_swapped += 1
+
+
+def _image_node(tree, role, image):
+    """Managed image texture node for a map, with its image swapped in if it changed."""
+    label = MAP_LABELS[role]
+    tree.adopt_first(role, lambda node: node.bl_idname == 'ShaderNodeTexImage' and node.label == label)
+    node = tree.ensure(role, 'ShaderNodeTexImage', _IMAGE_LOCATIONS[role], label)
+    tree.set_image(node, image)
+    return node
+
+
+def _adopt_linked(tree, role, socket, predicate):
+    """Adopt the untagged node linked into socket if it matches predicate."""
+    if socket.is_linked:
+        source = socket.links[0].from_node
+        tree.adopt_first(role, lambda node: node == source and predicate(node))
+
+
+def _set_multiply(node):
+    node.blend_type = 'MULTIPLY'
+    node.inputs['Fac'].default_value = 1.0
+
+
+def update_pbr_nodes(mat, map_images):
+    """
+    Bring a material's GenPBR nodes up to date with a set of images.
+
+    Finds the managed nodes (see PBRNodeTree), adopting the active material
+    output and the Principled BSDF connected to it on first use, and creates
+    only the nodes and links that are missing. Roles without an image in
+    `map_images` keep their current nodes, so maps that were not regenerated stay
+    connected. Nodes the user added are not touched.
+
+    Args:
+        mat: Material with use_nodes enabled
+        map_images: Dict of role ('albedo', 'ao', 'metallic', 'roughness', 'normal')
+            -> bpy.types.Image
+
+    Returns:
+        PBRNodeTree: The updated tree, with counts of what was changed
+    """
+    tree = PBRNodeTree(mat.node_tree)
+
+    tree.adopt_first("output", lambda node: node.bl_idname == 'ShaderNodeOutputMaterial' and node.is_active_output)
+    output = tree.ensure("output", 'ShaderNodeOutputMaterial', (400, 0))
+    surface = output.inputs['Surface']
+    _adopt_linked(tree, "bsdf", surface, lambda node: node.bl_idname == 'ShaderNodeBsdfPrincipled')
+    bsdf = tree.ensure("bsdf", 'ShaderNodeBsdfPrincipled', (0, 0))
+    tree.link(bsdf.outputs['BSDF'], surface)
+
+    nodes = {role: _image_node(tree, role, image) for role, image in map_images.items()}
+    for role in MAP_LABELS:
+        if role not in nodes and tree.find(role) is not None:
+            nodes[role] = tree.find(role)
+
+    # Base color: albedo, multiplied by AO when there is an AO map
+    albedo_node = nodes.get("albedo")
+    ao_node = nodes.get("ao")
+    if ao_node is not None and albedo_node is not None:
+        _adopt_linked(tree, "ao_mix", bsdf.inputs['Base Color'],
+                      lambda node: node.bl_idname == 'ShaderNodeMixRGB' and node.blend_type == 'MULTIPLY')
+        mix_node = tree.ensure("ao_mix", 'ShaderNodeMixRGB', (-200, -200), setup=_set_multiply)
+        tree.link(albedo_node.outputs['Color'], mix_node.inputs['Color1'])
+        tree.link(ao_node.outputs['Color'], mix_node.inputs['Color2'])
+        tree.link(mix_node.outputs['Color'], bsdf.inputs['Base Color'])
+    elif ao_node is not None:
+        # No albedo: connect AO directly (unusual)
+        tree.link(ao_node.outputs['Color'], bsdf.inputs['Base Color'])
+    elif albedo_node is not None:
+        tree.link(albedo_node.outputs['Color'], bsdf.inputs['Base Color'])
+
+    if "metallic" in nodes:
+        tree.link(nodes["metallic"].outputs['Color'], bsdf.inputs['Metallic'])
+    if "roughness" in nodes:
+        tree.link(nodes["roughness"].outputs['Color'], bsdf.inputs['Roughness'])
+    if "normal" in nodes:
+        _adopt_linked(tree, "normal_map", bsdf.inputs['Normal'],
+                      lambda node: node.bl_idname == 'ShaderNodeNormalMap')
+        normal_map_node = tree.ensure("normal_map", 'ShaderNodeNormalMap', (-200, -800))
+        tree.link(nodes["normal"].outputs['Color'], normal_map_node.inputs['Color'])
+        tree.link(normal_map_node.outputs['Normal'], bsdf.inputs['Normal'])
+
+    logger.debug("Updated %s: %d nodes created, %d links created, %d images swapped",
+                 mat.name, tree.nodes_created, tree.links_created, tree.images_swapped)
+    return tree
+
+
+def _node_image_hash(tree, role):
+    node = tree.find(role)
+    image = node.image if node is not None else None
+    return image.get(images.HASH_PROPERTY) if image is not None else None
+
+
+def get_map_record(mat):
+    """
+    Keys of the inputs a material's current maps were generated from.
+
+    Only map types whose GenPBR node still shows the image recorded for it are
+    included, so maps the user replaced or removed are generated again.
+
+    Returns:
+        dict: map type -> key (see generation._map_keys)
+    """
+    if mat is None or not mat.use_nodes or mat.node_tree is None:
+        return {}
+    record = mat.get(RECORD_PROPERTY)
+    if not record:
+        return {}
+    tree = PBRNodeTree(mat.node_tree)
+    keys = {}
+    for tex_type, entry in record.items():
+        image_hash = _node_image_hash(tree, tex_type)
+        if image_hash is not None and image_hash == entry.get("image"):
+            keys[tex_type] = entry.get("key")
+    return keys
+
+
+def store_map_record(mat, map_keys):
+    """
+    Record the input keys of the maps just applied to a material.
+
+    Args:
+        mat: Material updated by update_pbr_nodes
+        map_keys: Dict of map type -> key for the maps that were applied
+    """
+    tree = PBRNodeTree(mat.node_tree)
+    record = {tex_type: dict(entry.items()) for tex_type, entry in (mat.get(RECORD_PROPERTY) or {}).items()}
+    for tex_type, key in map_keys.items():
+        image_hash = _node_image_hash(tree, tex_type)
+        if image_hash is None:
+            record.pop(tex_type, None)
+        else:
+            record[tex_type] = {"key": key, "image": image_hash}
+    mat[RECORD_PROPERTY] = record
+
+
+def shared_map_record(mats):
+    """Map keys recorded alike on all the given materials, i.e. maps none of them needs again."""
+    shared = None
+    for mat in mats:
+        keys = get_map_record(mat)
+        shared = keys if shared is None else {t: k for t, k in shared.items() if keys.get(t) == k}
+    return shared or {}
+
+
+# Map names used in warnings
+_MAP_DESCRIPTIONS = {"ao": "AO", "metallic": "metallic", "roughness": "roughness", "normal": "normal"}
+
+
+def build_pbr_material(mat, base_texture_path, maps, trace=None, map_directory=None):
+    """
+    Update a material's node tree with the base texture and the decoded maps.
+
+    The GenPBR nodes are updated in place (see materials.update_pbr_nodes):
+    existing nodes are kept, missing ones created and only changed images
+    swapped, so other nodes in the material survive. Image datablocks created
+    earlier from the same bytes are reused (see images.find_image), so
+    materials sharing a texture share its images.
+
+    Args:
+        mat: Blender material to rebuild
+        base_texture_path: Path to the base (albedo) texture
+        maps: Dict of texture type -> encoded (PNG) map bytes
+        trace: Optional timing.RunTrace recording the build and image load stages
+        map_directory: Folder to save the maps to as external files; None packs
+            them (and the albedo) into the .blend file
+
+    Returns:
+        list: Warning messages for maps that could not be loaded
+    """
+    trace = trace or timing.NULL_TRACE
+    with trace.stage("node-tree build", material=mat.name):
+        return _build_pbr_nodes(mat, base_texture_path, maps, trace, map_directory)
+
+
+def _build_pbr_nodes(mat, base_texture_path, maps, trace, map_directory):
+    warnings = []
+    mat.use_nodes = True
+
+    # Load base image as albedo (since API doesn't return albedo separately)
+    map_images = {}
+    try:
+        with trace.stage("image load/pack", map="albedo"):
+            map_images["albedo"] = images.load_base_image("Albedo", base_texture_path, 'sRGB',
+                                                          pack=map_directory is None)
+    except Exception as e:
+        warnings.append(f"Failed to load base image as albedo: {e}")
+
+    for tex_type in ("ao", "metallic", "roughness", "normal"):
+        if tex_type not in maps:
+            continue
+        try:
+            # Reused, packed straight from the decoded bytes or saved to the map folder
+            with trace.stage("image load/pack", map=tex_type):
+                map_images[tex_type] = images.load_map_image(MAP_LABELS[tex_type], maps[tex_type],
+                                                              directory=map_directory)
+        except Exception as e:
+            warnings.append(f"Failed to load {_MAP_DESCRIPTIONS[tex_type]} map: {e}")
+
+    # Only missing nodes and links are created and only changed images swapped
+    tree = update_pbr_nodes(mat, map_images)
+    trace.count("nodes created", tree.nodes_created)
+    trace.count("images swapped", tree.images_swapped)
+    return warnings
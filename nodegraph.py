@@ -0,0 +1,195 @@
+"""
+Indexed upstream search of shader node trees.
+
+NodeGraph reads a node tree's links once into a reverse adjacency map, so a
+search follows links without rescanning sockets. find_image_nodes walks it
+iteratively and best-first: links into the sockets that usually carry the
+base color (see PRIORITY_INPUTS) are followed before the others, and among
+equally likely paths the shorter one wins. Node groups are entered through
+their Group Output node and left through their Group Input node.
+"""
+import heapq
+import itertools
+
+try:
+    from .log import logger
+except ImportError:
+    from log import logger
+
+
+# Inputs that usually carry the base color, in the order they are followed
+PRIORITY_INPUTS = ('Color', 'Image', 'Base Color', 'Albedo', 'Diffuse')
+# Other inputs are followed only if they carry colors or vectors
+FOLLOWED_SOCKET_TYPES = ('RGBA', 'VECTOR')
+# Mix nodes: only their two color inputs are followed, the first one first
+MIX_INPUTS = {
+    'MIX_RGB': ('Color1', 'Color2'),
+    'MIX': ('A', 'B'),
+}
+
+# Cost of following a link into a secondary input (any input that is not a
+# priority input, the first mix input or a reroute)
+SECONDARY_COST = 1
+
+
+def _input_rank(node, socket, index):
+    """(cost, order) of following links into an input socket, or None to skip it."""
+    mix_inputs = MIX_INPUTS.get(node.type)
+    if mix_inputs is not None:
+        if socket.name not in mix_inputs:
+            return None
+        position = mix_inputs.index(socket.name)
+        return (0 if position == 0 else SECONDARY_COST), (position, index)
+    if node.type == 'REROUTE':
+        return 0, (0, index)
+    if socket.name in PRIORITY_INPUTS:
+        return 0, (PRIORITY_INPUTS.index(socket.name), index)
+    if socket.type in FOLLOWED_SOCKET_TYPES:
+        return SECONDARY_COST, (len(PRIORITY_INPUTS), index)
+    return None
+
+
+class NodeGraph:
+    """
+    Reverse adjacency index of one node tree.
+
+    Built in a single pass over tree.links (muted links are left out). For
+    every node it keeps the links into it in search order, and for every input
+    socket the nodes feeding it.
+    """
+
+    def __init__(self, node_tree):
+        self.tree = node_tree
+        self.by_type = {}
+        for node in node_tree.nodes:
+            self.by_type.setdefault(node.type, []).append(node)
+
+        # node -> [(cost, order, from node, from socket identifier)], sorted
+        self._upstream = {}
+        # (node, input socket identifier) -> [(from node, from socket identifier)]
+        self._into = {}
+        socket_indices = {}
+        for link in node_tree.links:
+            if link.is_muted:
+                continue
+            to_node = link.to_node
+            to_socket = link.to_socket
+            source = (link.from_node, link.from_socket.identifier)
+            self._into.setdefault((to_node, to_socket.identifier), []).append(source)
+
+            indices = socket_indices.get(to_node)
+            if indices is None:
+                indices = {socket.identifier: i for i, socket in enumerate(to_node.inputs)}
+                socket_indices[to_node] = indices
+            rank = _input_rank(to_node, to_socket, indices.get(to_socket.identifier, 0))
+            if rank is not None:
+                self._upstream.setdefault(to_node, []).append((rank[0], rank[1]) + source)
+
+        for entries in self._upstream.values():
+            entries.sort(key=lambda entry: (entry[0], entry[1]))
+
+    def upstream(self, node):
+        """Links into a node in search order: (cost, from node, from socket identifier)."""
+        return [(cost, from_node, identifier) for cost, _order, from_node, identifier in self._upstream.get(node, ())]
+
+    def into(self, node, identifier):
+        """(from node, from socket identifier) of the links into one input socket."""
+        return self._into.get((node, identifier), [])
+
+    def first(self, node_type, predicate=None):
+        for node in self.by_type.get(node_type, ()):
+            if predicate is None or predicate(node):
+                return node
+        return None
+
+    def principled_bsdf(self):
+        """The Principled BSDF feeding the active material output, else the first one in the tree."""
+        output = self.first('OUTPUT_MATERIAL', lambda node: node.is_active_output)
+        surface = output.inputs.get('Surface') if output is not None else None
+        if surface is not None:
+            for from_node, _identifier in self.into(output, surface.identifier):
+                if from_node.type == 'BSDF_PRINCIPLED':
+                    return from_node
+        return self.first('BSDF_PRINCIPLED')
+
+
+def graph_for(node_tree, graphs=None):
+    """
+    The NodeGraph of a node tree.
+
+    Args:
+        node_tree: Blender node tree
+        graphs: Optional dict of node tree pointer -> NodeGraph reused across
+            searches; the caller drops entries when trees change (see lookup)
+    """
+    if graphs is None:
+        return NodeGraph(node_tree)
+    key = node_tree.as_pointer()
+    graph = graphs.get(key)
+    if graph is None:
+        graph = NodeGraph(node_tree)
+        graphs[key] = graph
+    return graph
+
+
+def find_image_nodes(graph, node, identifier, graphs=None):
+    """
+    Image texture nodes upstream of an input socket, best candidates first.
+
+    Paths are ordered by how many secondary inputs they pass through, then
+    by length, then by socket priority. Image nodes are not searched past, and
+    nodes without an image are skipped.
+
+    Args:
+        graph: NodeGraph of the tree containing node
+        node: Node whose input to search from
+        identifier: Identifier of that input socket
+        graphs: Optional NodeGraph cache for the trees of node groups (see graph_for)
+
+    Yields:
+        Image texture nodes with an image, possibly inside node groups
+    """
+    counter = itertools.count()
+    heap = []
+    # Search state: (graph, node, identifier of the output socket reached it
+    # through, stack of (graph, group node) the search is inside of)
+    for from_node, from_identifier in graph.into(node, identifier):
+        heapq.heappush(heap, (0, 1, next(counter), (graph, from_node, from_identifier, ())))
+
+    visited = set()
+    while heap:
+        cost, depth, _seq, (graph, node, via, stack) = heapq.heappop(heap)
+        # Which output was used only matters where it selects a group socket
+        key = (graph, node, via if node.type in ('GROUP', 'GROUP_INPUT') else None, stack)
+        if key in visited:
+            continue
+        visited.add(key)
+
+        if node.type == 'TEX_IMAGE':
+            if node.image is not None:
+                yield node
+            continue
+
+        if node.type == 'GROUP':
+            if node.node_tree is None:
+                continue
+            inner = graph_for(node.node_tree, graphs)
+            group_output = inner.first('GROUP_OUTPUT', lambda n: n.is_active_output) or inner.first('GROUP_OUTPUT')
+            if group_output is None:
+                continue
+            logger.debug("Entering node group %s", node.node_tree.name)
+            sources = [(0, from_node, identifier) for from_node, identifier in inner.into(group_output, via)]
+            next_graph, next_stack = inner, stack + ((graph, node),)
+        elif node.type == 'GROUP_INPUT':
+            if not stack:
+                continue
+            next_graph, group_node = stack[-1]
+            sources = [(0, from_node, identifier) for from_node, identifier in next_graph.into(group_node, via)]
+            next_stack = stack[:-1]
+        else:
+            sources = graph.upstream(node)
+            next_graph, next_stack = graph, stack
+
+        for link_cost, from_node, identifier in sources:
+            heapq.heappush(heap, (cost + link_cost, depth + 1, next(counter),
+                                  (next_graph, from_node, identifier, next_stack)))
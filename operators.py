@@ -1,14 +1,201 @@
 import bpy
-import requests
 import os
-import base64
-import tempfile
+import logging
+from bpy.app.handlers import persistent
 
 try:
     from . import utils
+    from . import jobs
+    from . import cache as map_cache
+    from . import api
+    from . import lookup
+    from . import timing
+    from . import generation
+    from . import materials
+    from . import jobqueue
+    from . import sceneindex
+    from .log import logger
+    from .api import GenerationError
 except ImportError:
     # Handle case when running as standalone module
     import utils
+    import jobs
+    import cache as map_cache
+    import api
+    import lookup
+    import timing
+    import generation
+    import materials
+    import jobqueue
+    import sceneindex
+    from log import logger
+    from api import GenerationError
+
+
+def _get_prefs(context):
+    addon_name = __name__.split('.')[0]
+    return context.preferences.addons[addon_name].preferences
+
+
+def _seed_rate_limiter(props):
+    """Seed the client's token bucket from the last usage the API reported."""
+    remaining = None
+    if props.usage_monthly_quota > 0 and props.usage_remaining_quota > 0:
+        remaining = props.usage_remaining_quota
+    api.get_client().rate_limiter.configure(props.usage_rate_limit, remaining)
+
+
+def _get_retry_policy(prefs):
+    return api.RetryPolicy(max_retries=prefs.max_retries)
+
+
+def _get_upload_budget(prefs):
+    return int(prefs.upload_budget_mb * 1024 * 1024)
+
+
+def _get_map_cache(prefs, enabled_only=True):
+    """Return the shared map cache configured in the preferences, or None if disabled."""
+    if enabled_only and not prefs.use_cache:
+        return None
+    directory = bpy.path.abspath(prefs.cache_directory) if prefs.cache_directory else map_cache.default_cache_directory()
+    return map_cache.get_cache(directory, prefs.cache_max_size_mb * 1024 * 1024)
+
+
+def _job_queue_path(prefs):
+    directory = _get_map_cache(prefs, enabled_only=False).directory
+    return os.path.join(directory, jobqueue.QUEUE_NAME)
+
+
+def _get_job_queue(prefs):
+    """Return the shared job queue, kept in the map cache folder."""
+    return jobqueue.get_queue(_job_queue_path(prefs))
+
+
+def _existing_job_queue(prefs):
+    """The shared job queue if its file exists, else None (nothing was ever queued)."""
+    path = _job_queue_path(prefs)
+    return jobqueue.get_queue(path) if os.path.isfile(path) else None
+
+
+# The open file's batch that can be resumed, looked up by _refresh_interrupted_batch
+_interrupted = None
+
+
+def interrupted_batch(context):
+    """
+    The open file's batch that can be resumed (see jobqueue.JobQueue.interrupted_batch), or None.
+
+    Only returns the result of the last refresh, so draw() never touches the queue;
+    schedule_interrupted_batch_refresh() updates it.
+    """
+    return _interrupted
+
+
+def _refresh_interrupted_batch():
+    global _interrupted
+    try:
+        queue = _existing_job_queue(_get_prefs(bpy.context))
+        _interrupted = queue.interrupted_batch(bpy.data.filepath) if queue is not None else None
+    except (jobqueue.QUEUE_ERRORS + (KeyError,)) as e:
+        logger.debug("Job queue unavailable: %s", e)
+        _interrupted = None
+    if bpy.context.window_manager is not None:
+        _redraw_genpbr_panels(bpy.context)
+    return None
+
+
+def schedule_interrupted_batch_refresh():
+    """Look up the resumable batch again once the running operator or handler has returned."""
+    if not bpy.app.timers.is_registered(_refresh_interrupted_batch):
+        bpy.app.timers.register(_refresh_interrupted_batch, first_interval=0)
+
+
+def _queue_recorder(queue, batch_id):
+    """on_result callback for generation.batch_generate_worker storing each outcome in the job queue."""
+    def on_result(path, result, error):
+        try:
+            if error is None:
+                queue.record_result(batch_id, path, result)
+            else:
+                queue.record_failure(batch_id, path, error)
+        except jobqueue.QUEUE_ERRORS as e:
+            logger.warning("Failed to record %s in the job queue: %s", path, e)
+    return on_result
+
+
+def _encode_on_main_thread(path, upload_budget):
+    """
+    Re-encode an image that only Blender can re-encode here (no Pillow) before
+    its job starts, as that creates image datablocks (see utils.needs_main_thread_encode).
+
+    Returns:
+        tuple: (source, mime_type) for the worker, or None if the worker prepares the upload itself
+    """
+    if not utils.needs_main_thread_encode(path, upload_budget):
+        return None
+    return utils.compress_image_if_needed(path, upload_budget)
+
+
+def _get_map_directory(props):
+    """Absolute folder for generated maps, or None to pack them into the .blend file."""
+    if props.map_storage != 'EXTERNAL':
+        return None
+    return bpy.path.abspath(props.map_directory)
+
+
+def _collect_texture_types(props):
+    """Build texture types list based on toggles"""
+    texture_types = []
+    if props.generate_normal:
+        texture_types.append("normal")
+    if props.generate_metallic:
+        texture_types.append("metallic")
+    if props.generate_roughness:
+        texture_types.append("roughness")
+    if props.generate_ao:
+        texture_types.append("ao")
+    return texture_types
+
+
+def _collect_options(props):
+    """Build the API options dict from the user-configured sliders"""
+    return {
+        "normalStrength": props.normal_strength,
+        "metallicIntensity": props.metallic_intensity,
+        "roughnessIntensity": props.roughness_intensity,
+        "aoIntensity": props.ao_intensity,
+        "aoRadius": props.ao_radius
+    }
+
+
+def store_usage(props, result):
+    """Store usage stats and the free-regeneration flag from a generation result."""
+    usage = result.get("usage")
+    if usage:
+        logger.debug("Usage info: %s", usage)
+        props.usage_remaining_quota = usage.get("remainingQuota", 0)
+        props.usage_tier = usage.get("tier", "")
+        props.usage_monthly_quota = usage.get("monthlyQuota", 0)
+        props.usage_rate_limit = usage.get("rateLimit", 0)
+        # Store free regeneration flag from usage
+        if "isFreeRegeneration" in usage:
+            props.is_free_regeneration = usage["isFreeRegeneration"]
+
+    # Also check metadata for free regeneration (in case usage doesn't have it)
+    metadata = result.get("metadata")
+    if metadata:
+        logger.debug("Metadata: %s", metadata)
+        if "isFreeRegeneration" in metadata:
+            props.is_free_regeneration = metadata["isFreeRegeneration"]
+
+
+def _redraw_genpbr_panels(context):
+    """Tag Shader Editor sidebars for redraw so the progress display updates."""
+    wm = context.window_manager
+    for window in wm.windows:
+        for area in window.screen.areas:
+            if area.type == 'NODE_EDITOR':
+                area.tag_redraw()
 
 
 class PBRAutoLoadTextureOperator(bpy.types.Operator):
@@ -46,444 +233,746 @@ class PBRSelectFileOperator(bpy.types.Operator):
         return {'RUNNING_MODAL'}
 
 
-class PBRGenerateOperator(bpy.types.Operator):
+class PBRCancelGenerationOperator(bpy.types.Operator):
+    bl_idname = "pbr.cancel_generation"
+    bl_label = "Cancel Generation"
+    bl_description = "Cancel the running PBR map generation"
+    bl_options = {'INTERNAL'}
+
+    def execute(self, context):
+        if not jobs.cancel_active_job():
+            self.report({'WARNING'}, "No generation is running")
+            return {'CANCELLED'}
+        return {'FINISHED'}
+
+
+class PBRExportTraceOperator(bpy.types.Operator):
+    bl_idname = "pbr.export_trace"
+    bl_label = "Export Timing Trace"
+    bl_description = "Save the stage timings of recent generations as a Chrome trace (chrome://tracing, Perfetto)"
+
+    filepath: bpy.props.StringProperty(subtype="FILE_PATH")
+    filter_glob: bpy.props.StringProperty(default="*.json", options={'HIDDEN'})
+
+    @classmethod
+    def poll(cls, context):
+        return bool(timing.recent_runs())
+
+    def execute(self, context):
+        filepath = bpy.path.ensure_ext(bpy.path.abspath(self.filepath), ".json")
+        try:
+            count = timing.export_chrome_trace(filepath)
+        except OSError as e:
+            self.report({'ERROR'}, f"Failed to write trace: {e}")
+            return {'CANCELLED'}
+        self.report({'INFO'}, f"Exported {count} runs to {os.path.basename(filepath)}")
+        return {'FINISHED'}
+
+    def invoke(self, context, event):
+        if not self.filepath:
+            self.filepath = "genpbr_trace.json"
+        context.window_manager.fileselect_add(self)
+        return {'RUNNING_MODAL'}
+
+
+class PBRClearCacheOperator(bpy.types.Operator):
+    bl_idname = "pbr.clear_cache"
+    bl_label = "Clear Map Cache"
+    bl_description = "Delete all cached generated maps"
+
+    def execute(self, context):
+        cache = _get_map_cache(_get_prefs(context), enabled_only=False)
+        size_mb = cache.size_bytes() / 1024 / 1024
+        cache.clear()
+        self.report({'INFO'}, f"Cleared {size_mb:.1f}MB of cached maps")
+        return {'FINISHED'}
+
+    def invoke(self, context, event):
+        return context.window_manager.invoke_confirm(self, event)
+
+
+class _BackgroundJobMixin:
+    """
+    Modal plumbing shared by the generate operators.
+
+    Subclasses create a jobs.GenerationJob and implement _finish_job(context, job),
+    which runs on the main thread once the worker is done. A timing.RunTrace set as
+    _trace is recorded once the job has been applied.
+    """
+
+    _job = None
+    _timer = None
+    _trace = None
+
+    def _run_sync(self, context, job):
+        wm = context.window_manager
+        # Initialize progress indicator
+        wm.progress_begin(0, 100)
+        try:
+            job.on_report = lambda progress, status: wm.progress_update(progress)
+            job.run()
+            return self._complete(context, job)
+        finally:
+            wm.progress_end()
+            schedule_interrupted_batch_refresh()
+
+    def _start_modal(self, context, job):
+        props = context.scene.genpbr_props
+        props.is_generating = True
+        props.generation_progress = 0.0
+        props.generation_status = "Starting..."
+
+        self._job = job
+        jobs.set_active_job(job)
+        job.start()
+
+        wm = context.window_manager
+        wm.progress_begin(0, 100)
+        self._timer = wm.event_timer_add(0.1, window=context.window)
+        wm.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        job = self._job
+
+        if event.type == 'ESC' and event.value == 'PRESS':
+            job.cancel()
+        elif event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+
+        if job.cancelled:
+            # The worker thread finishes on its own; its result is discarded
+            self._end_modal(context)
+            self.report({'WARNING'}, "PBR map generation cancelled")
+            return {'CANCELLED'}
+
+        props = context.scene.genpbr_props
+        props.generation_progress = job.progress
+        props.generation_status = job.status
+        context.window_manager.progress_update(job.progress)
+        _redraw_genpbr_panels(context)
+
+        if not job.done:
+            return {'RUNNING_MODAL'}
+
+        self._end_modal(context)
+        return self._complete(context, job)
+
+    def _complete(self, context, job):
+        result = self._finish_job(context, job)
+        if self._trace is not None:
+            timing.record_run(self._trace)
+            summary = self._trace.summary()
+            context.scene.genpbr_props.last_timing_summary = summary
+            logger.info("Timing: %s", summary)
+            self._trace = None
+        return result
+
+    def cancel(self, context):
+        # Called by Blender when the modal operator is aborted (e.g. file load)
+        if self._job is not None:
+            self._job.cancel()
+        self._end_modal(context)
+
+    def _end_modal(self, context):
+        wm = context.window_manager
+        if self._timer is not None:
+            wm.event_timer_remove(self._timer)
+            self._timer = None
+        wm.progress_end()
+        jobs.set_active_job(None)
+
+        props = context.scene.genpbr_props
+        props.is_generating = False
+        props.generation_progress = 0.0
+        props.generation_status = ""
+        _redraw_genpbr_panels(context)
+        schedule_interrupted_batch_refresh()
+
+    def _check_online(self):
+        # Check if internet access is allowed (Blender ToS compliance)
+        if not bpy.app.online_access:
+            self.report({'ERROR'}, "Internet access is disabled. Please enable 'Allow Internet Access' in Blender preferences to use this addon.")
+            return False
+        return True
+
+    def _check_map_storage(self, props):
+        if props.map_storage != 'EXTERNAL':
+            return True
+        if not props.map_directory:
+            self.report({'ERROR'}, "Please choose a folder for the generated maps")
+            return False
+        if props.map_directory.startswith("//") and not bpy.data.filepath:
+            self.report({'ERROR'}, "Save the .blend file first, or choose an absolute folder for the generated maps")
+            return False
+        return True
+
+
+class PBRGenerateOperator(_BackgroundJobMixin, bpy.types.Operator):
     bl_idname = "pbr.generate_maps"
     bl_label = "Generate PBR Maps"
     bl_description = "Generate PBR maps from selected base texture using GenPBR API"
     bl_options = {'REGISTER', 'UNDO'}
 
-    def execute(self, context):
+    _object_name = ""
+    _base_texture_path = ""
+
+    def _prepare(self, context):
+        """
+        Validate the current state and collect the request arguments.
+
+        Returns:
+            dict: keyword arguments for generation.generate_maps_worker, or None if validation failed
+        """
         props = context.scene.genpbr_props
-        addon_name = __name__.split('.')[0]
-        prefs = bpy.context.preferences.addons[addon_name].preferences
+        prefs = _get_prefs(context)
         api_key = prefs.api_key.strip() if prefs.api_key else ""
 
-        # Initialize progress indicator
-        wm = context.window_manager
-        wm.progress_begin(0, 100)
+        # Check if object is selected
+        if not context.object:
+            self.report({'ERROR'}, "Please select an object first")
+            return None
 
-        try:
-            # Check if object is selected
-            if not context.object:
-                self.report({'ERROR'}, "Please select an object first")
-                wm.progress_end()
-                return {'CANCELLED'}
-
-            # Auto-load base texture from material if not already set
-            if not props.base_texture_path and context.object.active_material:
-                texture_path = utils.get_base_texture_from_material(context.object)
-                if texture_path and os.path.isfile(texture_path):
-                    props.base_texture_path = texture_path
-
-            # Debug: Print API key info (first 10 and last 4 chars for security)
-            print(f"[GenPBR Debug] API Key length: {len(api_key)}")
-            if api_key:
-                print(f"[GenPBR Debug] API Key preview: {api_key[:10]}...{api_key[-4:]}")
-            else:
-                print("[GenPBR Debug] API Key is empty!")
+        trace = timing.RunTrace(f"Generate {context.object.name}")
 
-            if not api_key:
-                self.report({'ERROR'}, "Please enter your API key in the Add-on preferences")
-                wm.progress_end()
-                return {'CANCELLED'}
-
-            if not props.base_texture_path or not os.path.isfile(props.base_texture_path):
-                self.report({'ERROR'}, "Please select a valid base texture file first, or assign a material with a texture to the selected object")
-                wm.progress_end()
-                return {'CANCELLED'}
-
-            # Build texture types list based on toggles
-            texture_types = []
-            if props.generate_normal:
-                texture_types.append("normal")
-            if props.generate_metallic:
-                texture_types.append("metallic")
-            if props.generate_roughness:
-                texture_types.append("roughness")
-            if props.generate_ao:
-                texture_types.append("ao")
-
-            if not texture_types:
-                self.report({'ERROR'}, "Please select at least one texture type to generate")
-                wm.progress_end()
-                return {'CANCELLED'}
-
-            wm.progress_update(5)
-
-            # Read and encode image to base64
-            try:
-                image_data, mime_type = utils.compress_image_if_needed(props.base_texture_path)
-                base64_image = base64.b64encode(image_data).decode('utf-8')
+        # Auto-load base texture from material if not already set
+        if not props.base_texture_path and context.object.active_material:
+            with trace.stage("material lookup"):
+                texture_path = lookup.get_base_texture(context.object)
+            if texture_path and os.path.isfile(texture_path):
+                props.base_texture_path = texture_path
 
-            except Exception as e:
-                self.report({'ERROR'}, f"Failed to read image file: {e}")
-                wm.progress_end()
-                return {'CANCELLED'}
-
-            wm.progress_update(10)
-
-            # Check if internet access is allowed (Blender ToS compliance)
-            if not bpy.app.online_access:
-                self.report({'ERROR'}, "Internet access is disabled. Please enable 'Allow Internet Access' in Blender preferences to use this addon.")
-                wm.progress_end()
-                return {'CANCELLED'}
-
-            # Prepare API request
-            url = "https://genpbr.com/api/v1/generate-texture"
-
-            # Try lowercase header name first (some servers are case-sensitive)
-            headers = {
-                "x-api-key": api_key.strip(),
-                "Content-Type": "application/json"
-            }
-
-            # Debug: Print request details
-            print(f"[GenPBR Debug] URL: {url}")
-            print(f"[GenPBR Debug] Headers: {list(headers.keys())}")
-            print(f"[GenPBR Debug] Header 'x-api-key' value length: {len(headers['x-api-key'])}")
-            print(f"[GenPBR Debug] Image size: {len(image_data)} bytes")
-            print(f"[GenPBR Debug] Base64 length: {len(base64_image)} chars")
-            print(f"[GenPBR Debug] Texture types: {texture_types}")
-
-            # Use user-configured options
-            payload = {
-                "baseImage": f"data:{mime_type};base64,{base64_image}",
-                "textureTypes": texture_types,
-                "options": {
-                    "normalStrength": props.normal_strength,
-                    "metallicIntensity": props.metallic_intensity,
-                    "roughnessIntensity": props.roughness_intensity,
-                    "aoIntensity": props.ao_intensity,
-                    "aoRadius": props.ao_radius
-                }
-            }
-
-            wm.progress_update(15)
+        if not api_key:
+            self.report({'ERROR'}, "Please enter your API key in the Add-on preferences")
+            return None
 
-            try:
-                print("[GenPBR Debug] Sending API request...")
-                response = requests.post(url, json=payload, headers=headers, timeout=120)
+        if not props.base_texture_path or not os.path.isfile(props.base_texture_path):
+            self.report({'ERROR'}, "Please select a valid base texture file first, or assign a material with a texture to the selected object")
+            return None
+
+        texture_types = _collect_texture_types(props)
+        if not texture_types:
+            self.report({'ERROR'}, "Please select at least one texture type to generate")
+            return None
+
+        if not self._check_online() or not self._check_map_storage(props):
+            return None
 
-                # Debug: Print response details
-                print(f"[GenPBR Debug] Response status: {response.status_code}")
-                print(f"[GenPBR Debug] Response headers: {dict(response.headers)}")
+        upload_budget = _get_upload_budget(prefs)
+        try:
+            with trace.stage("read/compress"):
+                upload_source = _encode_on_main_thread(props.base_texture_path, upload_budget)
+        except Exception as e:
+            self.report({'ERROR'}, f"Failed to read image file: {e}")
+            return None
+
+        _seed_rate_limiter(props)
+
+        self._object_name = context.object.name
+        self._base_texture_path = props.base_texture_path
+        self._trace = trace
+
+        previous_keys = None
+        if props.skip_unchanged_maps:
+            previous_keys = materials.get_map_record(context.object.active_material)
+
+        return {
+            "api_key": api_key,
+            "base_texture_path": props.base_texture_path,
+            "texture_types": texture_types,
+            "options": _collect_options(props),
+            "cache": _get_map_cache(prefs),
+            "retry_policy": _get_retry_policy(prefs),
+            "trace": trace,
+            "upload_budget": upload_budget,
+            "tiled": props.tiled_generation,
+            "max_workers": prefs.batch_max_workers,
+            "previous_keys": previous_keys,
+            "upload_source": upload_source,
+        }
+
+    def execute(self, context):
+        request = self._prepare(context)
+        if request is None:
+            return {'CANCELLED'}
+        return self._run_sync(context, jobs.GenerationJob(generation.generate_maps_worker, **request))
+
+    def invoke(self, context, event):
+        if not _get_prefs(context).async_generation:
+            return self.execute(context)
 
-                response.raise_for_status()
+        if jobs.get_active_job() is not None:
+            self.report({'WARNING'}, "A PBR generation is already running")
+            return {'CANCELLED'}
 
-            except requests.exceptions.HTTPError as e:
-                status_code = response.status_code
-                error_msg = f"API request failed: {e}"
-                error_type = ""
-                detailed_msg = ""
+        request = self._prepare(context)
+        if request is None:
+            return {'CANCELLED'}
+        return self._start_modal(context, jobs.GenerationJob(generation.generate_maps_worker, **request))
 
-                print(f"[GenPBR Debug] HTTP Error: {e}")
-                print(f"[GenPBR Debug] Response status code: {status_code}")
+    def _finish_job(self, context, job):
+        """Apply a finished job's result (or error) on the main thread."""
+        props = context.scene.genpbr_props
 
-                try:
-                    error_data = response.json()
-                    print(f"[GenPBR Debug] Full error response: {error_data}")
-
-                    # Extract error message from response
-                    if "message" in error_data:
-                        detailed_msg = error_data['message']
-                        error_msg = f"API error: {detailed_msg}"
-                    if "error" in error_data:
-                        detailed_msg = error_data.get('message', '')
-                        error_msg = f"{error_data.get('error', 'Unknown error')}: {detailed_msg}"
-                    if "debug" in error_data:
-                        print(f"[GenPBR Debug] Server debug info: {error_data['debug']}")
-
-                except Exception as json_error:
-                    print(f"[GenPBR Debug] Failed to parse error JSON: {json_error}")
-                    print(f"[GenPBR Debug] Raw response text: {response.text[:500]}")
-                    detailed_msg = response.text[:200] if hasattr(response, 'text') else str(e)
-
-                # Handle specific error codes with user-friendly messages
-                if status_code == 401:
-                    error_type = "401"
-                    error_msg = "Unauthorized: Invalid or missing API key"
-                    detailed_msg = "Please check your API key in Add-on Preferences (Edit > Preferences > Add-ons > GenPBR Map Generator)"
-                elif status_code == 400:
-                    error_type = "400"
-                    error_msg = "Bad Request: Invalid request body or missing required fields"
-                    if detailed_msg:
-                        error_msg = f"Bad Request: {detailed_msg}"
-                elif status_code == 429:
-                    error_type = "429"
-                    error_msg = "Rate Limit Exceeded: Too many requests"
-                    detailed_msg = "Please wait a moment before retrying. Check your rate limit in Usage Statistics."
-                elif status_code == 402:
-                    error_type = "402"
-                    error_msg = "Quota Exceeded: Monthly request limit reached"
-                    detailed_msg = "Your monthly quota has been exhausted. Please wait for the next billing cycle or visit genpbr.com for account options."
-                else:
-                    error_type = str(status_code)
-                    if not detailed_msg:
-                        detailed_msg = error_msg
+        if isinstance(job.error, jobs.JobCancelled):
+            self.report({'WARNING'}, "PBR map generation cancelled")
+            return {'CANCELLED'}
 
+        if isinstance(job.error, GenerationError):
+            error = job.error
+            if error.error_type:
                 # Store error info in properties for UI display
-                props.last_error_code = status_code
-                props.last_error_message = detailed_msg
-                props.last_error_type = error_type
-
-                self.report({'ERROR'}, error_msg)
-                wm.progress_end()
-                return {'CANCELLED'}
-            except requests.exceptions.RequestException as e:
-                print(f"[GenPBR Debug] Request exception: {e}")
-                # Store error info for network errors
-                props.last_error_code = 0
-                props.last_error_message = f"Network error: {str(e)}"
-                props.last_error_type = "Network"
-                self.report({'ERROR'}, f"API request failed: {e}")
-                wm.progress_end()
-                return {'CANCELLED'}
-            except Exception as e:
-                print(f"[GenPBR Debug] Unexpected error: {type(e).__name__}: {e}")
-                import traceback
-                print(f"[GenPBR Debug] Traceback: {traceback.format_exc()}")
-                # Store error info for unexpected errors
-                props.last_error_code = 0
-                props.last_error_message = f"Unexpected error: {str(e)}"
-                props.last_error_type = "Unexpected"
-                self.report({'ERROR'}, f"API request failed: {e}")
-                wm.progress_end()
-                return {'CANCELLED'}
-
-            wm.progress_update(30)
-
-            # Parse response
-            try:
-                print("[GenPBR Debug] Parsing response...")
-                data = response.json()
-                print(f"[GenPBR Debug] Response keys: {list(data.keys())}")
-
-                if not data.get("success", False):
-                    error_msg = data.get("message", "Unknown error")
-                    print(f"[GenPBR Debug] API returned error: {error_msg}")
-                    print(f"[GenPBR Debug] Full response data: {data}")
-                    # Store error info
-                    props.last_error_code = 0
-                    props.last_error_message = error_msg
-                    props.last_error_type = "API Error"
-                    self.report({'ERROR'}, f"API returned error: {error_msg}")
-                    wm.progress_end()
-                    return {'CANCELLED'}
-
-                # Clear previous errors on successful response
-                props.last_error_code = 0
-                props.last_error_message = ""
-                props.last_error_type = ""
-
-                textures = data.get("textures", {})
-                print(f"[GenPBR Debug] Received texture types: {list(textures.keys())}")
-
-                # Store usage stats from API response
-                if "usage" in data:
-                    print(f"[GenPBR Debug] Usage info: {data['usage']}")
-                    usage = data["usage"]
-                    # Store usage stats
-                    props.usage_remaining_quota = usage.get("remainingQuota", 0)
-                    props.usage_tier = usage.get("tier", "")
-                    props.usage_monthly_quota = usage.get("monthlyQuota", 0)
-                    props.usage_rate_limit = usage.get("rateLimit", 0)
-                    # Store free regeneration flag from usage
-                    if "isFreeRegeneration" in usage:
-                        props.is_free_regeneration = usage["isFreeRegeneration"]
-
-                # Also check metadata for free regeneration (in case usage doesn't have it)
-                if "metadata" in data:
-                    print(f"[GenPBR Debug] Metadata: {data['metadata']}")
-                    if "isFreeRegeneration" in data["metadata"]:
-                        props.is_free_regeneration = data["metadata"]["isFreeRegeneration"]
+                props.last_error_code = error.error_code
+                props.last_error_message = error.detailed_msg
+                props.last_error_type = error.error_type
+            self.report({'ERROR'}, str(error))
+            return {'CANCELLED'}
 
-            except Exception as e:
-                print(f"[GenPBR Debug] Failed to parse response: {e}")
-                print(f"[GenPBR Debug] Response text: {response.text[:500]}")
-                self.report({'ERROR'}, f"Failed to parse API response: {e}")
-                wm.progress_end()
-                return {'CANCELLED'}
+        if job.error is not None:
+            e = job.error
+            logger.error("Unexpected error: %s: %s", type(e).__name__, e, exc_info=e)
+            # Store error info for unexpected errors
+            props.last_error_code = 0
+            props.last_error_message = f"Unexpected error: {str(e)}"
+            props.last_error_type = "Unexpected"
+            self.report({'ERROR'}, f"API request failed: {e}")
+            return {'CANCELLED'}
+
+        try:
+            self._apply_result(context, job.result)
+        except Exception as e:
+            # Catch any unexpected errors while building the material
+            logger.exception("Unexpected error in execute: %s: %s", type(e).__name__, e)
+            self.report({'ERROR'}, f"Unexpected error: {e}")
+            return {'CANCELLED'}
+
+        if not job.result["maps"] and job.result.get("reused"):
+            self.report({'INFO'}, "PBR maps are up to date")
+        elif job.result.get("cached"):
+            self.report({'INFO'}, "PBR maps loaded from cache")
+        elif job.result.get("shared"):
+            self.report({'INFO'}, "PBR maps shared with an identical running generation")
+        else:
+            self.report({'INFO'}, "PBR maps generated successfully!")
+        return {'FINISHED'}
+
+    def _apply_result(self, context, result):
+        props = context.scene.genpbr_props
 
-            wm.progress_update(40)
+        # Clear previous errors on successful response
+        props.last_error_code = 0
+        props.last_error_message = ""
+        props.last_error_type = ""
 
-            # Batch decode all textures to temp files first (faster I/O)
-            temp_dir = tempfile.gettempdir()
-            temp_files = {}
+        store_usage(props, result)
+        props.last_retry_count = result.get("retries", 0)
 
-            try:
-                for tex_type, data_url in textures.items():
-                    # Extract and decode base64 data
-                    if data_url.startswith('data:'):
-                        base64_data = data_url.split(',', 1)[1]
-                    else:
-                        base64_data = data_url
+        for warning in result.get("warnings", []):
+            self.report({'WARNING'}, warning)
 
-                    image_bytes = base64.b64decode(base64_data)
-                    temp_path = os.path.join(temp_dir, f"genpbr_{tex_type}.png")
+        # The object may have been deselected while the request was running
+        obj = bpy.data.objects.get(self._object_name) or context.object
+        if obj is None:
+            raise RuntimeError("Target object no longer exists")
 
-                    # Write all files in batch
-                    with open(temp_path, "wb") as f:
-                        f.write(image_bytes)
+        mat = obj.active_material
+        if not mat:
+            mat = bpy.data.materials.new(name="GenPBR_Material")
+            obj.active_material = mat
 
-                    temp_files[tex_type] = temp_path
+        if not result["maps"]:
+            return
 
-            except Exception as e:
-                self.report({'WARNING'}, f"Failed to decode textures: {e}")
-
-            wm.progress_update(60)
-
-            # Download maps and apply to active material
-            mat = context.object.active_material
-            if not mat:
-                mat = bpy.data.materials.new(name="GenPBR_Material")
-                context.object.active_material = mat
-            mat.use_nodes = True
-            nodes = mat.node_tree.nodes
-            links = mat.node_tree.links
-
-            # Clear existing nodes
-            nodes.clear()
-
-            # Create Principled BSDF
-            output_node = nodes.new(type='ShaderNodeOutputMaterial')
-            output_node.location = (400, 0)
-            bsdf_node = nodes.new(type='ShaderNodeBsdfPrincipled')
-            bsdf_node.location = (0, 0)
-            links.new(bsdf_node.outputs['BSDF'], output_node.inputs['Surface'])
-
-            # Load base image as albedo (since API doesn't return albedo separately)
-            albedo_node = None
+        for warning in materials.build_pbr_material(mat, self._base_texture_path, result["maps"], self._trace,
+                                          _get_map_directory(props)):
+            self.report({'WARNING'}, warning)
+        materials.store_map_record(mat, generation.applied_map_keys(result))
+
+
+def _previous_keys(props, textures):
+    """Map keys every material of each base texture already has, or None when all maps are requested."""
+    if not props.skip_unchanged_maps:
+        return None
+    return {path: materials.shared_map_record([bpy.data.materials.get(name) for name in names])
+            for path, names in textures.items()}
+
+
+class PBRBatchGenerateOperator(_BackgroundJobMixin, bpy.types.Operator):
+    bl_idname = "pbr.batch_generate_maps"
+    bl_label = "Batch Generate PBR Maps"
+    bl_description = "Generate PBR maps for the base textures of every material slot on all selected objects"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    _textures = None
+    # Job queue batch recording this run (None if the queue is unavailable)
+    _queue = None
+    _batch_id = None
+
+    def _prepare(self, context):
+        """
+        Collect the unique base textures of all selected objects.
+
+        Returns:
+            dict: keyword arguments for generation.batch_generate_worker, or None if validation failed
+        """
+        props = context.scene.genpbr_props
+        prefs = _get_prefs(context)
+        api_key = prefs.api_key.strip() if prefs.api_key else ""
+
+        if not api_key:
+            self.report({'ERROR'}, "Please enter your API key in the Add-on preferences")
+            return None
+
+        if not context.selected_objects:
+            self.report({'ERROR'}, "Please select at least one object")
+            return None
+
+        texture_types = _collect_texture_types(props)
+        if not texture_types:
+            self.report({'ERROR'}, "Please select at least one texture type to generate")
+            return None
+
+        trace = timing.RunTrace(f"Batch {len(context.selected_objects)} objects")
+        with trace.stage("material lookup"):
+            textures = sceneindex.get_index().textures_for_objects(context.selected_objects)
+        if not textures:
+            self.report({'ERROR'}, "No base textures found in the materials of the selected objects")
+            return None
+
+        if not self._check_online() or not self._check_map_storage(props):
+            return None
+
+        _seed_rate_limiter(props)
+
+        self._textures = textures
+        self._trace = trace
+
+        options = _collect_options(props)
+        # Record the batch before sending anything so it can be resumed after a crash
+        self._queue = self._batch_id = None
+        try:
+            self._queue = _get_job_queue(prefs)
+            self._batch_id = self._queue.create_batch(bpy.data.filepath, textures, texture_types, options,
+                                                      props.tiled_generation)
+        except jobqueue.QUEUE_ERRORS as e:
+            logger.warning("Job queue unavailable, this batch cannot be resumed: %s", e)
+            self._queue = None
+
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Batch: %d unique textures for %d materials",
+                        len(textures), sum(len(m) for m in textures.values()))
+
+        return self._request(prefs, api_key, textures, texture_types, options, props.tiled_generation,
+                             _previous_keys(props, textures))
+
+    def _request(self, prefs, api_key, textures, texture_types, options, tiled, previous_keys):
+        """
+        Keyword arguments for generation.batch_generate_worker.
+
+        Images that need Blender to re-encode them are re-encoded here, on the
+        main thread; textures that cannot be read are dropped from the batch.
+        """
+        upload_budget = _get_upload_budget(prefs)
+        upload_sources = {}
+        for path in list(textures):
             try:
-                base_img = bpy.data.images.load(props.base_texture_path)
-                base_img.name = "Albedo"
-                base_img.colorspace_settings.name = 'sRGB'
-                # Pack image into blend file for undo safety
-                base_img.pack()
-                albedo_node = nodes.new('ShaderNodeTexImage')
-                albedo_node.image = base_img
-                albedo_node.label = "Albedo"
-                albedo_node.location = (-400, 0)
-                links.new(albedo_node.outputs['Color'], bsdf_node.inputs['Base Color'])
+                with self._trace.stage("read/compress"):
+                    source = _encode_on_main_thread(path, upload_budget)
             except Exception as e:
-                self.report({'WARNING'}, f"Failed to load base image as albedo: {e}")
+                self.report({'WARNING'}, f"Skipped {os.path.basename(path)}: failed to read image file: {e}")
+                del textures[path]
+                continue
+            if source is not None:
+                upload_sources[path] = source
+
+        return {
+            "api_key": api_key,
+            "textures": textures,
+            "texture_types": texture_types,
+            "options": options,
+            "max_workers": prefs.batch_max_workers,
+            "cache": _get_map_cache(prefs),
+            "retry_policy": _get_retry_policy(prefs),
+            "trace": self._trace,
+            "upload_budget": upload_budget,
+            "tiled": tiled,
+            "previous_keys": previous_keys,
+            "on_result": _queue_recorder(self._queue, self._batch_id) if self._queue is not None else None,
+            "upload_sources": upload_sources,
+        }
 
-            # Track y position for node placement (200 units spacing)
-            y = -200
+    def execute(self, context):
+        request = self._prepare(context)
+        if request is None:
+            return {'CANCELLED'}
+        return self._run_sync(context, jobs.GenerationJob(generation.batch_generate_worker, **request))
 
-            # Load AO map and connect it to multiply with base color
-            if "ao" in temp_files:
-                try:
-                    img = bpy.data.images.load(temp_files["ao"])
-                    img.name = "Ambient Occlusion"
-                    img.colorspace_settings.name = 'Non-Color'
-                    # Pack image into blend file for undo safety
-                    img.pack()
-
-                    ao_node = nodes.new('ShaderNodeTexImage')
-                    ao_node.image = img
-                    ao_node.label = "Ambient Occlusion"
-                    ao_node.location = (-400, y)
-
-                    # Create a MixRGB node to multiply AO with the base color
-                    mix_node = nodes.new(type='ShaderNodeMixRGB')
-                    mix_node.blend_type = 'MULTIPLY'
-                    mix_node.location = (-200, y)
-                    mix_node.inputs['Fac'].default_value = 1.0
-
-                    # Reconnect albedo through the mix node if albedo exists
-                    if albedo_node:
-                        # Remove existing albedo to BSDF link
-                        for link in list(links):
-                            if link.to_socket == bsdf_node.inputs['Base Color']:
-                                links.remove(link)
-                                break
-
-                        # Connect albedo and AO through mix node
-                        links.new(albedo_node.outputs['Color'], mix_node.inputs['Color1'])
-                        links.new(ao_node.outputs['Color'], mix_node.inputs['Color2'])
-                        links.new(mix_node.outputs['Color'], bsdf_node.inputs['Base Color'])
-                    else:
-                        # If no albedo, just connect AO directly (though this is unusual)
-                        links.new(ao_node.outputs['Color'], bsdf_node.inputs['Base Color'])
-
-                    y -= 200
-                except Exception as e:
-                    self.report({'WARNING'}, f"Failed to load AO map: {e}")
+    def invoke(self, context, event):
+        if not _get_prefs(context).async_generation:
+            return self.execute(context)
 
-            # Load metallic map
-            if "metallic" in temp_files:
-                try:
-                    img = bpy.data.images.load(temp_files["metallic"])
-                    img.name = "Metallic"
-                    img.colorspace_settings.name = 'Non-Color'
-                    # Pack image into blend file for undo safety
-                    img.pack()
-
-                    node = nodes.new('ShaderNodeTexImage')
-                    node.image = img
-                    node.label = "Metallic"
-                    node.location = (-400, y)
-                    links.new(node.outputs['Color'], bsdf_node.inputs['Metallic'])
-                    y -= 200
-                except Exception as e:
-                    self.report({'WARNING'}, f"Failed to load metallic map: {e}")
+        if jobs.get_active_job() is not None:
+            self.report({'WARNING'}, "A PBR generation is already running")
+            return {'CANCELLED'}
 
-            # Load roughness map
-            if "roughness" in temp_files:
+        request = self._prepare(context)
+        if request is None:
+            return {'CANCELLED'}
+        return self._start_modal(context, jobs.GenerationJob(generation.batch_generate_worker, **request))
+
+    def _apply_results(self, context, results):
+        """
+        Build the materials using each base texture from its result.
+
+        Args:
+            results: Dict of base texture path -> worker result
+
+        Returns:
+            int: Number of materials updated
+        """
+        map_directory = _get_map_directory(context.scene.genpbr_props)
+        applied = 0
+        for path, result in results.items():
+            if not result["maps"]:
+                continue
+            for material_name in self._textures.get(path, []):
+                mat = bpy.data.materials.get(material_name)
+                if mat is None:
+                    continue
                 try:
-                    img = bpy.data.images.load(temp_files["roughness"])
-                    img.name = "Roughness"
-                    img.colorspace_settings.name = 'Non-Color'
-                    # Pack image into blend file for undo safety
-                    img.pack()
-
-                    node = nodes.new('ShaderNodeTexImage')
-                    node.image = img
-                    node.label = "Roughness"
-                    node.location = (-400, y)
-                    links.new(node.outputs['Color'], bsdf_node.inputs['Roughness'])
-                    y -= 200
+                    for warning in materials.build_pbr_material(mat, path, result["maps"], self._trace,
+                                                                map_directory):
+                        self.report({'WARNING'}, f"{material_name}: {warning}")
+                    materials.store_map_record(mat, generation.applied_map_keys(result))
+                    applied += 1
                 except Exception as e:
-                    self.report({'WARNING'}, f"Failed to load roughness map: {e}")
+                    self.report({'WARNING'}, f"{material_name}: Failed to build material: {e}")
+        return applied
 
-            # Load normal map
-            if "normal" in temp_files:
-                try:
-                    img = bpy.data.images.load(temp_files["normal"])
-                    img.name = "Normal Map"
-                    img.colorspace_settings.name = 'Non-Color'
-                    # Pack image into blend file for undo safety
-                    img.pack()
-
-                    node = nodes.new('ShaderNodeTexImage')
-                    node.image = img
-                    node.label = "Normal Map"
-                    node.location = (-400, y)
-
-                    normal_node = nodes.new(type='ShaderNodeNormalMap')
-                    normal_node.location = (-200, y)
-                    links.new(node.outputs['Color'], normal_node.inputs['Color'])
-                    links.new(normal_node.outputs['Normal'], bsdf_node.inputs['Normal'])
-                    y -= 200
-                except Exception as e:
-                    self.report({'WARNING'}, f"Failed to load normal map: {e}")
+    def _mark_applied(self, paths):
+        if self._queue is None:
+            return
+        try:
+            self._queue.mark_applied(self._batch_id, paths)
+        except jobqueue.QUEUE_ERRORS as e:
+            logger.warning("Failed to update the job queue: %s", e)
 
-            # Clear any previous errors on successful generation
-            props.last_error_code = 0
-            props.last_error_message = ""
-            props.last_error_type = ""
+    def _finish_job(self, context, job):
+        props = context.scene.genpbr_props
+        resumable = " (resume it from the GenPBR panel)" if self._queue is not None else ""
 
-            wm.progress_update(100)
-            self.report({'INFO'}, "PBR maps generated successfully!")
-            wm.progress_end()
-            return {'FINISHED'}
+        if isinstance(job.error, jobs.JobCancelled):
+            self.report({'WARNING'}, f"Batch generation cancelled{resumable}")
+            return {'CANCELLED'}
 
-        except Exception as e:
-            # Catch any unexpected errors and ensure progress bar is closed
-            print(f"[GenPBR Debug] Unexpected error in execute: {type(e).__name__}: {e}")
-            import traceback
-            print(f"[GenPBR Debug] Traceback: {traceback.format_exc()}")
-            self.report({'ERROR'}, f"Unexpected error: {e}")
-            wm.progress_end()
+        if job.error is not None:
+            self.report({'ERROR'}, f"Batch generation failed: {job.error}{resumable}")
+            return {'CANCELLED'}
+
+        batch = job.result
+        retries = 0
+        for result in batch["results"].values():
+            store_usage(props, result)
+            retries += result.get("retries", 0)
+        applied = self._apply_results(context, batch["results"])
+        self._mark_applied(list(batch["results"]))
+
+        # Surface the last API error in the panel like a single generation would
+        for error in batch["errors"].values():
+            if isinstance(error, GenerationError) and error.error_type:
+                props.last_error_code = error.error_code
+                props.last_error_message = error.detailed_msg
+                props.last_error_type = error.error_type
+
+        succeeded = len(batch["results"])
+        cached = sum(1 for result in batch["results"].values() if result.get("cached"))
+        shared = sum(1 for result in batch["results"].values() if result.get("shared"))
+        up_to_date = sum(1 for result in batch["results"].values() if not result["maps"] and result.get("reused"))
+        total = succeeded + len(batch["errors"])
+        elapsed = batch["elapsed"]
+        throughput = succeeded / elapsed * 60 if elapsed > 0 else 0.0
+        summary = (f"{succeeded}/{total} textures ({cached} cached, {shared} shared, {up_to_date} up to date, {retries} retries), "
+                   f"{applied} materials in {elapsed:.1f}s ({throughput:.1f} textures/min)")
+        props.last_retry_count = retries
+        props.last_batch_summary = summary
+        logger.info("Batch finished: %s", summary)
+
+        if batch["errors"]:
+            self.report({'WARNING'}, f"Batch finished with {len(batch['errors'])} failures{resumable}: {summary}")
+        else:
+            self.report({'INFO'}, f"Batch finished: {summary}")
+        return {'FINISHED'} if succeeded else {'CANCELLED'}
+
+
+class PBRResumeBatchOperator(PBRBatchGenerateOperator):
+    bl_idname = "pbr.resume_batch"
+    bl_label = "Resume Interrupted Batch"
+    bl_description = ("Apply the maps an interrupted batch already received, without calling the API again, "
+                      "and generate the textures it did not finish")
+    bl_options = {'REGISTER', 'UNDO'}
+
+    # Returned when _prepare yields no request
+    _stopped = {'CANCELLED'}
+
+    def _prepare(self, context):
+        """
+        Re-apply the stored results of the open file's interrupted batch and
+        collect the textures it still has to generate.
+
+        Returns:
+            dict: keyword arguments for generation.batch_generate_worker, or None if
+            nothing is left to generate (_stopped is then FINISHED) or validation failed
+        """
+        props = context.scene.genpbr_props
+        prefs = _get_prefs(context)
+        api_key = prefs.api_key.strip() if prefs.api_key else ""
+        self._stopped = {'CANCELLED'}
+
+        try:
+            self._queue = _get_job_queue(prefs)
+            batch = self._queue.interrupted_batch(bpy.data.filepath)
+        except jobqueue.QUEUE_ERRORS as e:
+            self.report({'ERROR'}, f"Job queue unavailable: {e}")
+            return None
+        if batch is None:
+            self.report({'ERROR'}, "No interrupted batch to resume")
+            return None
+        self._batch_id = batch["id"]
+
+        if batch["to_generate"]:
+            if not api_key:
+                self.report({'ERROR'}, "Please enter your API key in the Add-on preferences")
+                return None
+            if not self._check_online():
+                return None
+        if not self._check_map_storage(props):
+            return None
+
+        self._trace = timing.RunTrace("Resume batch")
+        try:
+            reapplied = self._reapply_stored(context)
+            textures = self._queue.incomplete_textures(self._batch_id)
+        except jobqueue.QUEUE_ERRORS as e:
+            self.report({'ERROR'}, f"Failed to read the job queue: {e}")
+            return None
+
+        if not textures:
+            self.report({'INFO'}, f"Batch resumed: applied the stored maps of {reapplied} textures")
+            self._stopped = {'FINISHED'}
+            return None
+        if reapplied:
+            self.report({'INFO'}, f"Applied the stored maps of {reapplied} textures, generating {len(textures)} more")
+
+        _seed_rate_limiter(props)
+        self._textures = textures
+        logger.info("Resuming batch %d: %d textures to generate", self._batch_id, len(textures))
+        return self._request(prefs, api_key, textures, batch["texture_types"], batch["options"], batch["tiled"],
+                             _previous_keys(props, textures))
+
+    def _reapply_stored(self, context):
+        """Apply the maps the batch received before it was interrupted; returns the number of textures."""
+        stored = self._queue.stored_results(self._batch_id)
+        self._textures = {path: names for path, names, _job_id in stored}
+        for path, _names, job_id in stored:
+            # One texture's maps in memory at a time
+            self._apply_results(context, {path: self._queue.load_result(job_id)})
+        self._mark_applied([path for path, _names, _job_id in stored])
+        # Applied maps are now this session's; they are done once the file is saved
+        self._queue.claim(self._batch_id)
+        return len(stored)
+
+    def execute(self, context):
+        request = self._prepare(context)
+        if request is None:
+            schedule_interrupted_batch_refresh()
+            return self._stopped
+        return self._run_sync(context, jobs.GenerationJob(generation.batch_generate_worker, **request))
+
+    def invoke(self, context, event):
+        if jobs.get_active_job() is not None:
+            self.report({'WARNING'}, "A PBR generation is already running")
+            return {'CANCELLED'}
+
+        request = self._prepare(context)
+        if request is None:
+            schedule_interrupted_batch_refresh()
+            return self._stopped
+        job = jobs.GenerationJob(generation.batch_generate_worker, **request)
+        if not _get_prefs(context).async_generation:
+            return self._run_sync(context, job)
+        return self._start_modal(context, job)
+
+
+class PBRDiscardBatchOperator(bpy.types.Operator):
+    bl_idname = "pbr.discard_batch"
+    bl_label = "Discard Interrupted Batch"
+    bl_description = "Forget the interrupted batch and the maps it stored"
+
+    def execute(self, context):
+        try:
+            queue = _get_job_queue(_get_prefs(context))
+            batch = queue.interrupted_batch(bpy.data.filepath)
+            if batch is not None:
+                queue.discard(batch["id"])
+        except jobqueue.QUEUE_ERRORS as e:
+            self.report({'ERROR'}, f"Failed to update the job queue: {e}")
             return {'CANCELLED'}
+        schedule_interrupted_batch_refresh()
+        return {'FINISHED'}
 
+    def invoke(self, context, event):
+        return context.window_manager.invoke_confirm(self, event)
+
+
+# Path of the .blend file before the current save, to follow Save As
+_saving_from = None
+
+
+@persistent
+def _on_save_pre(*args):
+    global _saving_from
+    _saving_from = bpy.data.filepath
+
+
+@persistent
+def _on_save_post(*args):
+    # Applied maps are now in the saved file and no longer need to be kept
+    try:
+        queue = _existing_job_queue(_get_prefs(bpy.context))
+        if queue is not None:
+            queue.mark_saved(bpy.data.filepath, _saving_from)
+    except (jobqueue.QUEUE_ERRORS + (KeyError,)) as e:
+        logger.warning("Failed to update the job queue: %s", e)
+    schedule_interrupted_batch_refresh()
+
+
+@persistent
+def _on_load_post(*args):
+    try:
+        queue = _existing_job_queue(_get_prefs(bpy.context))
+        if queue is not None:
+            queue.prune()
+    except (jobqueue.QUEUE_ERRORS + (KeyError,)) as e:
+        logger.warning("Failed to prune the job queue: %s", e)
+    schedule_interrupted_batch_refresh()
+
+
+def register():
+    if _on_save_pre not in bpy.app.handlers.save_pre:
+        bpy.app.handlers.save_pre.append(_on_save_pre)
+    if _on_save_post not in bpy.app.handlers.save_post:
+        bpy.app.handlers.save_post.append(_on_save_post)
+    if _on_load_post not in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.append(_on_load_post)
+    schedule_interrupted_batch_refresh()
+
+
+def unregister():
+    if _on_save_pre in bpy.app.handlers.save_pre:
+        bpy.app.handlers.save_pre.remove(_on_save_pre)
+    if _on_save_post in bpy.app.handlers.save_post:
+        bpy.app.handlers.save_post.remove(_on_save_post)
+    if _on_load_post in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.remove(_on_load_post)
+    if bpy.app.timers.is_registered(_refresh_interrupted_batch):
+        bpy.app.timers.unregister(_refresh_interrupted_batch)
@@ -1,5 +1,14 @@
 import bpy
 
+try:
+    from . import log
+except ImportError:
+    import log
+
+
+def _update_log_level(self, context):
+    log.set_verbosity(self.log_level)
+
 
 class GenPBRPreferences(bpy.types.AddonPreferences):
     # Get the root package name (addon name)
@@ -12,8 +21,81 @@ class GenPBRPreferences(bpy.types.AddonPreferences):
         subtype='PASSWORD'
     )
 
+    async_generation: bpy.props.BoolProperty(
+        name="Generate in Background",
+        description="Run API requests on a worker thread so Blender stays responsive during generation",
+        default=True
+    )
+
+    batch_max_workers: bpy.props.IntProperty(
+        name="Batch Workers",
+        description="Maximum number of concurrent API requests during batch and tiled generation",
+        default=4,
+        min=1,
+        max=16
+    )
+
+    max_retries: bpy.props.IntProperty(
+        name="Max Retries",
+        description="How often to retry a request after rate limiting (429), gateway errors (502/503/504) or connection resets",
+        default=3,
+        min=0,
+        max=10
+    )
+
+    upload_budget_mb: bpy.props.FloatProperty(
+        name="Upload Size Budget (MB)",
+        description="Largest upload per texture. Bigger or uncompressed (BMP/TIFF) images are re-encoded at the highest quality that fits",
+        default=5.0,
+        min=0.5,
+        max=5.0,
+        precision=1
+    )
+
+    use_cache: bpy.props.BoolProperty(
+        name="Cache Generated Maps",
+        description="Reuse previously generated maps for identical images and settings instead of calling the API again",
+        default=True
+    )
+
+    cache_directory: bpy.props.StringProperty(
+        name="Cache Directory",
+        description="Folder for cached maps (leave empty for the default Blender user data folder)",
+        default="",
+        subtype='DIR_PATH'
+    )
+
+    cache_max_size_mb: bpy.props.IntProperty(
+        name="Cache Size Limit (MB)",
+        description="Least recently used maps are deleted when the cache grows beyond this size",
+        default=1024,
+        min=16
+    )
+
+    log_level: bpy.props.EnumProperty(
+        name="Log Level",
+        description="How much GenPBR writes to the system console",
+        items=log.VERBOSITY_ITEMS,
+        default=log.DEFAULT_VERBOSITY,
+        update=_update_log_level
+    )
+
     def draw(self, context):
         layout = self.layout
         layout.label(text="Enter your GenPBR API key:")
         layout.prop(self, "api_key")
+        layout.prop(self, "async_generation")
+        layout.prop(self, "batch_max_workers")
+        layout.prop(self, "max_retries")
+        layout.prop(self, "upload_budget_mb")
+
+        box = layout.box()
+        box.prop(self, "use_cache")
+        col = box.column()
+        col.enabled = self.use_cache
+        col.prop(self, "cache_directory")
+        col.prop(self, "cache_max_size_mb")
+        col.operator("pbr.clear_cache", icon='TRASH')
+
+        layout.prop(self, "log_level")
 
@@ -86,6 +86,37 @@ class GenPBRProperties(bpy.types.PropertyGroup):
         precision=1
     )
 
+    # Output resolution
+    tiled_generation: bpy.props.BoolProperty(
+        name="Full Resolution (Tiled)",
+        description="Generate textures larger than 2048px as overlapping tiles and blend them into full-resolution maps. Each tile is a separate API request",
+        default=False
+    )
+
+    skip_unchanged_maps: bpy.props.BoolProperty(
+        name="Only Changed Maps",
+        description="Only request the map types whose image or settings changed since they were last applied to the material",
+        default=True
+    )
+
+    # Where generated maps are kept
+    map_storage: bpy.props.EnumProperty(
+        name="Map Storage",
+        description="Where generated maps are stored",
+        items=[
+            ('PACK', "Pack", "Pack generated maps into the .blend file"),
+            ('EXTERNAL', "External Files", "Save generated maps as PNG files in the map folder"),
+        ],
+        default='PACK'
+    )
+
+    map_directory: bpy.props.StringProperty(
+        name="Map Folder",
+        description="Folder for generated maps when they are stored as external files (// is relative to the .blend file)",
+        default="//textures/",
+        subtype='DIR_PATH'
+    )
+
     # Usage stats (from API response)
     usage_remaining_quota: bpy.props.IntProperty(
         name="Remaining Quota",
@@ -117,6 +148,12 @@ class GenPBRProperties(bpy.types.PropertyGroup):
         default=False
     )
 
+    last_retry_count: bpy.props.IntProperty(
+        name="Retries",
+        description="Number of automatic retries needed by the last generation",
+        default=0
+    )
+
     # Error tracking
     last_error_code: bpy.props.IntProperty(
         name="Last Error Code",
@@ -135,3 +172,37 @@ class GenPBRProperties(bpy.types.PropertyGroup):
         description="Type of the last error (401, 400, 429, 402, etc.)",
         default=""
     )
+
+    # Background generation state (driven by the modal generate operator)
+    is_generating: bpy.props.BoolProperty(
+        name="Generating",
+        description="Whether a PBR generation is currently running",
+        default=False
+    )
+
+    generation_progress: bpy.props.FloatProperty(
+        name="Progress",
+        description="Progress of the running generation",
+        default=0.0,
+        min=0.0,
+        max=100.0,
+        subtype='PERCENTAGE'
+    )
+
+    generation_status: bpy.props.StringProperty(
+        name="Status",
+        description="Current stage of the running generation",
+        default=""
+    )
+
+    last_batch_summary: bpy.props.StringProperty(
+        name="Last Batch",
+        description="Summary and throughput of the last batch generation",
+        default=""
+    )
+
+    last_timing_summary: bpy.props.StringProperty(
+        name="Last Timing",
+        description="Total time and slowest stages of the last generation",
+        default=""
+    )
@@ -0,0 +1,112 @@
+import threading
+import time
+
+
+class QuotaExhausted(Exception):
+    """Raised when the locally tracked remaining quota is used up."""
+
+
+class TokenBucket:
+    """
+    Client-side token bucket pacing requests to the API's reported rate limit.
+
+    Tokens refill continuously at rate_per_minute / 60 per second up to
+    `burst`. Callers reserve a token and sleep until it is due, so concurrent
+    workers are spread evenly over the allowed rate instead of bursting into
+    429 responses. A rate of 0 means the limit is unknown and nothing is paced.
+
+    The remaining monthly quota is tracked as well so a batch stops locally once
+    the quota is used up instead of spending requests on 402 responses. Each
+    request reserves one unit of it, which is given back (refund) if the request
+    fails, so only successful responses are charged.
+    """
+
+    def __init__(self, rate_per_minute=0, burst=1, remaining_quota=None):
+        self._lock = threading.Lock()
+        self._rate_per_minute = 0
+        self._burst = max(1, burst)
+        self._tokens = float(self._burst)
+        self._last_refill = time.monotonic()
+        self._blocked_until = 0.0
+        self._remaining_quota = None
+        self.configure(rate_per_minute, remaining_quota)
+
+    @property
+    def rate_per_minute(self):
+        return self._rate_per_minute
+
+    @property
+    def remaining_quota(self):
+        return self._remaining_quota
+
+    def configure(self, rate_per_minute, remaining_quota=None):
+        """
+        Set the rate limit (requests/minute, 0 = unknown) and the remaining quota
+        (None = unknown, nothing is enforced).
+
+        Called with the values stored from the last API response before a job starts,
+        and with every new usage report while a job runs.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self._rate_per_minute = max(0, rate_per_minute or 0)
+            self._remaining_quota = None if remaining_quota is None else max(0, remaining_quota)
+
+    def update_from_usage(self, usage):
+        """Re-seed the bucket from an API response's usage dict."""
+        if not usage:
+            return
+        remaining = usage.get("remainingQuota") if usage.get("monthlyQuota") else None
+        self.configure(usage.get("rateLimit", self._rate_per_minute), remaining)
+
+    def penalize(self, seconds):
+        """Pause all callers for the given time (e.g. after a 429 with Retry-After)."""
+        with self._lock:
+            now = time.monotonic()
+            self._blocked_until = max(self._blocked_until, now + seconds)
+            self._tokens = min(self._tokens, 0.0)
+            self._last_refill = now
+
+    def _refill(self, now):
+        if self._rate_per_minute > 0:
+            elapsed = now - self._last_refill
+            self._tokens = min(float(self._burst), self._tokens + elapsed * self._rate_per_minute / 60.0)
+        else:
+            self._tokens = float(self._burst)
+        self._last_refill = now
+
+    def reserve(self):
+        """
+        Reserve one request slot.
+
+        Returns:
+            float: Seconds the caller has to wait before sending
+
+        Raises:
+            QuotaExhausted: If the tracked remaining quota is zero
+        """
+        with self._lock:
+            if self._remaining_quota is not None:
+                if self._remaining_quota <= 0:
+                    raise QuotaExhausted()
+                self._remaining_quota -= 1
+
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= 1.0
+            wait = 0.0
+            if self._tokens < 0 and self._rate_per_minute > 0:
+                wait = -self._tokens * 60.0 / self._rate_per_minute
+            return max(wait, self._blocked_until - now)
+
+    def refund(self):
+        """Give back the quota reserved for a request that did not succeed."""
+        with self._lock:
+            if self._remaining_quota is not None:
+                self._remaining_quota += 1
+
+    def acquire(self, sleep=time.sleep):
+        """Block (using `sleep`) until a request may be sent."""
+        wait = self.reserve()
+        if wait > 0:
+            sleep(wait)
@@ -0,0 +1,305 @@
+"""
+Scene-wide index of base textures: image file -> materials -> objects.
+
+The index is built by one pass over bpy.data.materials and bpy.data.objects
+(every material slot, local and linked-library data alike) and kept up to
+date from depsgraph updates: the handler only notes which materials and
+objects changed, and the next query re-indexes just those. Queries by
+texture, material or object are dictionary lookups.
+
+Materials and objects are keyed by name_full, which tells linked-library
+data apart from local data with the same name. Base textures are keyed by
+normalized absolute path, like utils.collect_material_textures; by_hash()
+groups the paths by file content.
+"""
+import os
+
+import bpy
+from bpy.app.handlers import persistent
+
+try:
+    from . import lookup
+    from . import upload
+except ImportError:
+    import lookup
+    import upload
+
+
+def _normalize(path):
+    return os.path.normcase(os.path.abspath(path))
+
+
+def _data_key(id_data):
+    """Key of an ID for bpy.data collections: the name, plus the library path for linked data."""
+    if id_data.library is None:
+        return id_data.name
+    return id_data.name, id_data.library.filepath
+
+
+class TextureIndex:
+    """Base texture, material and object index of the open .blend file."""
+
+    def __init__(self):
+        # Material name_full -> base texture path (None if it has none)
+        self._texture_of = {}
+        # Base texture path -> set of material name_full
+        self._materials_of = {}
+        # Material name_full -> set of object name_full
+        self._objects_of = {}
+        # Object name_full -> set of material name_full in its slots
+        self._slots_of = {}
+        # Material name_full -> bpy.data.materials key
+        self._material_keys = {}
+        # ID pointer -> name_full when indexed, to follow renames
+        self._names = {}
+        # Base texture path -> (size, mtime, SHA-256 of the file)
+        self._hashes = {}
+
+        # Changes noted by the depsgraph handler, applied by the next query
+        self._stale = True
+        self._counts = None
+        self._textures_dirty = False
+        self._dirty_materials = {}
+        self._dirty_objects = {}
+
+    # -- Change tracking ---------------------------------------------------
+
+    def invalidate(self):
+        """Rebuild the whole index on the next query."""
+        self._stale = True
+
+    def note_updates(self, updates):
+        """Record the IDs changed by a depsgraph update (see _on_depsgraph_update)."""
+        if self._stale:
+            return
+        for update in updates:
+            id_data = update.id.original
+            if isinstance(id_data, bpy.types.Material):
+                self._dirty_materials[id_data.as_pointer()] = _data_key(id_data)
+            elif isinstance(id_data, bpy.types.Object):
+                self._dirty_objects[id_data.as_pointer()] = _data_key(id_data)
+            elif isinstance(id_data, (bpy.types.NodeTree, bpy.types.Image)):
+                # Node groups and images can be shared by many materials
+                self._textures_dirty = True
+
+    def _refresh(self):
+        counts = (len(bpy.data.materials), len(bpy.data.objects))
+        if self._stale or counts != self._counts:
+            self._rebuild()
+            return
+
+        if self._textures_dirty:
+            for mat in bpy.data.materials:
+                self._index_material(mat)
+        elif self._dirty_materials:
+            if not self._apply_dirty(self._dirty_materials, bpy.data.materials, self._index_material):
+                return
+        if self._dirty_objects:
+            if not self._apply_dirty(self._dirty_objects, bpy.data.objects, self._index_object):
+                return
+        self._textures_dirty = False
+        self._dirty_materials.clear()
+        self._dirty_objects.clear()
+
+    def _apply_dirty(self, dirty, collection, index):
+        for pointer, data_key in dirty.items():
+            id_data = collection.get(data_key)
+            if id_data is None or id_data.as_pointer() != pointer:
+                # Renamed again or removed since the update was noted
+                self._rebuild()
+                return False
+            index(id_data)
+        return True
+
+    def _rebuild(self):
+        self._texture_of.clear()
+        self._materials_of.clear()
+        self._objects_of.clear()
+        self._slots_of.clear()
+        self._material_keys.clear()
+        self._names.clear()
+        for mat in bpy.data.materials:
+            self._index_material(mat)
+        for obj in bpy.data.objects:
+            self._index_object(obj)
+        self._stale = False
+        self._counts = (len(bpy.data.materials), len(bpy.data.objects))
+        self._textures_dirty = False
+        self._dirty_materials.clear()
+        self._dirty_objects.clear()
+
+    def _rename(self, id_data):
+        """name_full of an ID, moving its entries over if it was renamed since it was indexed."""
+        name = id_data.name_full
+        pointer = id_data.as_pointer()
+        old_name = self._names.get(pointer)
+        self._names[pointer] = name
+        if old_name is None or old_name == name:
+            return name, None
+        return name, old_name
+
+    def _index_material(self, mat):
+        name, old_name = self._rename(mat)
+        self._material_keys[name] = _data_key(mat)
+        if old_name is not None:
+            self._material_keys.pop(old_name, None)
+            self._unlink_texture(old_name)
+            objects = self._objects_of.pop(old_name, set())
+            self._objects_of[name] = objects
+            for obj_name in objects:
+                slots = self._slots_of.get(obj_name)
+                if slots is not None:
+                    slots.discard(old_name)
+                    slots.add(name)
+
+        self._unlink_texture(name)
+        texture_path = lookup.get_base_texture(None, mat)
+        if texture_path and os.path.isfile(texture_path):
+            texture_path = _normalize(texture_path)
+            self._materials_of.setdefault(texture_path, set()).add(name)
+        else:
+            texture_path = None
+        self._texture_of[name] = texture_path
+
+    def _unlink_texture(self, name):
+        texture_path = self._texture_of.pop(name, None)
+        materials = self._materials_of.get(texture_path)
+        if materials is not None:
+            materials.discard(name)
+            if not materials:
+                del self._materials_of[texture_path]
+
+    def _index_object(self, obj):
+        name, old_name = self._rename(obj)
+        for mat_name in self._slots_of.pop(old_name or name, ()):
+            self._objects_of.get(mat_name, set()).discard(old_name or name)
+
+        slots = {slot.material.name_full for slot in getattr(obj, "material_slots", ()) if slot.material}
+        self._slots_of[name] = slots
+        for mat_name in slots:
+            self._objects_of.setdefault(mat_name, set()).add(name)
+
+    # -- Queries -----------------------------------------------------------
+
+    def texture_paths(self):
+        """All base texture paths in the file."""
+        self._refresh()
+        return list(self._materials_of)
+
+    def counts(self):
+        """(number of base textures, number of materials using one)."""
+        self._refresh()
+        return len(self._materials_of), sum(len(materials) for materials in self._materials_of.values())
+
+    def texture_of(self, material_name):
+        """Base texture path of a material (by name_full), or None."""
+        self._refresh()
+        return self._texture_of.get(material_name)
+
+    def materials_of(self, texture_path):
+        """name_full of the materials using a base texture."""
+        self._refresh()
+        return set(self._materials_of.get(_normalize(texture_path), ()))
+
+    def objects_of(self, material_name):
+        """name_full of the objects with a material (by name_full) in a slot."""
+        self._refresh()
+        return set(self._objects_of.get(material_name, ()))
+
+    def objects_of_texture(self, texture_path):
+        """name_full of the objects using a base texture through any of its materials."""
+        self._refresh()
+        objects = set()
+        for mat_name in self._materials_of.get(_normalize(texture_path), ()):
+            objects.update(self._objects_of.get(mat_name, ()))
+        return objects
+
+    def material(self, material_name):
+        """The material with a name_full, or None."""
+        self._refresh()
+        data_key = self._material_keys.get(material_name)
+        return bpy.data.materials.get(data_key) if data_key is not None else None
+
+    def textures_for_objects(self, objects):
+        """
+        Base textures of every material slot on the given objects.
+        Linked-library materials are left out, as they cannot be edited.
+
+        Returns:
+            dict: Base texture path -> list of material names using it
+        """
+        self._refresh()
+        textures = {}
+        seen = set()
+        for obj in objects:
+            for mat_name in self._slots_of.get(obj.name_full, ()):
+                texture_path = self._texture_of.get(mat_name)
+                # Linked materials have a (name, library) data key
+                if texture_path is None or mat_name in seen or not isinstance(self._material_keys.get(mat_name), str):
+                    continue
+                seen.add(mat_name)
+                textures.setdefault(texture_path, []).append(mat_name)
+        return textures
+
+    def by_hash(self):
+        """
+        Base texture paths grouped by file content.
+
+        File hashes are kept until a file's size or modification time changes.
+
+        Returns:
+            dict: SHA-256 of the file -> list of base texture paths with that content
+        """
+        self._refresh()
+        groups = {}
+        for texture_path in self._materials_of:
+            try:
+                stat = os.stat(texture_path)
+            except OSError:
+                continue
+            entry = self._hashes.get(texture_path)
+            if entry is None or entry[:2] != (stat.st_size, stat.st_mtime):
+                entry = (stat.st_size, stat.st_mtime, upload.hash_source(texture_path))
+                self._hashes[texture_path] = entry
+            groups.setdefault(entry[2], []).append(texture_path)
+        return groups
+
+
+_index = TextureIndex()
+
+
+def get_index():
+    return _index
+
+
+@persistent
+def _on_depsgraph_update(scene, depsgraph):
+    _index.note_updates(depsgraph.updates)
+
+
+@persistent
+def _on_reload(*args):
+    # Files loaded and undo steps replace the data the index points to
+    _index.invalidate()
+
+
+_RELOAD_HANDLERS = ("load_post", "undo_post", "redo_post")
+
+
+def register():
+    if _on_depsgraph_update not in bpy.app.handlers.depsgraph_update_post:
+        bpy.app.handlers.depsgraph_update_post.append(_on_depsgraph_update)
+    for name in _RELOAD_HANDLERS:
+        handlers = getattr(bpy.app.handlers, name)
+        if _on_reload not in handlers:
+            handlers.append(_on_reload)
+
+
+def unregister():
+    if _on_depsgraph_update in bpy.app.handlers.depsgraph_update_post:
+        bpy.app.handlers.depsgraph_update_post.remove(_on_depsgraph_update)
+    for name in _RELOAD_HANDLERS:
+        handlers = getattr(bpy.app.handlers, name)
+        if _on_reload in handlers:
+            handlers.remove(_on_reload)
+    _index.invalidate()
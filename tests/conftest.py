@@ -0,0 +1,92 @@
+"""
+Shared fixtures. The tests import the add-on's bpy-free modules directly
+from the add-on folder, like the benchmarks do.
+"""
+import http.server
+import json
+import os
+import sys
+import threading
+
+import pytest
+
+ADDON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ADDON_DIR)
+
+
+class StubServer:
+    """
+    Threaded HTTP server answering POSTs with scripted responses.
+
+    Each request takes the next (status, payload, headers) from `responses`;
+    the last one is repeated once the script runs out. The headers and body of
+    every request are kept in `requests`; with keep_bodies off the body is read
+    in small chunks and only its length is kept, so a test can measure the
+    client's memory.
+    """
+
+    def __init__(self):
+        self.responses = []
+        self.requests = []
+        self.keep_bodies = True
+        self._lock = threading.Lock()
+        self._httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="GenPBR-stub", daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._httpd.server_port}/api/v1"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _next_response(self, headers, body):
+        with self._lock:
+            self.requests.append((headers, body))
+            if len(self.responses) > 1:
+                return self.responses.pop(0)
+            return self.responses[0]
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                if server.keep_bodies:
+                    body = self.rfile.read(length)
+                else:
+                    body = 0
+                    while body < length:
+                        body += len(self.rfile.read(min(65536, length - body)))
+                status, payload, headers = server._next_response(dict(self.headers), body)
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+@pytest.fixture
+def stub_server():
+    server = StubServer().start()
+    try:
+        yield server
+    finally:
+        server.stop()
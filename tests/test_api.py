@@ -0,0 +1,69 @@
+import pytest
+
+import api
+
+
+OK = (200, {"success": True, "textures": {"normal": "data:image/png;base64,"},
+            "usage": {"monthlyQuota": 100, "remainingQuota": 41, "rateLimit": 0}}, {})
+UNAVAILABLE = (503, {"success": False, "message": "Service Unavailable"}, {})
+BASE_DELAY = 0.01
+
+
+def _generate(server, policy, client=None):
+    client = client or api.GenPBRClient(base_url=server.url)
+    retries = []
+    sleeps = []
+    try:
+        data = client.generate_texture("key", b"image", "image/png", ["normal"], {}, retry_policy=policy,
+                                       on_retry=lambda number, delay, reason: retries.append((number, delay, reason)),
+                                       sleep=sleeps.append)
+    finally:
+        client.close()
+    return data, retries, sleeps
+
+
+def test_retries_rate_limit_then_unavailable(stub_server):
+    stub_server.responses = [
+        (429, {"success": False, "message": "Too Many Requests"}, {"Retry-After": "2"}),
+        UNAVAILABLE,
+        OK,
+    ]
+    policy = api.RetryPolicy(max_retries=3, base_delay=BASE_DELAY)
+
+    data, retries, sleeps = _generate(stub_server, policy)
+
+    assert data["success"]
+    assert len(stub_server.requests) == 3
+    assert [(number, reason) for number, _delay, reason in retries] == [(1, "HTTP 429"), (2, "HTTP 503")]
+    # Retry-After wins over the backoff; the second retry backs off base_delay * 2 ** 1 with jitter
+    assert 2.0 <= retries[0][1] <= 2.0 + 0.1 * BASE_DELAY
+    assert BASE_DELAY <= retries[1][1] <= 2 * BASE_DELAY
+    # Each backoff was slept; the 429 also held back the rate limiter for about as long
+    assert retries[0][1] in sleeps and retries[1][1] in sleeps
+    assert all(delay <= retries[0][1] for delay in sleeps)
+
+
+def test_gives_up_after_max_retries(stub_server):
+    stub_server.responses = [UNAVAILABLE]
+    policy = api.RetryPolicy(max_retries=2, base_delay=BASE_DELAY)
+
+    with pytest.raises(api.GenerationError) as excinfo:
+        _generate(stub_server, policy)
+
+    assert excinfo.value.error_code == 503
+    assert len(stub_server.requests) == 3
+
+
+def test_quota_charged_only_for_success(stub_server):
+    stub_server.responses = [UNAVAILABLE, UNAVAILABLE]
+    client = api.GenPBRClient(base_url=stub_server.url)
+    client.rate_limiter.configure(0, remaining_quota=5)
+
+    with pytest.raises(api.GenerationError):
+        _generate(stub_server, api.RetryPolicy(max_retries=1, base_delay=BASE_DELAY), client)
+    assert client.rate_limiter.remaining_quota == 5
+
+    stub_server.responses = [OK]
+    _generate(stub_server, api.NO_RETRY, client)
+    # Re-seeded from the usage the server reported
+    assert client.rate_limiter.remaining_quota == 41
@@ -0,0 +1,88 @@
+import os
+
+import cache
+
+
+def _key(name):
+    return cache.make_cache_key(name, ["normal"], {})
+
+
+def _use(map_cache, key, when):
+    """Set the last-use time of an entry."""
+    manifest = os.path.join(map_cache._entry_dir(key), cache.MANIFEST_NAME)
+    os.utime(manifest, (when, when))
+
+
+def test_make_cache_key():
+    assert cache.make_cache_key("h", ["normal", "ao"], {"a": 1, "b": 2}) == \
+        cache.make_cache_key("h", ["ao", "normal"], {"b": 2, "a": 1})
+    assert cache.make_cache_key("h", ["normal"], {}) != cache.make_cache_key("h", ["normal"], {"a": 1})
+    assert cache.make_cache_key("h", ["normal"], {}) != cache.make_cache_key("other", ["normal"], {})
+
+
+def test_put_and_get(tmp_path):
+    map_cache = cache.MapCache(str(tmp_path), 0)
+    key = _key("a")
+
+    paths = map_cache.put(key, {"normal": b"n", "ao": b"o"})
+
+    assert map_cache.get(key, ["normal", "ao"]) == paths
+    with open(paths["ao"], "rb") as f:
+        assert f.read() == b"o"
+    assert map_cache.get(key, ["normal", "roughness"]) is None
+    assert map_cache.get(_key("b"), ["normal"]) is None
+
+
+def test_evicts_least_recently_used(tmp_path):
+    map_cache = cache.MapCache(str(tmp_path), 0)
+    keys = [_key(name) for name in "abc"]
+    for age, key in enumerate(keys):
+        map_cache.put(key, {"normal": b"x" * 1000})
+        _use(map_cache, key, 1000 + age)
+    # "a" was used last
+    _use(map_cache, keys[0], 2000)
+    entry_size = map_cache.size_bytes() // 3
+
+    # Room for three entries (manifests differ by a few bytes)
+    map_cache.max_bytes = 3 * entry_size + entry_size // 2
+    new_key = _key("d")
+    map_cache.put(new_key, {"normal": b"x" * 1000})
+
+    assert map_cache.get(keys[1], ["normal"]) is None
+    assert all(map_cache.get(key, ["normal"]) for key in (keys[0], keys[2], new_key))
+    assert map_cache.size_bytes() <= map_cache.max_bytes
+
+
+def test_eviction_keeps_the_new_entry(tmp_path):
+    map_cache = cache.MapCache(str(tmp_path), 0)
+    old_key = _key("old")
+    map_cache.put(old_key, {"normal": b"x" * 100})
+
+    # Over the cap on its own: everything else goes, but the entry just stored stays
+    map_cache.max_bytes = 1000
+    key = _key("big")
+    map_cache.put(key, {"normal": b"x" * 5000})
+
+    assert map_cache.get(key, ["normal"]) is not None
+    assert map_cache.get(old_key, ["normal"]) is None
+
+
+def test_clear_keeps_other_files(tmp_path):
+    map_cache = cache.MapCache(str(tmp_path), 0)
+    keys = [_key(name) for name in "ab"]
+    for key in keys:
+        map_cache.put(key, {"normal": b"x"})
+    # Things that are not cache entries, including look-alikes
+    (tmp_path / "jobs.sqlite").write_bytes(b"queue")
+    (tmp_path / "user_stuff" / "x").mkdir(parents=True)
+    (tmp_path / "user_stuff" / "x" / cache.MANIFEST_NAME).write_text("{}")
+    (tmp_path / keys[0][:2] / "notes").mkdir()
+    (tmp_path / keys[0][:2] / "notes" / cache.MANIFEST_NAME).write_text("{}")
+
+    map_cache.clear()
+
+    assert all(map_cache.get(key, ["normal"]) is None for key in keys)
+    assert map_cache.size_bytes() == 0
+    assert sorted(os.listdir(tmp_path)) == sorted([keys[0][:2], "jobs.sqlite", "user_stuff"])
+    assert os.listdir(tmp_path / keys[0][:2]) == ["notes"]
+    assert (tmp_path / "user_stuff" / "x" / cache.MANIFEST_NAME).exists()
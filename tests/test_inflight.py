@@ -0,0 +1,91 @@
+import threading
+
+import pytest
+
+import inflight
+import jobs
+
+
+def _start(target, *args):
+    outcome = {}
+
+    def run():
+        try:
+            outcome["result"] = target(*args)
+        except BaseException as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread, outcome
+
+
+def test_concurrent_callers_share_one_call():
+    requests = inflight.InFlightRequests()
+    callers = 5
+    waiting = threading.Semaphore(0)
+    calls = []
+
+    def compute():
+        calls.append(threading.current_thread())
+        # Hold the request open until every other caller is waiting on it
+        for _ in range(callers - 1):
+            assert waiting.acquire(timeout=5)
+        return {"maps": "shared"}
+
+    threads = [_start(requests.run, "key", jobs.GenerationJob(None), compute, waiting.release)
+               for _ in range(callers)]
+    for thread, _outcome in threads:
+        thread.join(5)
+
+    outcomes = [outcome for _thread, outcome in threads]
+    assert len(calls) == 1
+    assert all(outcome["result"][0] == {"maps": "shared"} for outcome in outcomes)
+    assert sorted(outcome["result"][1] for outcome in outcomes) == [False] + [True] * (callers - 1)
+    # The entry is gone once the leader finished: the next caller runs its own request
+    assert requests.run("key", jobs.GenerationJob(None), lambda: "again") == ("again", False)
+
+
+def test_waiter_takes_over_from_cancelled_leader():
+    requests = inflight.InFlightRequests()
+    leader_job = jobs.GenerationJob(None)
+    waiter_job = jobs.GenerationJob(None)
+    leader_started = threading.Event()
+    waiter_waiting = threading.Event()
+
+    def lead():
+        leader_started.set()
+        assert waiter_waiting.wait(5)
+        leader_job.cancel()
+        leader_job.check_cancelled()
+
+    leader, leader_outcome = _start(requests.run, "key", leader_job, lead)
+    assert leader_started.wait(5)
+    waiter, waiter_outcome = _start(requests.run, "key", waiter_job, lambda: "own result", waiter_waiting.set)
+    leader.join(5)
+    waiter.join(5)
+
+    assert isinstance(leader_outcome["error"], jobs.JobCancelled)
+    assert waiter_outcome["result"] == ("own result", False)
+
+
+def test_waiters_get_the_leaders_error():
+    requests = inflight.InFlightRequests()
+    leader_started = threading.Event()
+    waiter_waiting = threading.Event()
+
+    def fail():
+        leader_started.set()
+        assert waiter_waiting.wait(5)
+        raise RuntimeError("server error")
+
+    leader, leader_outcome = _start(requests.run, "key", jobs.GenerationJob(None), fail)
+    assert leader_started.wait(5)
+    waiter, waiter_outcome = _start(requests.run, "key", jobs.GenerationJob(None),
+                                    lambda: pytest.fail("the waiter must not send its own request"),
+                                    waiter_waiting.set)
+    leader.join(5)
+    waiter.join(5)
+
+    assert str(leader_outcome["error"]) == "server error"
+    assert waiter_outcome["error"] is leader_outcome["error"]
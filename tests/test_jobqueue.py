@@ -0,0 +1,95 @@
+import jobqueue
+
+
+BLEND = "/projects/library.blend"
+TEXTURES = {"/tex/a.png": ["A"], "/tex/b.png": ["B1", "B2"], "/tex/c.png": ["C"]}
+
+
+def _result(tag):
+    return {"maps": {"normal": b"normal " + tag, "roughness": b"rough " + tag}, "image_hash": "hash-" + tag.decode(),
+            "usage": {"remainingQuota": 9}, "warnings": [], "retries": 1}
+
+
+def _queue(tmp_path):
+    return jobqueue.JobQueue(str(tmp_path / "cache" / jobqueue.QUEUE_NAME))
+
+
+def test_batch_lifecycle(tmp_path):
+    queue = _queue(tmp_path)
+    batch_id = queue.create_batch(BLEND, TEXTURES, ["normal", "roughness"], {"strength": 1}, tiled=True)
+
+    batch = queue.interrupted_batch(BLEND)
+    assert batch == {"id": batch_id, "texture_types": ["normal", "roughness"], "options": {"strength": 1},
+                     "tiled": True, "to_generate": 3, "to_apply": 0}
+    assert queue.incomplete_textures(batch_id) == TEXTURES
+
+    # Interrupted after one texture came back and one failed
+    queue.record_result(batch_id, "/tex/a.png", _result(b"a"))
+    queue.record_failure(batch_id, "/tex/b.png", RuntimeError("HTTP 503"))
+    batch = queue.interrupted_batch(BLEND)
+    assert (batch["to_generate"], batch["to_apply"]) == (2, 1)
+    assert queue.incomplete_textures(batch_id) == {"/tex/b.png": ["B1", "B2"], "/tex/c.png": ["C"]}
+
+    (path, names, job_id), = queue.stored_results(batch_id)
+    assert (path, names) == ("/tex/a.png", ["A"])
+    assert queue.load_result(job_id) == _result(b"a")
+
+    # Resumed: the stored maps are applied and the rest is generated
+    queue.mark_applied(batch_id, ["/tex/a.png"])
+    queue.record_result(batch_id, "/tex/b.png", _result(b"b"))
+    queue.record_result(batch_id, "/tex/c.png", _result(b"c"))
+    queue.mark_applied(batch_id, ["/tex/b.png", "/tex/c.png"])
+    # Applied by this session, so only unsaved: nothing to resume
+    assert queue.interrupted_batch(BLEND) is None
+    assert queue.stored_results(batch_id) == []
+
+    # Saving finishes the batch and drops it
+    queue.mark_saved(BLEND)
+    assert queue.incomplete_textures(batch_id) == {}
+    assert queue._execute(lambda conn: conn.execute("SELECT COUNT(*) FROM batches").fetchone()[0]) == 0
+
+
+def test_applied_jobs_of_a_lost_session_are_applied_again(tmp_path, monkeypatch):
+    queue = _queue(tmp_path)
+    batch_id = queue.create_batch(BLEND, {"/tex/a.png": ["A"]}, ["normal"], {}, tiled=False)
+    queue.record_result(batch_id, "/tex/a.png", _result(b"a"))
+    queue.mark_applied(batch_id, ["/tex/a.png"])
+    assert queue.interrupted_batch(BLEND) is None
+
+    # Blender quit before the file was saved
+    monkeypatch.setattr(jobqueue, "SESSION_ID", "next session")
+    queue._interrupted.clear()
+    batch = queue.interrupted_batch(BLEND)
+    assert (batch["to_generate"], batch["to_apply"]) == (0, 1)
+    assert [path for path, _names, _job_id in queue.stored_results(batch_id)] == ["/tex/a.png"]
+
+    queue.claim(batch_id)
+    assert queue.interrupted_batch(BLEND) is None
+
+
+def test_save_as_moves_the_batch(tmp_path):
+    queue = _queue(tmp_path)
+    queue.create_batch(BLEND, {"/tex/a.png": ["A"]}, ["normal"], {}, tiled=False)
+
+    queue.mark_saved("/projects/copy.blend", previous_file=BLEND)
+
+    assert queue.interrupted_batch(BLEND) is None
+    assert queue.interrupted_batch("/projects/copy.blend")["to_generate"] == 1
+
+
+def test_discard_and_prune(tmp_path):
+    queue = _queue(tmp_path)
+    first = queue.create_batch(BLEND, {"/tex/a.png": ["A"]}, ["normal"], {}, tiled=False)
+    second = queue.create_batch(BLEND, {"/tex/b.png": ["B"]}, ["normal"], {}, tiled=False)
+    queue.record_result(second, "/tex/b.png", _result(b"b"))
+
+    # The most recent batch with work left comes first
+    assert queue.interrupted_batch(BLEND)["id"] == second
+    queue.discard(second)
+    assert queue.interrupted_batch(BLEND)["id"] == first
+    assert queue._execute(lambda conn: conn.execute("SELECT COUNT(*) FROM maps").fetchone()[0]) == 0
+
+    queue.prune(max_age=3600)
+    assert queue.interrupted_batch(BLEND)["id"] == first
+    queue.prune(max_age=-1)
+    assert queue.interrupted_batch(BLEND) is None
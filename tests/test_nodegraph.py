@@ -0,0 +1,166 @@
+import itertools
+
+import nodegraph
+
+
+_pointers = itertools.count(1)
+
+
+class Socket:
+    def __init__(self, name, socket_type="RGBA", identifier=None):
+        self.name = name
+        self.type = socket_type
+        self.identifier = identifier or name
+
+
+class Sockets(list):
+    """Node inputs, looked up by index or by name like bpy_prop_collection."""
+
+    def get(self, name):
+        return next((socket for socket in self if socket.name == name), None)
+
+
+class Node:
+    def __init__(self, node_type, name, inputs=(), image=None, node_tree=None, is_active_output=True):
+        self.type = node_type
+        self.name = name
+        self.inputs = Sockets(socket if isinstance(socket, Socket) else Socket(socket) for socket in inputs)
+        self.image = image
+        self.node_tree = node_tree
+        self.is_active_output = is_active_output
+
+    def __repr__(self):
+        return self.name
+
+
+class Link:
+    def __init__(self, from_node, from_identifier, to_node, to_name, is_muted=False):
+        self.from_node = from_node
+        self.from_socket = Socket(from_identifier)
+        self.to_node = to_node
+        self.to_socket = to_node.inputs.get(to_name)
+        self.is_muted = is_muted
+
+
+class Tree:
+    def __init__(self, name="Tree"):
+        self.name = name
+        self.nodes = []
+        self.links = []
+        self._pointer = next(_pointers)
+
+    def add(self, *args, **kwargs):
+        node = Node(*args, **kwargs)
+        self.nodes.append(node)
+        return node
+
+    def image(self, name, image="img"):
+        return self.add('TEX_IMAGE', name, inputs=[Socket("Vector", "VECTOR")], image=image)
+
+    def link(self, from_node, to_node, to_name, from_identifier="Color", **kwargs):
+        self.links.append(Link(from_node, from_identifier, to_node, to_name, **kwargs))
+
+    def as_pointer(self):
+        return self._pointer
+
+
+def _material_tree():
+    tree = Tree()
+    output = tree.add('OUTPUT_MATERIAL', "Output", inputs=[Socket("Surface", "SHADER")])
+    bsdf = tree.add('BSDF_PRINCIPLED', "BSDF", inputs=["Base Color", Socket("Roughness", "VALUE")])
+    tree.link(bsdf, output, "Surface", "BSDF")
+    return tree, bsdf
+
+
+def _search(tree, bsdf, graphs=None):
+    graph = nodegraph.graph_for(tree, graphs)
+    base_color = bsdf.inputs.get("Base Color")
+    return list(nodegraph.find_image_nodes(graph, bsdf, base_color.identifier, graphs))
+
+
+def test_principled_bsdf_follows_the_active_output():
+    tree, bsdf = _material_tree()
+    spare = tree.add('BSDF_PRINCIPLED', "Spare", inputs=["Base Color"])
+    tree.nodes.remove(spare)
+    tree.nodes.insert(0, spare)
+
+    assert nodegraph.NodeGraph(tree).principled_bsdf() is bsdf
+
+
+def test_mix_inputs_in_order_and_factor_ignored():
+    tree, bsdf = _material_tree()
+    mix = tree.add('MIX_RGB', "Mix", inputs=[Socket("Fac", "VALUE"), "Color1", "Color2"])
+    first, second, factor = tree.image("First"), tree.image("Second"), tree.image("Factor")
+    tree.link(factor, mix, "Fac")
+    tree.link(second, mix, "Color2")
+    tree.link(first, mix, "Color1")
+    tree.link(mix, bsdf, "Base Color")
+
+    assert _search(tree, bsdf) == [first, second]
+
+
+def test_priority_inputs_beat_shorter_secondary_paths():
+    tree, bsdf = _material_tree()
+    node = tree.add('CURVE_RGB', "Curves", inputs=["Color", Socket("Detail", "RGBA")])
+    reroutes = [tree.add('REROUTE', f"Reroute {i}", inputs=["Input"]) for i in range(3)]
+    primary, secondary = tree.image("Primary"), tree.image("Secondary")
+    tree.link(secondary, node, "Detail")
+    tree.link(primary, reroutes[0], "Input")
+    tree.link(reroutes[0], reroutes[1], "Input", "Output")
+    tree.link(reroutes[1], reroutes[2], "Input", "Output")
+    tree.link(reroutes[2], node, "Color", "Output")
+    tree.link(node, bsdf, "Base Color")
+
+    assert _search(tree, bsdf) == [primary, secondary]
+
+
+def test_muted_links_and_empty_image_nodes_are_skipped():
+    tree, bsdf = _material_tree()
+    mix = tree.add('MIX', "Mix", inputs=["A", "B"])
+    muted, empty, used = tree.image("Muted"), tree.image("Empty", image=None), tree.image("Used")
+    tree.link(muted, mix, "A", is_muted=True)
+    tree.link(empty, mix, "A")
+    tree.link(used, mix, "B")
+    tree.link(mix, bsdf, "Base Color", "Result")
+
+    assert _search(tree, bsdf) == [used]
+
+
+def test_cycles_end():
+    tree, bsdf = _material_tree()
+    a = tree.add('CURVE_RGB', "A", inputs=["Color"])
+    b = tree.add('CURVE_RGB', "B", inputs=["Color"])
+    tree.link(a, b, "Color")
+    tree.link(b, a, "Color")
+    tree.link(b, bsdf, "Base Color")
+
+    assert _search(tree, bsdf) == []
+
+
+def test_node_groups_are_entered_and_left():
+    inner = Tree("Group")
+    group_input = inner.add('GROUP_INPUT', "Group Input")
+    group_output = inner.add('GROUP_OUTPUT', "Group Output", inputs=["Tinted", "Passed"])
+    tint = inner.add('MIX_RGB', "Tint", inputs=["Color1", "Color2"])
+    inside = inner.image("Inside")
+    inner.link(inside, tint, "Color1")
+    inner.link(tint, group_output, "Tinted")
+    inner.link(group_input, group_output, "Passed", "Socket_In")
+
+    tree, bsdf = _material_tree()
+    mix = tree.add('MIX_RGB', "Mix", inputs=["Color1", "Color2"])
+    group = tree.add('GROUP', "Group", inputs=[Socket("In", identifier="Socket_In")], node_tree=inner)
+    outside = tree.image("Outside")
+    tree.link(outside, group, "In")
+    tree.link(group, mix, "Color1", "Passed")
+    tree.link(group, mix, "Color2", "Tinted")
+    tree.link(mix, bsdf, "Base Color")
+
+    graphs = {}
+    # Through the passed-through socket the search leaves the group again
+    assert _search(tree, bsdf, graphs) == [outside, inside]
+    # The group's graph was indexed once and is reused
+    assert set(graphs) == {tree.as_pointer(), inner.as_pointer()}
+    cached = graphs[inner.as_pointer()]
+    assert _search(tree, bsdf, graphs) == [outside, inside]
+    assert graphs[inner.as_pointer()] is cached
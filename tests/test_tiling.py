@@ -0,0 +1,67 @@
+from io import BytesIO
+
+import pytest
+
+import tiling
+
+pytestmark = pytest.mark.skipif(not tiling.HAS_TILING, reason="tiling needs Pillow and NumPy")
+
+if tiling.HAS_TILING:
+    import numpy as np
+    from PIL import Image
+
+TILE = 128
+OVERLAP = 32
+
+
+@pytest.mark.parametrize("length", [1, 128, 129, 200, 224, 225, 300, 1000, 4096])
+def test_plan_axis_covers_with_minimum_overlap(length):
+    spans = tiling.plan_axis(length, TILE, OVERLAP)
+
+    assert spans[0][0] == 0 and spans[-1][1] == length
+    assert all(end - start == min(length, TILE) for start, end in spans)
+    for (_start, end), (next_start, _end) in zip(spans, spans[1:]):
+        assert end - next_start >= OVERLAP
+    # One span fewer could not cover the axis with that overlap
+    count = len(spans)
+    assert count == 1 or (count - 1) * TILE - (count - 2) * OVERLAP < length
+
+
+def _png(pixels):
+    output = BytesIO()
+    Image.fromarray(pixels).save(output, format="PNG")
+    return output.getvalue()
+
+
+def _tiles(image, columns, rows):
+    return {(column_index, row_index): _png(image[y0:y1, x0:x1])
+            for column_index, (x0, x1) in enumerate(columns)
+            for row_index, (y0, y1) in enumerate(rows)}
+
+
+def _stitch(image, is_normal=False):
+    height, width = image.shape[:2]
+    columns, rows = tiling.plan_tiles(width, height, TILE, OVERLAP)
+    assert len(columns) > 1 and len(rows) > 1
+    data = tiling.stitch_map(_tiles(image, columns, rows), columns, rows, width, height, is_normal=is_normal)
+    with Image.open(BytesIO(data)) as img:
+        return np.asarray(img)
+
+
+def test_stitch_constant_map_is_exact():
+    image = np.full((300, 410, 3), (200, 90, 17), dtype=np.uint8)
+    np.testing.assert_array_equal(_stitch(image), image)
+
+
+def test_stitch_constant_normal_map_is_exact():
+    image = np.full((300, 410, 3), (128, 128, 255), dtype=np.uint8)
+    np.testing.assert_array_equal(_stitch(image, is_normal=True), image)
+
+
+def test_stitch_gradient_is_exact():
+    y, x = np.mgrid[0:300, 0:410]
+    image = ((x * 255) // 409).astype(np.uint8)
+    np.testing.assert_array_equal(_stitch(image), image)
+
+    image = np.stack([(x * 255) // 409, (y * 255) // 299, (x + y) % 256], axis=2).astype(np.uint8)
+    np.testing.assert_array_equal(_stitch(image), image)
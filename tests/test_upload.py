@@ -0,0 +1,107 @@
+import base64
+import json
+import os
+import tracemalloc
+
+import pytest
+import requests
+
+import upload
+
+
+FIELDS = {"textureTypes": ["normal", "roughness"], "options": {"strength": 0.5, "label": "café \"x\""}}
+
+
+def _expected(data, mime_type, fields):
+    """The body json.dumps would produce for the same request."""
+    data_url = f"data:{mime_type};base64," + base64.b64encode(data).decode("ascii")
+    return json.dumps(dict({"baseImage": data_url}, **fields), separators=(",", ":")).encode("utf-8")
+
+
+def _image_bytes(size):
+    return bytes((i * 7 + 3) % 256 for i in range(size))
+
+
+@pytest.mark.parametrize("size", [0, 1, 2, 3, 4, upload.CHUNK_SIZE - 1, upload.CHUNK_SIZE, 2 * upload.CHUNK_SIZE + 1])
+@pytest.mark.parametrize("fields", [FIELDS, {}], ids=["fields", "no-fields"])
+def test_body_matches_json_dumps(size, fields):
+    data = _image_bytes(size)
+    body = upload.StreamingJSONBody(data, "image/png", fields)
+
+    content = body.read()
+
+    assert content == _expected(data, "image/png", fields)
+    assert len(body) == len(content)
+    assert body.sent == len(content)
+
+
+def test_file_source_read_in_pieces(tmp_path):
+    data = _image_bytes(upload.CHUNK_SIZE + 5)
+    path = tmp_path / "base.png"
+    path.write_bytes(data)
+    progress = []
+    body = upload.StreamingJSONBody(str(path), "image/jpeg", FIELDS,
+                                    on_progress=lambda sent, total: progress.append((sent, total)))
+
+    pieces = []
+    while True:
+        piece = body.read(1000)
+        if not piece:
+            break
+        pieces.append(piece)
+
+    content = b"".join(pieces)
+    assert content == _expected(data, "image/jpeg", FIELDS)
+    assert progress[-1] == (len(content), len(body))
+    assert body.completed_at is not None
+
+
+def test_content_length_header(stub_server):
+    stub_server.responses = [(200, {"success": True}, {})]
+    data = _image_bytes(upload.CHUNK_SIZE + 1)
+    body = upload.StreamingJSONBody(data, "image/png", FIELDS)
+
+    requests.post(stub_server.url + "/generate-texture", data=body,
+                  headers={"Content-Type": "application/json"}, timeout=10).raise_for_status()
+
+    headers, received = stub_server.requests[0]
+    assert "Transfer-Encoding" not in headers
+    assert headers["Content-Length"] == str(len(body))
+    assert received == _expected(data, "image/png", FIELDS)
+
+
+def _peak_traced_memory(send):
+    tracemalloc.start()
+    try:
+        send()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_streaming_upload_memory(stub_server):
+    stub_server.responses = [(200, {"success": True}, {})]
+    stub_server.keep_bodies = False
+    data = os.urandom(6 * 1024 * 1024)
+    encoded_size = 4 * ((len(data) + 2) // 3)
+    url = stub_server.url + "/generate-texture"
+    headers = {"Content-Type": "application/json"}
+
+    def send_streamed():
+        body = upload.StreamingJSONBody(data, "image/png", FIELDS)
+        requests.post(url, data=body, headers=headers, timeout=30).raise_for_status()
+
+    def send_json():
+        # The request as it was built before streaming: the whole base64 string,
+        # then the whole JSON document
+        payload = dict({"baseImage": "data:image/png;base64," + base64.b64encode(data).decode("ascii")}, **FIELDS)
+        requests.post(url, json=payload, headers=headers, timeout=30).raise_for_status()
+
+    streamed_peak = _peak_traced_memory(send_streamed)
+    json_peak = _peak_traced_memory(send_json)
+
+    streamed_headers, received = stub_server.requests[0]
+    assert int(streamed_headers["Content-Length"]) == received == len(_expected(data, "image/png", FIELDS))
+    assert json_peak > 2 * encoded_size
+    # A few encoded chunks in flight, not the payload
+    assert streamed_peak < encoded_size / 4
@@ -0,0 +1,159 @@
+from io import BytesIO
+
+try:
+    from . import utils
+except ImportError:
+    import utils
+
+if utils.HAS_PIL:
+    from PIL import Image
+if utils.HAS_NUMPY:
+    import numpy as np
+
+
+# Largest tile edge the API accepts without downscaling
+TILE_SIZE = utils.MAX_UPLOAD_DIMENSION
+# Minimum overlap between neighbouring tiles; maps are cross-faded over it
+TILE_OVERLAP = 128
+
+# Tiled generation needs PIL to cut and decode tiles and NumPy to blend them
+HAS_TILING = utils.HAS_PIL and utils.HAS_NUMPY
+
+
+def plan_axis(length, tile_size=TILE_SIZE, overlap=TILE_OVERLAP):
+    """
+    Split one axis into the fewest evenly spaced spans of at most tile_size
+    that overlap by at least `overlap` pixels.
+
+    Returns:
+        list: (start, end) pixel spans
+    """
+    if length <= tile_size:
+        return [(0, length)]
+    count = -(-(length - overlap) // (tile_size - overlap))
+    step = (length - tile_size) / (count - 1)
+    return [(round(i * step), round(i * step) + tile_size) for i in range(count)]
+
+
+def plan_tiles(width, height, tile_size=TILE_SIZE, overlap=TILE_OVERLAP):
+    """
+    Plan the tiles for an image.
+
+    Returns:
+        tuple: (column spans, row spans) as returned by plan_axis; a tile is one
+        column span combined with one row span
+    """
+    return plan_axis(width, tile_size, overlap), plan_axis(height, tile_size, overlap)
+
+
+def needs_tiling(width, height, tile_size=TILE_SIZE):
+    return width > tile_size or height > tile_size
+
+
+def image_size(filepath):
+    """(width, height) of an image file, read from its header."""
+    with Image.open(filepath) as img:
+        return img.size
+
+
+def axis_weights(spans, length):
+    """
+    Feather weights of every span along one axis.
+
+    Each span ramps up linearly across its overlap with the previous span and
+    down across its overlap with the next one. The weights are normalized to sum
+    to 1 at every pixel, so the product of a column weight and a row weight is a
+    partition of unity in 2D and the blended image needs no weight buffer.
+
+    Returns:
+        list: One float32 array per span, covering that span
+    """
+    raw = np.zeros((len(spans), length), dtype=np.float32)
+    for index, (start, end) in enumerate(spans):
+        x = np.arange(start, end, dtype=np.float32) + 0.5
+        ramp = np.ones(end - start, dtype=np.float32)
+        if index > 0:
+            fade_in = spans[index - 1][1] - start
+            ramp = np.minimum(ramp, (x - start) / fade_in)
+        if index < len(spans) - 1:
+            fade_out = end - spans[index + 1][0]
+            ramp = np.minimum(ramp, (end - x) / fade_out)
+        raw[index, start:end] = ramp
+    raw /= raw.sum(axis=0)
+    return [raw[index, start:end] for index, (start, end) in enumerate(spans)]
+
+
+def crop_tile(image, column, row):
+    """Cut one tile out of a PIL image."""
+    return image.crop((column[0], row[0], column[1], row[1]))
+
+
+def _tile_pixels(data, size, channels):
+    """Decode a returned map tile to a float32 (height, width, channels) array in 0-1."""
+    with Image.open(BytesIO(data)) as img:
+        if img.size != size:
+            img = img.resize(size, Image.Resampling.BILINEAR)
+        if img.mode.startswith('I'):
+            pixels = np.asarray(img, dtype=np.float32) / 65535.0
+            pixels = pixels[..., None]
+            return np.repeat(pixels, channels, axis=2) if channels > 1 else pixels
+        img = img.convert('L' if channels == 1 else 'RGB')
+        pixels = np.asarray(img, dtype=np.float32) / 255.0
+    return pixels[..., None] if channels == 1 else pixels
+
+
+def _map_channels(data):
+    with Image.open(BytesIO(data)) as img:
+        return 1 if img.mode in ('1', 'L', 'LA', 'I', 'I;16', 'I;16B', 'I;16L', 'F') else 3
+
+
+def stitch_map(tiles, columns, rows, width, height, is_normal=False):
+    """
+    Blend the returned map tiles into one full-resolution map.
+
+    The output is built one tile row at a time. Only the band of the current
+    row plus the part overlapping the next row is kept in float32; finished rows
+    are written straight into the uint8 result. Normal maps are renormalized
+    after blending so the cross-faded vectors stay unit length.
+
+    Args:
+        tiles: Dict (column index, row index) -> encoded map bytes for that tile
+        columns, rows: Tile spans from plan_tiles
+        width, height: Size of the full map
+        is_normal: Whether the map is a tangent-space normal map
+
+    Returns:
+        bytes: The stitched map as PNG
+    """
+    channels = 3 if is_normal else _map_channels(tiles[(0, 0)])
+    column_weights = axis_weights(columns, width)
+    row_weights = axis_weights(rows, height)
+    result = np.empty((height, width, channels), dtype=np.uint8)
+
+    def finish(block, y0):
+        if is_normal:
+            vectors = block * 2.0 - 1.0
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=2, keepdims=True), 1e-6)
+            block = (vectors + 1.0) * 0.5
+        result[y0:y0 + block.shape[0]] = (np.clip(block, 0.0, 1.0) * 255.0 + 0.5).astype(np.uint8)
+
+    carry = None
+    for row_index, (y0, y1) in enumerate(rows):
+        band = np.zeros((y1 - y0, width, channels), dtype=np.float32)
+        if carry is not None:
+            band[:carry.shape[0]] += carry
+        row_weight = row_weights[row_index][:, None, None]
+        for column_index, (x0, x1) in enumerate(columns):
+            pixels = _tile_pixels(tiles[(column_index, row_index)], (x1 - x0, y1 - y0), channels)
+            pixels *= row_weight
+            pixels *= column_weights[column_index][None, :, None]
+            band[:, x0:x1] += pixels
+
+        # Rows before the next tile row starts receive no further contributions
+        done = (rows[row_index + 1][0] if row_index + 1 < len(rows) else y1) - y0
+        finish(band[:done], y0)
+        carry = band[done:] if done < band.shape[0] else None
+
+    output = BytesIO()
+    Image.fromarray(result[..., 0] if channels == 1 else result).save(output, format='PNG', compress_level=1)
+    return output.getvalue()
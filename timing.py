@@ -0,0 +1,192 @@
+import collections
+import contextlib
+import json
+import os
+import threading
+import time
+
+
+# Number of recent runs kept for the panel summary and trace export
+MAX_RECENT_RUNS = 32
+
+
+class RunTrace:
+    """
+    Timing record of one generation run.
+
+    Stages are recorded as spans of time.perf_counter() timestamps together with
+    the recording thread, so worker-thread and main-thread stages of the same run
+    end up in one trace. Byte counts and other numbers are kept as counters.
+    Safe to record from several threads at once.
+    """
+
+    def __init__(self, label):
+        self.label = label
+        self.wall_time = time.time()
+        self.start = time.perf_counter()
+        self.end = None
+        self.spans = []
+        self.counters = collections.Counter()
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def stage(self, name, **args):
+        """Time the enclosed block as a stage."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(name, t0, time.perf_counter(), **args)
+
+    def add_span(self, name, t0, t1, **args):
+        with self._lock:
+            self.spans.append((name, t0, t1, threading.get_ident(), args))
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def finish(self):
+        self.end = time.perf_counter()
+
+    @property
+    def duration(self):
+        return (self.end or time.perf_counter()) - self.start
+
+    def stage_totals(self):
+        """
+        Exclusive time per stage name in seconds.
+
+        Time spent in a span nested inside another span on the same thread is
+        only counted for the inner stage.
+        """
+        with self._lock:
+            spans = list(self.spans)
+
+        by_thread = collections.defaultdict(list)
+        for name, t0, t1, tid, _args in spans:
+            by_thread[tid].append((t0, -t1, name))
+
+        totals = collections.defaultdict(float)
+        for items in by_thread.values():
+            items.sort()
+            # Stack of open spans: [name, t0, t1, time spent in direct children]
+            stack = []
+            for t0, neg_t1, name in items:
+                t1 = -neg_t1
+                while stack and t0 >= stack[-1][2]:
+                    done = stack.pop()
+                    totals[done[0]] += (done[2] - done[1]) - done[3]
+                if stack:
+                    stack[-1][3] += t1 - t0
+                stack.append([name, t0, t1, 0.0])
+            while stack:
+                done = stack.pop()
+                totals[done[0]] += (done[2] - done[1]) - done[3]
+        return dict(totals)
+
+    def summary(self, limit=4):
+        """Short text such as '8.4s: server wait 5.1s, upload 1.2s, ...'."""
+        totals = sorted(self.stage_totals().items(), key=lambda item: item[1], reverse=True)
+        parts = [f"{name} {seconds:.1f}s" for name, seconds in totals[:limit] if seconds >= 0.05]
+        text = f"{self.duration:.1f}s"
+        if parts:
+            text += ": " + ", ".join(parts)
+        if self.counters.get("retries"):
+            text += f" ({self.counters['retries']} retries)"
+        return text
+
+    def to_chrome_events(self, pid):
+        """Convert to Chrome trace 'complete' events (timestamps in microseconds)."""
+        with self._lock:
+            spans = list(self.spans)
+            counters = dict(self.counters)
+        base = self.start
+        events = [{
+            "name": self.label,
+            "ph": "X",
+            "pid": pid,
+            "tid": 0,
+            "ts": 0,
+            "dur": round(self.duration * 1e6),
+            "args": {"counters": counters, "wall_time": self.wall_time},
+        }]
+        thread_ids = {}
+        for name, t0, t1, tid, args in spans:
+            events.append({
+                "name": name,
+                "ph": "X",
+                "pid": pid,
+                "tid": thread_ids.setdefault(tid, len(thread_ids) + 1),
+                "ts": round((t0 - base) * 1e6),
+                "dur": round((t1 - t0) * 1e6),
+                "args": args,
+            })
+        events.append({"name": "process_name", "ph": "M", "pid": pid, "args": {"name": self.label}})
+        return events
+
+
+class NullTrace:
+    """Stand-in used when a caller does not collect timings; every method is a no-op."""
+
+    label = ""
+
+    def stage(self, name, **args):
+        return contextlib.nullcontext()
+
+    def add_span(self, name, t0, t1, **args):
+        pass
+
+    def count(self, name, amount=1):
+        pass
+
+    def finish(self):
+        pass
+
+
+NULL_TRACE = NullTrace()
+
+
+_recent_runs = collections.deque(maxlen=MAX_RECENT_RUNS)
+_recent_lock = threading.Lock()
+
+
+def record_run(trace):
+    """Finish a trace and add it to the ring buffer of recent runs."""
+    if trace.end is None:
+        trace.finish()
+    with _recent_lock:
+        _recent_runs.append(trace)
+
+
+def recent_runs():
+    with _recent_lock:
+        return list(_recent_runs)
+
+
+def clear_runs():
+    with _recent_lock:
+        _recent_runs.clear()
+
+
+def export_chrome_trace(filepath, runs=None):
+    """
+    Write runs (default: all recent runs) as a Chrome trace JSON file.
+
+    Open the file in chrome://tracing or https://ui.perfetto.dev. Each run is a
+    separate process lane with one track per thread.
+
+    Returns:
+        int: Number of runs written
+    """
+    runs = recent_runs() if runs is None else runs
+    events = []
+    for pid, trace in enumerate(runs, 1):
+        events.extend(trace.to_chrome_events(pid))
+
+    directory = os.path.dirname(filepath)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(filepath, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    return len(runs)
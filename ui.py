@@ -2,12 +2,13 @@ import bpy
 import os
 
 try:
-    from . import utils
+    from . import tiling
+    from . import operators
+    from .log import logger
 except ImportError:
-    import utils
-
-# Module-level variable to track scheduled auto-loads
-_auto_load_scheduled = set()
+    import tiling
+    import operators
+    from log import logger
 
 
 class PBRGeneratorPanel(bpy.types.Panel):
@@ -24,8 +25,7 @@ class PBRGeneratorPanel(bpy.types.Panel):
             props = context.scene.genpbr_props
         except Exception as e:
             layout.label(text=f"Error: Properties not initialized: {e}", icon='ERROR')
-            import traceback
-            traceback.print_exc()
+            logger.exception("Properties not initialized")
             return
 
         # Check if object is selected
@@ -34,40 +34,7 @@ class PBRGeneratorPanel(bpy.types.Panel):
             box = layout.box()
             box.label(text="Please select an object first", icon='ERROR')
             box.label(text="Select an object to auto-load texture from material", icon='INFO')
-        else:
-            # Auto-load base texture from material if not already set
-            # Use timer to defer property update (can't modify properties in draw())
-            if not props.base_texture_path and obj.active_material:
-                # Check if we've already scheduled an auto-load for this object/material combo
-                obj_id = f"{obj.name}_{obj.active_material.name if obj.active_material else 'none'}"
-
-                if obj_id not in _auto_load_scheduled:
-                    # Get texture path now (safe to do in draw)
-                    texture_path = utils.get_base_texture_from_material(obj)
-
-                    if texture_path and os.path.isfile(texture_path):
-                        # Store scene name for safe access in timer
-                        scene_name = context.scene.name
-
-                        def update_texture_path():
-                            try:
-                                # Access scene by name to avoid context issues
-                                scene = bpy.data.scenes.get(scene_name)
-                                if scene and hasattr(scene, 'genpbr_props'):
-                                    scene_props = scene.genpbr_props
-                                    # Only set if still empty (user might have set it manually)
-                                    if not scene_props.base_texture_path:
-                                        scene_props.base_texture_path = texture_path
-                            except Exception as e:
-                                print(f"[GenPBR] Error in auto-load timer: {e}")
-                            finally:
-                                # Remove from scheduled set
-                                _auto_load_scheduled.discard(obj_id)
-                            return None  # Timer only runs once
-
-                        # Schedule the update for next frame
-                        _auto_load_scheduled.add(obj_id)
-                        bpy.app.timers.register(update_texture_path, first_interval=0.01)
+        # The base texture is auto-detected in the background (see autoload)
 
         # File Selection Section
         try:
@@ -139,6 +106,18 @@ class PBRGeneratorPanel(bpy.types.Panel):
                 col.prop(props, "ao_intensity", slider=True)
                 col.prop(props, "ao_radius", slider=True)
 
+            # Full-resolution tiling (needs PIL and NumPy)
+            row = box.row()
+            row.enabled = tiling.HAS_TILING
+            row.prop(props, "tiled_generation")
+            box.prop(props, "skip_unchanged_maps")
+
+            # Packed or external map files
+            col = box.column(align=True)
+            col.row().prop(props, "map_storage", expand=True)
+            if props.map_storage == 'EXTERNAL':
+                col.prop(props, "map_directory", text="")
+
             # Separator
             layout.separator()
 
@@ -146,8 +125,15 @@ class PBRGeneratorPanel(bpy.types.Panel):
             col = layout.column()
             col.scale_y = 1.5
 
+            # Show progress and a cancel button while a background generation runs
+            if props.is_generating:
+                col.label(text=props.generation_status or "Generating...", icon='TIME')
+                row = col.row()
+                row.enabled = False
+                row.prop(props, "generation_progress", text="Progress", slider=True)
+                col.operator("pbr.cancel_generation", text="Cancel", icon='CANCEL')
             # Disable button if no object, no material, or no file is selected
-            if not obj:
+            elif not obj:
                 col.enabled = False
                 col.operator("pbr.generate_maps", text="Select an Object First", icon='ERROR')
             elif not obj.active_material:
@@ -159,6 +145,30 @@ class PBRGeneratorPanel(bpy.types.Panel):
             else:
                 col.operator("pbr.generate_maps", text="Generate PBR Maps", icon='PLAY')
 
+            # Batch generation over all selected objects and material slots
+            if not props.is_generating:
+                row = layout.row()
+                row.enabled = bool(context.selected_objects)
+                row.operator("pbr.batch_generate_maps", text="Batch Generate Selected", icon='SEQUENCE')
+
+                # A batch cut short by a crash, restart or cancel can pick up where it stopped
+                interrupted = operators.interrupted_batch(context)
+                if interrupted is not None:
+                    box = layout.box()
+                    box.label(text=f"Interrupted batch: {interrupted['to_generate']} to generate, "
+                                   f"{interrupted['to_apply']} to apply", icon='RECOVER_LAST')
+                    row = box.row(align=True)
+                    row.operator("pbr.resume_batch", text="Resume", icon='PLAY')
+                    row.operator("pbr.discard_batch", text="Discard", icon='TRASH')
+            if props.last_batch_summary:
+                layout.label(text=f"Last batch: {props.last_batch_summary}", icon='INFO')
+            if props.last_retry_count > 0 and not props.is_generating:
+                layout.label(text=f"Last run needed {props.last_retry_count} automatic retries", icon='FILE_REFRESH')
+            if props.last_timing_summary and not props.is_generating:
+                row = layout.row()
+                row.label(text=f"Last run: {props.last_timing_summary}", icon='SORTTIME')
+                row.operator("pbr.export_trace", text="", icon='EXPORT')
+
             # Error Display Section
             if props.last_error_code > 0 or props.last_error_type:
                 layout.separator()
@@ -274,6 +284,5 @@ class PBRGeneratorPanel(bpy.types.Panel):
             info_box.label(text="Location: Edit > Preferences > Add-ons", icon='PREFERENCES')
         except Exception as e:
             layout.label(text=f"Error drawing UI: {e}", icon='ERROR')
-            import traceback
-            traceback.print_exc()
+            logger.exception("Error drawing UI")
 
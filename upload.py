@@ -0,0 +1,134 @@
+import base64
+import hashlib
+import json
+import os
+import time
+
+
+# Read size for streaming; a multiple of 3 so each chunk base64-encodes without padding
+CHUNK_SIZE = 3 * 64 * 1024
+
+
+def source_size(source):
+    """Size in bytes of an upload source (a file path or a bytes-like object)."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return len(source)
+    return os.path.getsize(source)
+
+
+def iter_source(source, chunk_size=CHUNK_SIZE):
+    """Yield an upload source in chunks without loading a file into memory."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        view = memoryview(source)
+        for offset in range(0, len(view), chunk_size):
+            yield view[offset:offset + chunk_size]
+        return
+
+    with open(source, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def hash_source(source):
+    """SHA-256 hex digest of an upload source, computed incrementally."""
+    digest = hashlib.sha256()
+    for chunk in iter_source(source):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def iter_base64(source, chunk_size=CHUNK_SIZE):
+    """Incrementally base64-encode an upload source, yielding ASCII bytes."""
+    remainder = b""
+    for chunk in iter_source(source, chunk_size):
+        data = remainder + bytes(chunk)
+        cut = len(data) - len(data) % 3
+        if cut:
+            yield base64.b64encode(data[:cut])
+        remainder = data[cut:]
+    if remainder:
+        yield base64.b64encode(remainder)
+
+
+class StreamingJSONBody:
+    """
+    File-like JSON request body that embeds an image as a base64 data URL.
+
+    Produces {"baseImage": "data:<mime>;base64,<...>", <fields>} while reading
+    and encoding the image in CHUNK_SIZE pieces, so the full base64 string is
+    never built in memory. The exact length is known up front, so requests sends
+    a Content-Length header instead of using chunked transfer encoding.
+
+    A body can only be consumed once; build a new one for every attempt.
+
+    If given, trace (timing.RunTrace) receives a "base64 encode" span per chunk and
+    on_progress(sent_bytes, total_bytes) is called as the body is consumed.
+    completed_at is the perf_counter() time the last byte was handed out.
+    """
+
+    def __init__(self, source, mime_type, fields, image_field="baseImage", trace=None, on_progress=None):
+        self._source = source
+        self._trace = trace
+        self._on_progress = on_progress
+        self.sent = 0
+        self.completed_at = None
+        self._prefix = ("{" + json.dumps(image_field) + ":\"data:" + mime_type + ";base64,").encode("ascii")
+        fields_json = json.dumps(fields, separators=(",", ":")) if fields else "{}"
+        self._suffix = ("\"" + ("," + fields_json[1:] if fields else "}")).encode("utf-8")
+
+        size = source_size(source)
+        self._length = len(self._prefix) + 4 * ((size + 2) // 3) + len(self._suffix)
+        self._chunks = None
+        self._buffer = b""
+        self._offset = 0
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        yield self._sent(self._prefix)
+        encoded = iter_base64(self._source)
+        while True:
+            t0 = time.perf_counter()
+            try:
+                chunk = next(encoded)
+            except StopIteration:
+                break
+            if self._trace is not None:
+                self._trace.add_span("base64 encode", t0, time.perf_counter())
+            yield self._sent(chunk)
+        yield self._sent(self._suffix)
+        self.completed_at = time.perf_counter()
+
+    def _sent(self, chunk):
+        self.sent += len(chunk)
+        if self._on_progress is not None:
+            self._on_progress(self.sent, self._length)
+        return chunk
+
+    def read(self, size=-1):
+        if self._chunks is None:
+            self._chunks = iter(self)
+
+        if size is None or size < 0:
+            data = self._buffer[self._offset:] + b"".join(self._chunks)
+            self._buffer = b""
+            self._offset = 0
+            return data
+
+        parts = []
+        while size > 0:
+            if self._offset >= len(self._buffer):
+                try:
+                    self._buffer = next(self._chunks)
+                except StopIteration:
+                    break
+                self._offset = 0
+            piece = self._buffer[self._offset:self._offset + size]
+            self._offset += len(piece)
+            size -= len(piece)
+            parts.append(piece)
+        return b"".join(parts)
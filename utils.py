@@ -1,7 +1,23 @@
 import os
+import struct
 import tempfile
+import threading
+import zlib
 from io import BytesIO
-import bpy
+
+# bpy is only missing when the pipeline runs outside Blender (see cli)
+try:
+    import bpy
+    HAS_BPY = True
+except ImportError:
+    HAS_BPY = False
+
+try:
+    from . import nodegraph
+    from .log import logger
+except ImportError:
+    import nodegraph
+    from log import logger
 
 # Try to import PIL for faster image processing
 try:
@@ -9,7 +25,28 @@ try:
     HAS_PIL = True
 except ImportError:
     HAS_PIL = False
-    print("[GenPBR] PIL not available, using Blender for image compression (slower)")
+    logger.info("PIL not available, using Blender for image compression (slower)")
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+# Longest edge of an image that is downscaled for upload
+MAX_UPLOAD_DIMENSION = 2048
+# The API's upload size limit, used when no budget is given
+DEFAULT_UPLOAD_BUDGET = 5 * 1024 * 1024
+# Formats that are usually stored uncompressed and are re-encoded even under the budget
+UNCOMPRESSED_EXTENSIONS = ('.bmp', '.tif', '.tiff')
+# JPEG quality range searched by the adaptive encoder
+JPEG_QUALITY_RANGE = (60, 95)
+# Longest edge of the probe image used to estimate the JPEG quality
+PROBE_DIMENSION = 512
+# Smallest longest edge the encoder shrinks to when even the lowest quality is over budget
+MIN_UPLOAD_DIMENSION = 512
+# Lines of the other axis resampled at a time by the NumPy area downsampler
+RESAMPLE_CHUNK = 256
 
 
 def _extract_image_from_node(node):
@@ -52,243 +89,560 @@ def _extract_image_from_node(node):
             image.filepath_raw = original_path
             return temp_path
         except Exception as e:
-            print(f"[GenPBR] Failed to save packed image: {e}")
+            logger.warning("Failed to save packed image: %s", e)
             return None
 
     return None
 
 
-def _find_image_texture_recursive(node, visited=None, max_depth=10, depth=0):
+def get_base_texture_from_material(obj, material=None, graphs=None):
     """
-    Recursively search for an image texture node in the node tree.
+    Extract the base texture (albedo/diffuse) from an object's material.
+
+    Searches upstream of the Base Color input of the Principled BSDF feeding
+    the material output, including inside node groups (see nodegraph).
 
     Args:
-        node: Starting node to search from
-        visited: Set of visited nodes to avoid cycles
-        max_depth: Maximum recursion depth
-        depth: Current recursion depth
+        obj: Blender object with a material
+        material: Material to inspect (default: the object's active material)
+        graphs: Optional dict caching the nodegraph.NodeGraph of each node tree;
+            the caller drops entries when trees change (see lookup)
 
     Returns:
-        str: File path to the image, or None if not found
+        str: File path to the base texture, or None if not found
     """
-    if visited is None:
-        visited = set()
+    mat = material if material is not None else (obj.active_material if obj else None)
+    if not mat:
+        logger.debug("No object or no active material")
+        return None
 
-    if max_depth <= 0 or node in visited:
+    if not mat.use_nodes:
+        logger.debug("Material does not use nodes")
         return None
 
-    visited.add(node)
+    node_tree = mat.node_tree
+    if not node_tree:
+        logger.debug("No node tree")
+        return None
 
-    indent = "  " * depth
-    print(f"{indent}[GenPBR] Checking node: {node.type} - {node.name} (depth {depth})")
+    graph = nodegraph.graph_for(node_tree, graphs)
+    bsdf_node = graph.principled_bsdf()
+    if not bsdf_node:
+        logger.debug("No Principled BSDF node found")
+        return None
 
-    # If this is an image texture node, extract the image
-    if node.type == 'TEX_IMAGE':
-        print(f"{indent}[GenPBR] Found TEX_IMAGE node!")
-        return _extract_image_from_node(node)
+    # Try to find texture connected to Base Color input
+    base_color_input = bsdf_node.inputs.get('Base Color')
+    if not base_color_input:
+        logger.debug("No Base Color input found on BSDF")
+        return None
 
-    # Search through inputs of the node
-    if not hasattr(node, 'inputs'):
+    if not base_color_input.is_linked:
+        logger.debug("Base Color input is not linked")
         return None
 
-    # For mix nodes, prioritize Color1 (usually the base texture)
-    if node.type == 'MIX_RGB':
-        color1_input = node.inputs.get('Color1')
-        if color1_input and color1_input.is_linked:
-            for link in color1_input.links:
-                result = _find_image_texture_recursive(link.from_node, visited, max_depth - 1, depth + 1)
-                if result:
-                    return result
-        # Also check Color2 as fallback
-        color2_input = node.inputs.get('Color2')
-        if color2_input and color2_input.is_linked:
-            for link in color2_input.links:
-                result = _find_image_texture_recursive(link.from_node, visited, max_depth - 1, depth + 1)
-                if result:
-                    return result
-    else:
-        # For other nodes, check all color/vector inputs
-        # Prioritize common color input names
-        priority_inputs = ['Color', 'Image', 'Base Color', 'Albedo', 'Diffuse']
-        for input_name in priority_inputs:
-            input_socket = node.inputs.get(input_name)
-            if input_socket and input_socket.is_linked:
-                for link in input_socket.links:
-                    result = _find_image_texture_recursive(link.from_node, visited, max_depth - 1, depth + 1)
-                    if result:
-                        return result
-
-        # Check all other color/vector inputs
-        for input_socket in node.inputs:
-            if input_socket.name in priority_inputs:
-                continue  # Already checked
-            if (input_socket.type == 'RGBA' or input_socket.type == 'VECTOR') and input_socket.is_linked:
-                for link in input_socket.links:
-                    result = _find_image_texture_recursive(link.from_node, visited, max_depth - 1, depth + 1)
-                    if result:
-                        return result
+    for image_node in nodegraph.find_image_nodes(graph, bsdf_node, base_color_input.identifier, graphs):
+        image_path = _extract_image_from_node(image_node)
+        if image_path:
+            logger.debug("Found image texture: %s", image_path)
+            return image_path
 
+    logger.debug("No image texture found in node tree")
     return None
 
 
-def get_base_texture_from_material(obj):
+def collect_material_textures(materials):
     """
-    Extract the base texture (albedo/diffuse) from an object's active material.
+    Collect the base textures of the given materials.
 
     Args:
-        obj: Blender object with a material
+        materials: Iterable of Blender materials
 
     Returns:
-        str: File path to the base texture, or None if not found
+        dict: Absolute texture path -> list of material names using it (deduplicated by path)
     """
-    if not obj or not obj.active_material:
-        print("[GenPBR] No object or no active material")
-        return None
+    textures = {}
+    for mat in materials:
+        texture_path = get_base_texture_from_material(None, mat)
+        if texture_path and os.path.isfile(texture_path):
+            key = os.path.normcase(os.path.abspath(texture_path))
+            textures.setdefault(key, []).append(mat.name)
+    return textures
 
-    mat = obj.active_material
-    if not mat.use_nodes:
-        print("[GenPBR] Material does not use nodes")
-        return None
 
-    node_tree = mat.node_tree
-    if not node_tree:
-        print("[GenPBR] No node tree")
-        return None
+def prepare_upload_source(filepath, max_size_bytes=DEFAULT_UPLOAD_BUDGET):
+    """
+    Decide what to upload for an image without reading files that need no compression.
 
-    # Find the Principled BSDF node (or similar output node)
-    bsdf_node = None
-    for node in node_tree.nodes:
-        if node.type == 'BSDF_PRINCIPLED':
-            bsdf_node = node
-            break
+    Args:
+        filepath: Path to the image file
+        max_size_bytes: Upload byte budget (default: 5MB)
 
-    if not bsdf_node:
-        print("[GenPBR] No Principled BSDF node found")
-        return None
+    Returns:
+        tuple: (source, mime_type) where source is the file path itself when the file
+        can be uploaded as-is, or the re-encoded image bytes otherwise
+    """
+    if os.path.getsize(filepath) <= max_size_bytes and not _should_reencode(filepath):
+        return filepath, _mime_type_for_path(filepath)
+    return compress_image_if_needed(filepath, max_size_bytes)
 
-    # Try to find texture connected to Base Color input
-    base_color_input = bsdf_node.inputs.get('Base Color')
-    if not base_color_input:
-        print("[GenPBR] No Base Color input found on BSDF")
-        return None
 
-    # Follow the connection to find the image texture
-    if not base_color_input.is_linked:
-        print("[GenPBR] Base Color input is not linked")
-        return None
+def needs_main_thread_encode(filepath, max_size_bytes=DEFAULT_UPLOAD_BUDGET):
+    """
+    Whether preparing the upload re-encodes the image through Blender (no PIL).
+
+    That path creates and removes image datablocks, so it must run on the main
+    thread: callers re-encode such images with compress_image_if_needed before
+    starting a worker and pass the result on (see generation.generate_maps_worker).
+    """
+    if HAS_PIL or not HAS_BPY:
+        return False
+    return os.path.getsize(filepath) > max_size_bytes
 
-    link = base_color_input.links[0]
-    from_node = link.from_node
-    print(f"[GenPBR] Base Color connected to: {from_node.type} - {from_node.name}")
 
-    # Recursively search for image texture node
-    image_path = _find_image_texture_recursive(from_node)
-    if image_path:
-        print(f"[GenPBR] Found image texture: {image_path}")
-        return image_path
-    else:
-        print("[GenPBR] No image texture found in node tree")
-        return None
+def _should_reencode(filepath):
+    """
+    Whether a file under the budget is still worth re-encoding (uncompressed formats).
+
+    Only with PIL: without it, re-encoding goes through Blender on the main
+    thread, which is not worth it for a file that already fits.
+    """
+    if not HAS_PIL:
+        return False
+    return os.path.splitext(filepath)[1].lower() in UNCOMPRESSED_EXTENSIONS
+
+
+def _mime_type_for_path(filepath):
+    file_ext = os.path.splitext(filepath)[1].lower()
+    mime_types = {
+        '.png': 'image/png',
+        '.jpg': 'image/jpeg',
+        '.jpeg': 'image/jpeg',
+        '.bmp': 'image/bmp',
+        '.tiff': 'image/tiff',
+        '.tif': 'image/tiff',
+    }
+    return mime_types.get(file_ext, 'image/png')
+
 
+def _target_size(width, height, max_dimension=MAX_UPLOAD_DIMENSION):
+    """Size that fits within max_dimension while keeping the aspect ratio."""
+    if width <= max_dimension and height <= max_dimension:
+        return width, height
+    scale = max_dimension / max(width, height)
+    return max(1, int(width * scale)), max(1, int(height * scale))
 
-def compress_image_if_needed(filepath, max_size_bytes=5 * 1024 * 1024):
+
+def _open_downscaled(filepath, target_size):
     """
-    Compress an image if it exceeds the maximum size.
+    Open an image with PIL, decoding no more pixels than needed for target_size.
+
+    JPEGs are decoded at 1/2, 1/4 or 1/8 scale by the DCT (draft mode). TIFFs use
+    the smallest reduced-resolution page that is still large enough, and
+    uncompressed striped TIFFs are decoded strip by strip and reduced on the fly.
+    Other formats are decoded at full size.
 
     Args:
         filepath: Path to the image file
-        max_size_bytes: Maximum file size in bytes (default: 5MB)
+        target_size: (width, height) the caller is going to resize to
 
     Returns:
-        tuple: (image_data: bytes, mime_type: str)
+        PIL.Image.Image: Image at least as large as target_size (not necessarily loaded)
     """
-    import bpy
+    img = Image.open(filepath)
+    if img.format == 'JPEG':
+        img.draft('RGB', target_size)
+    elif img.format == 'TIFF':
+        _seek_tiff_page(img, target_size)
+        factor = min(img.size[0] // target_size[0], img.size[1] // target_size[1])
+        if factor >= 2:
+            reduced = _reduce_tiff_strips(img, filepath, factor)
+            if reduced is not None:
+                return reduced
+    return img
+
+
+def _seek_tiff_page(img, target_size):
+    """Seek to the smallest page of a TIFF pyramid that still covers target_size."""
+    n_frames = getattr(img, "n_frames", 1)
+    if n_frames < 2:
+        return
+    best_index, best_pixels = 0, img.size[0] * img.size[1]
+    for index in range(1, n_frames):
+        img.seek(index)
+        # NewSubfileType bit 0 marks a reduced-resolution copy of the main image
+        if not img.tag_v2.get(254, 0) & 1:
+            continue
+        width, height = img.size
+        if width >= target_size[0] and height >= target_size[1] and width * height < best_pixels:
+            best_index, best_pixels = index, width * height
+    img.seek(best_index)
 
-    # Read original file
-    with open(filepath, "rb") as img_file:
-        image_data = img_file.read()
 
-    original_size = len(image_data)
+def _reduce_tiff_strips(img, filepath, factor):
+    """
+    Decode an uncompressed striped TIFF one strip at a time, reducing each by factor.
 
-    # If file is small enough, return as-is
-    if original_size <= max_size_bytes:
-        file_ext = os.path.splitext(filepath)[1].lower()
-        mime_types = {
-            '.png': 'image/png',
-            '.jpg': 'image/jpeg',
-            '.jpeg': 'image/jpeg',
-            '.bmp': 'image/bmp',
-            '.tiff': 'image/tiff',
-            '.tif': 'image/tiff',
-        }
-        mime_type = mime_types.get(file_ext, 'image/png')
-        return image_data, mime_type
-
-    # File is too large, compress it
-    print(f"[GenPBR Debug] Image too large ({original_size / 1024 / 1024:.2f}MB), compressing...")
+    Peak memory is a few strips plus the reduced output instead of the full image.
 
-    if HAS_PIL:
-        # Fast compression using PIL
-        img = Image.open(filepath)
+    Returns:
+        PIL.Image.Image: The reduced image, or None if the layout is not supported
+    """
+    width, height = img.size
+    byte_counts = img.tag_v2.get(279)
+    tiles = img.tile
+    if (img.mode not in ('L', 'LA', 'RGB', 'RGBA') or len(tiles) < 2
+            or not byte_counts or len(byte_counts) != len(tiles)):
+        return None
+    expected_y = 0
+    for tile in tiles:
+        codec, (x0, y0, x1, y1), _offset, args = tile
+        if codec != "raw" or x0 != 0 or x1 != width or y0 != expected_y or args[1:] != (0, 1):
+            return None
+        expected_y = y1
+    if expected_y != height:
+        return None
 
-        # Calculate new dimensions (maintain aspect ratio, max 2048x2048)
-        width, height = img.size
-        max_dimension = 2048
-
-        if width > max_dimension or height > max_dimension:
-            scale = max_dimension / max(width, height)
-            new_width = int(width * scale)
-            new_height = int(height * scale)
-            img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            print(f"[GenPBR Debug] Resized from {width}x{height} to {new_width}x{new_height}")
-
-        # Convert to RGB if necessary
-        if img.mode in ('RGBA', 'LA', 'P'):
-            background = Image.new('RGB', img.size, (255, 255, 255))
-            if img.mode == 'P':
-                img = img.convert('RGBA')
-            background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
-            img = background
-        elif img.mode != 'RGB':
-            img = img.convert('RGB')
-
-        # Save to bytes (JPEG is faster and smaller)
-        output = BytesIO()
-        img.save(output, format='JPEG', quality=90, optimize=True)
-        image_data = output.getvalue()
-        output.close()
+    output = Image.new(img.mode, ((width + factor - 1) // factor, (height + factor - 1) // factor))
+    output_y = 0
+    pending = None
+
+    def flush(band):
+        nonlocal output_y
+        reduced = band.reduce(factor)
+        output.paste(reduced, (0, output_y))
+        output_y += reduced.height
+
+    with open(filepath, "rb") as f:
+        for (_codec, (_x0, y0, _x1, y1), offset, args), byte_count in zip(tiles, byte_counts):
+            f.seek(offset)
+            strip = Image.frombytes(img.mode, (width, y1 - y0), f.read(byte_count), "raw", *args)
+            if pending is not None:
+                combined = Image.new(img.mode, (width, pending.height + strip.height))
+                combined.paste(pending, (0, 0))
+                combined.paste(strip, (0, pending.height))
+                strip = combined
+            # Reduce whole blocks of `factor` rows, keep the rest for the next strip
+            rows = strip.height - strip.height % factor
+            if rows:
+                flush(strip.crop((0, 0, width, rows)))
+            pending = strip.crop((0, rows, width, strip.height)) if rows < strip.height else None
+    if pending is not None:
+        flush(pending)
+
+    logger.debug("Decoded %d TIFF strips reduced by %d", len(tiles), factor)
+    return output
+
+
+def _area_resample_axis(pixels, new_length, axis):
+    """
+    Resample one axis by exact pixel-area averaging.
 
-        mime_type = 'image/jpeg'
+    Every output pixel is the mean of its footprint in the input, with the
+    input pixels it covers partially weighted by their coverage (prefix sums
+    evaluated at the fractional edges). Whole factors average blocks of a
+    reshaped view instead. The other axis is processed RESAMPLE_CHUNK lines at
+    a time to bound the memory of the prefix sums.
+    """
+    length = pixels.shape[axis]
+    if length == new_length:
+        return pixels
+    if length % new_length == 0:
+        blocks = pixels.shape[:axis] + (new_length, length // new_length) + pixels.shape[axis + 1:]
+        return pixels.reshape(blocks).mean(axis=axis + 1, dtype=np.float32)
+
+    pixels = np.moveaxis(pixels, axis, 0)
+    edges = np.linspace(0.0, length, new_length + 1)
+    lower = np.minimum(edges.astype(np.intp), length - 1)
+    shape = (-1,) + (1,) * (pixels.ndim - 1)
+    frac = (edges - lower).reshape(shape)
+    widths = np.diff(edges).reshape(shape)
+    result = np.empty((new_length,) + pixels.shape[1:], dtype=np.float32)
+    for start in range(0, pixels.shape[1], RESAMPLE_CHUNK):
+        chunk = pixels[:, start:start + RESAMPLE_CHUNK]
+        sums = np.zeros((length + 1,) + chunk.shape[1:], dtype=np.float64)
+        np.cumsum(chunk, axis=0, out=sums[1:])
+        at_edges = sums[lower] + frac * (sums[lower + 1] - sums[lower])
+        result[:, start:start + RESAMPLE_CHUNK] = np.diff(at_edges, axis=0) / widths
+    return np.moveaxis(result, 0, axis)
+
+
+def _area_downsample(pixels, new_width, new_height):
+    """Downsample an (height, width, channels) float array by exact area averaging, rows first."""
+    pixels = _area_resample_axis(pixels, new_height, 0)
+    return _area_resample_axis(pixels, new_width, 1)
+
+
+def _encode_png_rgb(rgb):
+    """Encode an (height, width, 3) uint8 array as PNG, using the 'Up' row filter."""
+    height, width = rgb.shape[:2]
+    rows = rgb.reshape(height, width * 3)
+    filtered = np.empty((height, width * 3 + 1), dtype=np.uint8)
+    filtered[:, 0] = 2
+    filtered[0, 0] = 0
+    filtered[0, 1:] = rows[0]
+    np.subtract(rows[1:], rows[:-1], out=filtered[1:, 1:])
+
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header)
+            + chunk(b"IDAT", zlib.compress(filtered.tobytes(), 6)) + chunk(b"IEND", b""))
+
+
+def _compress_with_blender_numpy(filepath, max_size_bytes=DEFAULT_UPLOAD_BUDGET):
+    """
+    Downscale and re-encode an image using Blender's loader and NumPy (main thread only).
 
+    The pixels are copied once into a preallocated float32 array with
+    foreach_get, area-downsampled, composited onto white (like the PIL path)
+    and encoded to PNG in memory. Nothing is written to disk, so concurrent
+    calls do not interfere. A PNG over max_size_bytes is downscaled further.
+
+    Returns:
+        bytes: PNG data
+    """
+    img = bpy.data.images.load(filepath, check_existing=False)
+    try:
+        width, height = img.size
+        channels = img.channels
+        is_float = img.is_float
+        pixels = np.empty(width * height * channels, dtype=np.float32)
+        img.pixels.foreach_get(pixels)
+    finally:
+        bpy.data.images.remove(img)
+
+    # Blender stores rows bottom to top
+    pixels = pixels.reshape(height, width, channels)[::-1]
+
+    new_width, new_height = _target_size(width, height)
+    if (new_width, new_height) != (width, height):
+        pixels = _area_downsample(pixels, new_width, new_height)
+        logger.debug("Resized from %dx%d to %dx%d", width, height, new_width, new_height)
+
+    if channels >= 3:
+        rgb = pixels[..., :3]
     else:
-        # Fallback to Blender (slower)
-        temp_img = bpy.data.images.load(filepath)
+        rgb = np.repeat(pixels[..., :1], 3, axis=2)
+    if is_float:
+        # Float buffers are scene-linear; encode to sRGB like saving a PNG would
+        rgb = np.clip(rgb, 0.0, 1.0)
+        rgb = np.where(rgb <= 0.0031308, rgb * 12.92, 1.055 * np.power(rgb, 1 / 2.4) - 0.055)
+    if channels in (2, 4):
+        alpha = pixels[..., -1:]
+        rgb = rgb * alpha + (1.0 - alpha)
+
+    rgb = np.clip(rgb, 0.0, 1.0)
+    data = _encode_png_rgb((rgb * 255.0 + 0.5).astype(np.uint8))
+    while len(data) > max_size_bytes:
+        new_size = _shrink_to_fit((rgb.shape[1], rgb.shape[0]), len(data), max_size_bytes)
+        if new_size is None:
+            break
+        rgb = _area_downsample(rgb, *new_size)
+        data = _encode_png_rgb((rgb * 255.0 + 0.5).astype(np.uint8))
+    return data
 
-        width, height = temp_img.size
-        max_dimension = 2048
 
-        if width > max_dimension or height > max_dimension:
-            scale = max_dimension / max(width, height)
-            new_width = int(width * scale)
-            new_height = int(height * scale)
-            temp_img.scale(new_width, new_height)
+def _compress_with_blender_file(filepath):
+    """Downscale with Image.scale and save a PNG through a temp file (used without NumPy; main thread only)."""
+    temp_img = bpy.data.images.load(filepath, check_existing=False)
+    fd, temp_path = tempfile.mkstemp(prefix="genpbr_", suffix=".png")
+    os.close(fd)
+    try:
+        width, height = temp_img.size
+        new_size = _target_size(width, height)
+        if new_size != (width, height):
+            temp_img.scale(*new_size)
 
-        temp_path = os.path.join(tempfile.gettempdir(), "genpbr_temp_compressed.png")
         temp_img.filepath_raw = temp_path
         temp_img.file_format = 'PNG'
         temp_img.save()
 
         with open(temp_path, "rb") as f:
-            image_data = f.read()
-
+            return f.read()
+    finally:
         bpy.data.images.remove(temp_img)
         try:
             os.remove(temp_path)
-        except:
+        except OSError:
             pass
 
+
+def _jpeg_bytes(img, quality, optimize=False):
+    output = BytesIO()
+    img.save(output, format='JPEG', quality=quality, optimize=optimize)
+    return output.getvalue()
+
+
+def _shrink_to_fit(size, encoded_bytes, budget_bytes):
+    """Smaller (width, height) expected to bring encoded_bytes under budget_bytes, or None."""
+    width, height = size
+    if max(width, height) <= MIN_UPLOAD_DIMENSION:
+        return None
+    # Encoded size scales roughly with the pixel count; aim a little below the budget
+    scale = max(0.5, min(0.95, (budget_bytes / encoded_bytes) ** 0.5 * 0.95))
+    longest = max(MIN_UPLOAD_DIMENSION, int(max(width, height) * scale))
+    return _target_size(width, height, longest)
+
+
+def encode_jpeg_to_budget(img, budget_bytes):
+    """
+    Encode an RGB image as JPEG at the highest quality that fits budget_bytes.
+
+    The quality is estimated by a binary search on a small probe image (size
+    scaled by the pixel ratio) and then refined with at most three full-size
+    encodes, plus a final one with the slower optimized Huffman tables, which
+    never make the file larger. If even the lowest quality is over budget
+    the image is downscaled and the search repeats.
+
+    Args:
+        img: PIL image in RGB mode
+        budget_bytes: Maximum encoded size in bytes
+
+    Returns:
+        tuple: (JPEG bytes, quality used)
+    """
+    low, high = JPEG_QUALITY_RANGE
+
+    while True:
+        probe = img.resize(_target_size(*img.size, PROBE_DIMENSION), Image.Resampling.BILINEAR, reducing_gap=2.0)
+        pixel_ratio = (img.size[0] * img.size[1]) / (probe.size[0] * probe.size[1])
+
+        estimate = low
+        lo, hi = low, high
+        while lo <= hi:
+            mid = (lo + hi) // 2
+            if len(_jpeg_bytes(probe, mid)) * pixel_ratio <= budget_bytes:
+                estimate, lo = mid, mid + 1
+            else:
+                hi = mid - 1
+
+        # Refine on the full image: search up from a fitting estimate, down otherwise
+        best = None
+        lo, hi = low, high
+        quality = estimate
+        for _ in range(3):
+            size = len(_jpeg_bytes(img, quality))
+            if size <= budget_bytes:
+                best, lo = quality, quality + 1
+            else:
+                hi = quality - 1
+                encoded_bytes = size
+            if lo > hi:
+                break
+            # Without a fitting quality yet, check the lowest one before shrinking
+            quality = (lo + hi + 1) // 2 if best is not None else lo
+
+        if best is not None:
+            data = _jpeg_bytes(img, best, optimize=True)
+            logger.debug("JPEG quality %d at %dx%d: %d bytes (budget %d)",
+                         best, img.size[0], img.size[1], len(data), budget_bytes)
+            return data, best
+
+        new_size = _shrink_to_fit(img.size, encoded_bytes, budget_bytes)
+        if new_size is None:
+            logger.warning("Could not fit the image into %.1fMB; uploading at the lowest quality",
+                           budget_bytes / 1024 / 1024)
+            return _jpeg_bytes(img, low, optimize=True), low
+        logger.debug("Over budget at quality %d, shrinking to %dx%d", low, *new_size)
+        img = img.resize(new_size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+
+
+def load_rgb_image(filepath, max_dimension=MAX_UPLOAD_DIMENSION):
+    """
+    Open an image with PIL as RGB, flattened onto white.
+
+    Args:
+        filepath: Path to the image file
+        max_dimension: Longest edge to downscale to, or None to keep the full resolution
+
+    Returns:
+        PIL.Image.Image: Decoded RGB image
+    """
+    with Image.open(filepath) as probe:
+        width, height = probe.size
+
+    # Calculate new dimensions (maintain aspect ratio, max 2048x2048)
+    new_size = _target_size(width, height, max_dimension) if max_dimension else (width, height)
+    if new_size != (width, height):
+        # Decode at reduced size where the format allows it, then reduce by an
+        # integer factor and only resample the remaining difference with LANCZOS
+        img = _open_downscaled(filepath, new_size)
+        if img.size != new_size:
+            img = img.resize(new_size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+        logger.debug("Resized from %dx%d to %dx%d", width, height, *new_size)
+    else:
+        img = Image.open(filepath)
+
+    # Convert to RGB if necessary
+    if img.mode in ('RGBA', 'LA', 'P'):
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
+        img = background
+    elif img.mode != 'RGB':
+        img = img.convert('RGB')
+    # Decode now: a lazily loaded image is not safe to crop from several threads
+    img.load()
+    return img
+
+
+def compress_image_if_needed(filepath, max_size_bytes=DEFAULT_UPLOAD_BUDGET):
+    """
+    Compress an image if it exceeds the upload budget or is stored uncompressed.
+
+    With PIL the image is encoded as JPEG at the highest quality that fits the
+    budget (see encode_jpeg_to_budget); without PIL it is encoded as PNG through
+    Blender, which creates image datablocks and is only allowed on the main
+    thread (see needs_main_thread_encode). An uncompressed file under the budget
+    keeps its original bytes if re-encoding does not make it smaller.
+
+    Args:
+        filepath: Path to the image file
+        max_size_bytes: Upload byte budget (default: 5MB)
+
+    Returns:
+        tuple: (image_data: bytes, mime_type: str)
+    """
+    original_size = os.path.getsize(filepath)
+    fits = original_size <= max_size_bytes
+
+    # If file is small enough, return as-is
+    if fits and not _should_reencode(filepath):
+        with open(filepath, "rb") as img_file:
+            return img_file.read(), _mime_type_for_path(filepath)
+
+    if fits:
+        logger.info("Re-encoding uncompressed image (%.2fMB)", original_size / 1024 / 1024)
+    else:
+        logger.info("Image too large (%.2fMB), compressing...", original_size / 1024 / 1024)
+
+    if HAS_PIL:
+        # Fast compression using PIL (JPEG is faster and smaller)
+        image_data, _quality = encode_jpeg_to_budget(load_rgb_image(filepath), max_size_bytes)
+        mime_type = 'image/jpeg'
+
+    elif not HAS_BPY:
+        raise RuntimeError("Pillow is required to compress images outside Blender")
+
+    elif threading.current_thread() is not threading.main_thread():
+        raise RuntimeError("Re-encoding images without Pillow uses Blender and must run on the main thread")
+
+    elif HAS_NUMPY:
+        # Fallback to Blender: pixels are read into NumPy and encoded in memory
+        image_data = _compress_with_blender_numpy(filepath, max_size_bytes)
         mime_type = 'image/png'
 
-    print(f"[GenPBR Debug] Compressed size: {len(image_data) / 1024 / 1024:.2f}MB")
+    else:
+        image_data = _compress_with_blender_file(filepath)
+        mime_type = 'image/png'
+
+    if fits and len(image_data) >= original_size:
+        with open(filepath, "rb") as img_file:
+            return img_file.read(), _mime_type_for_path(filepath)
+
+    logger.info("Compressed size: %.2fMB", len(image_data) / 1024 / 1024)
     return image_data, mime_type
 